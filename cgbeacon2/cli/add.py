@@ -5,12 +5,14 @@ import click
 import datetime
 from flask.cli import with_appcontext, current_app
 
-from cgbeacon2.constants import CONSENT_CODES
+from cgbeacon2.constants import CONSENT_CODES, BULK_WRITE_BATCH_SIZE
 from cgbeacon2.resources import test_snv_vcf_path, test_sv_vcf_path
-from cgbeacon2.utils.add import add_dataset, add_variants
+from cgbeacon2.utils.add import add_dataset, add_variants, add_variants_parallel
+from cgbeacon2.utils.index import create_indexes
 from cgbeacon2.utils.parse import (
     extract_variants,
     count_variants,
+    vcf_indexed,
     merge_intervals,
     get_vcf_samples,
 )
@@ -39,6 +41,9 @@ def demo(ctx):
     for collection in collections:
         current_app.db.drop_collection(collection)
 
+    # Create indexes used by queries on the demo database
+    create_indexes(current_app.db)
+
     # Creating public dataset
     ds_id = "test_public"
     ds_name = "Test public dataset"
@@ -166,8 +171,23 @@ def dataset(id, name, build, authlevel, desc, version, url, cc, update):
     required=False,
     help="one or more bed files containing genomic intervals",
 )
+@click.option(
+    "-batch_size",
+    type=click.IntRange(min=0),
+    default=BULK_WRITE_BATCH_SIZE,
+    show_default=True,
+    help="number of variants saved with each bulk database write (0: save one variant at a time)",
+)
+@click.option(
+    "-workers",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="number of processes parsing and saving variants, one contig at a time (requires an indexed VCF, no panels)",
+)
 @with_appcontext
-def variants(ds, vcf, sample, panel):
+def variants(ds, vcf, sample, panel, batch_size, workers):
     """Add variants from a VCF file to a dataset"""
     # make sure dataset id corresponds to a dataset in the database
 
@@ -186,34 +206,69 @@ def variants(ds, vcf, sample, panel):
         raise click.Abort()
     custom_samples = set(sample)  # set of samples provided by users
 
+    if workers > 1:
+        # Parse and save variants of each contig in a separate process
+        if len(panel) > 0:
+            click.echo("Variants filtered by panels can't be loaded using multiple workers")
+            raise click.Abort()
+        if vcf_indexed(vcf) is False:
+            click.echo("Loading variants with multiple workers requires a VCF file with a tabix or CSI index")
+            raise click.Abort()
+
+        added, parsed = add_variants_parallel(
+            db_uri=current_app.config["DB_URI"],
+            db_name=current_app.config["DB_NAME"],
+            vcf_file=vcf,
+            samples=custom_samples,
+            assembly=dataset["assembly_id"],
+            dataset_id=ds,
+            workers=workers,
+            batch_size=batch_size,
+        )
+    else:
+        added, parsed = _add_variants_single_process(
+            vcf, custom_samples, panel, dataset["assembly_id"], ds, batch_size
+        )
+
+    if parsed == 0:
+        click.echo(f"Provided VCF file doesn't contain any variant")
+        raise click.Abort()
+
+    click.echo(f"{added} variants loaded into the database")
+
+    if added > 0:
+        # Update dataset object accordingly
+        update_dataset(database=current_app.db, dataset_id=ds, samples=custom_samples, add=True)
+
+
+def _add_variants_single_process(vcf, samples, panel, assembly, dataset_id, batch_size):
+    """Parse a VCF file, optionally filtered by panels, and save its variants
+
+    Returns:
+        added, parsed(tuple): (int,int) number of variants saved and number of VCF records parsed
+    """
     filter_intervals = None
     if len(panel) > 0:
         # create BedTool panel with genomic intervals to filter VCF with
         filter_intervals = merge_intervals(list(panel))
 
-    vcf_obj = extract_variants(vcf_file=vcf, samples=custom_samples, filter=filter_intervals)
+    vcf_obj = extract_variants(vcf_file=vcf, samples=samples, filter=filter_intervals)
 
     if vcf_obj is None:
         raise click.Abort()
 
-    nr_variants = count_variants(vcf_obj)
-    if nr_variants == 0:
-        click.echo(f"Provided VCF file doesn't contain any variant")
-        raise click.Abort()
-
-    vcf_obj = extract_variants(vcf_file=vcf, samples=custom_samples, filter=filter_intervals)
+    # Number of variants is read from VCF index, if available. Not valid if VCF is filtered by panels
+    nr_variants = None
+    if filter_intervals is None:
+        nr_variants = count_variants(vcf)
 
     # ADD variants
-    added = add_variants(
+    return add_variants(
         database=current_app.db,
         vcf_obj=vcf_obj,
-        samples=custom_samples,
-        assembly=dataset["assembly_id"],
-        dataset_id=ds,
+        samples=samples,
+        assembly=assembly,
+        dataset_id=dataset_id,
         nr_variants=nr_variants,
+        batch_size=batch_size,
     )
-    click.echo(f"{added} variants loaded into the database")
-
-    if added > 0:
-        # Update dataset object accordingly
-        update_dataset(database=current_app.db, dataset_id=ds, samples=custom_samples, add=True)
@@ -2,8 +2,10 @@
 # -*- coding: utf-8 -*-
 import click
 from flask.cli import with_appcontext, current_app
+from progress.bar import Bar
 
-from cgbeacon2.utils.delete import delete_dataset, delete_variants
+from cgbeacon2.constants import BULK_WRITE_BATCH_SIZE
+from cgbeacon2.utils.delete import delete_dataset, delete_dataset_variants, delete_variants
 from cgbeacon2.utils.update import update_dataset, update_event
 
 
@@ -16,12 +18,33 @@ def delete():
 @delete.command()
 @with_appcontext
 @click.option("-id", type=click.STRING, nargs=1, required=True, help="dataset ID")
-def dataset(id):
-    """Delete a dataset using its _id key"""
+@click.option(
+    "-batch_size",
+    type=click.IntRange(min=0),
+    default=BULK_WRITE_BATCH_SIZE,
+    show_default=True,
+    help="number of variants removed with each database operation (0: remove all variants at once)",
+)
+def dataset(id, batch_size):
+    """Delete a dataset using its _id key, together with its variants"""
 
     click.echo(f"deleting dataset with id '{id}' from database")
 
-    deleted = delete_dataset(database=current_app.db, id=id)
+    # Remove dataset variants first with a progress bar, so an interrupted deletion can be resumed
+    # by running the command again
+    n_variants = current_app.db["variant"].count_documents({"dataset_list": id})
+    if n_variants > 0:
+        with Bar("Removing variants", max=n_variants) as bar:
+            updated, removed = delete_dataset_variants(
+                current_app.db,
+                id,
+                batch_size,
+                progress=lambda processed, modified: bar.goto(min(processed, n_variants)),
+            )
+        click.echo(f"Number of variants updated:{updated}, removed:{removed}")
+        update_event(current_app.db, id, "variant", False)
+
+    deleted = delete_dataset(database=current_app.db, id=id, batch_size=batch_size)
 
     if deleted is None:
         click.echo("Aborting")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import click
+from flask.cli import with_appcontext, current_app
+
+from cgbeacon2.constants import INDEXES
+from cgbeacon2.utils.index import create_indexes, drop_indexes, missing_indexes
+from cgbeacon2.utils.update import missing_dataset_list, update_variants_dataset_list
+
+COLLECTION_OPTION = click.option(
+    "-collection",
+    type=click.Choice(list(INDEXES.keys())),
+    multiple=True,
+    required=False,
+    help="one or more collections to handle indexes for (default: all)",
+)
+
+
+@click.group()
+def index():
+    """Manage database indexes using the CLI"""
+    pass
+
+
+@index.command()
+@with_appcontext
+@COLLECTION_OPTION
+def create(collection):
+    """Create the indexes used by beacon queries and database updates.
+    Variants saved without the list of their datasets are updated, so that they can be found using the indexes
+    """
+
+    created = create_indexes(current_app.db, list(collection))
+    for coll, index_names in created.items():
+        click.echo(f"Collection '{coll}' - indexes in place: {', '.join(index_names)}")
+
+    if "variant" in created and missing_dataset_list(current_app.db):
+        n_updated = update_variants_dataset_list(current_app.db)
+        click.echo(f"Saved dataset list of {n_updated} variants")
+
+
+@index.command()
+@with_appcontext
+@COLLECTION_OPTION
+def drop(collection):
+    """Drop the indexes created by the create command"""
+
+    click.confirm("Dropping database indexes. Do you want to continue?", abort=True)
+
+    dropped = drop_indexes(current_app.db, list(collection))
+    for coll, index_names in dropped.items():
+        click.echo(f"Collection '{coll}' - dropped indexes: {', '.join(index_names) or '-'}")
+
+
+@index.command()
+@with_appcontext
+@COLLECTION_OPTION
+def status(collection):
+    """Show the declared indexes that are missing from the database"""
+
+    missing = missing_indexes(current_app.db, list(collection))
+    if not missing:
+        click.echo("All indexes are in place")
+        return
+
+    for coll, index_names in missing.items():
+        click.echo(f"Collection '{coll}' - missing indexes: {', '.join(index_names)}")
+    click.echo("Run 'cgbeacon2 index create' to create them")
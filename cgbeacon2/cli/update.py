@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import click
-from flask.cli import with_appcontext
+from flask.cli import with_appcontext, current_app
+from cgbeacon2.constants import BULK_WRITE_BATCH_SIZE
 from cgbeacon2.utils.ensembl_biomart import EnsemblBiomartClient
-from cgbeacon2.utils.update import update_genes
+from cgbeacon2.utils.update import (
+    update_genes,
+    update_variants_dataset_list,
+    update_dataset_stats,
+)
 
 
 @click.group()
@@ -33,3 +38,48 @@ def genes(build):
 
     n_inserted = update_genes(gene_lines, build)
     click.echo(f"Number of inserted genes for build {build}: {len(n_inserted)}")
+
+
+@update.command()
+@with_appcontext
+@click.option(
+    "-batch_size",
+    type=click.IntRange(min=1),
+    default=BULK_WRITE_BATCH_SIZE,
+    show_default=True,
+    help="number of variants updated with each bulk database write",
+)
+def dataset_list(batch_size):
+    """Save in each variant the list of datasets containing it (required by databases created with previous software versions)"""
+
+    click.echo("Updating the dataset list of database variants")
+    n_updated = update_variants_dataset_list(current_app.db, batch_size)
+    click.echo(f"Number of updated variants: {n_updated}")
+
+
+@update.command()
+@with_appcontext
+@click.option(
+    "-ds",
+    type=click.STRING,
+    multiple=True,
+    required=False,
+    help="one or more dataset ids (default: all datasets)",
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    help="recount variants and allele calls from the variant collection and save them",
+)
+def stats(ds, full):
+    """Show or recompute variant and allele counts of datasets"""
+
+    if full:
+        click.echo("Recounting dataset variants and allele calls")
+        update_dataset_stats(current_app.db, list(ds))
+
+    query = {"_id": {"$in": list(ds)}} if ds else {}
+    for dataset in current_app.db["dataset"].find(query):
+        click.echo(
+            f"Dataset '{dataset['_id']}' - variants:{dataset.get('variant_count', 0)}, allele calls:{dataset.get('allele_count', 0)}"
+        )
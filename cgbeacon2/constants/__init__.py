@@ -1,11 +1,14 @@
 from .consent_codes import CONSENT_CODES
-from .variant_constants import CHROMOSOMES
+from .variant_constants import CHROMOSOMES, BULK_WRITE_BATCH_SIZE
 from .query_errors import (
     NO_MANDATORY_PARAMS,
     NO_SECONDARY_PARAMS,
     NO_POSITION_PARAMS,
     INVALID_COORDINATES,
     BUILD_MISMATCH,
+    INVALID_DATASET_IDS,
+    INVALID_BATCH_REQUEST,
+    BATCH_TOO_LARGE,
 )
 from .oauth_errors import (
     MISSING_PUBLIC_KEY,
@@ -17,4 +20,5 @@ from .oauth_errors import (
     PASSPORTS_ERROR,
 )
 from .request_errors import MISSING_TOKEN, WRONG_SCHEME
-from .response_objs import QUERY_PARAMS_API_V1
+from .response_objs import QUERY_PARAMS_API_V1, BATCH_QUERY_MAX_SIZE
+from .indexes import INDEXES
@@ -0,0 +1,30 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+####### DATABASE INDEXES #######
+INDEXES = {
+    "variant": [
+        # Allele queries: equality on build, chromosome and ref bases, then start/end ranges
+        IndexModel(
+            [
+                ("assemblyId", ASCENDING),
+                ("referenceName", ASCENDING),
+                ("referenceBases", ASCENDING),
+                ("start", ASCENDING),
+                ("end", ASCENDING),
+            ],
+            name="assembly_chrom_ref_start_end",
+        ),
+        # Per-dataset queries, updates and auth filtering (multikey index)
+        IndexModel([("dataset_list", ASCENDING)], name="dataset_list"),
+    ],
+    "dataset": [
+        IndexModel([("authlevel", ASCENDING)], name="authlevel"),
+    ],
+    "event": [
+        IndexModel([("created", DESCENDING)], name="created_desc"),
+    ],
+    "gene": [
+        IndexModel([("build", ASCENDING), ("hgnc_id", ASCENDING)], name="build_hgnc_id"),
+        IndexModel([("build", ASCENDING), ("ensembl_id", ASCENDING)], name="build_ensembl_id"),
+    ],
+}
@@ -23,3 +23,18 @@ BUILD_MISMATCH = dict(
     errorCode=400,
     errorMessage="Requested genome assembly is in conflict with the assembly of one or more requested datasets",
 )
+
+INVALID_DATASET_IDS = dict(
+    errorCode=400,
+    errorMessage="'datasetIds' param should be a list of dataset ids",
+)
+
+INVALID_BATCH_REQUEST = dict(
+    errorCode=400,
+    errorMessage="Batch requests should contain a non-empty 'queries' list of allele requests",
+)
+
+BATCH_TOO_LARGE = dict(
+    errorCode=400,
+    errorMessage="Batch requests can contain max {} allele requests",
+)
@@ -14,3 +14,5 @@ QUERY_PARAMS_API_V1 = [
     "variantType",
     "includeDatasetResponses",
 ]
+
+BATCH_QUERY_MAX_SIZE = 1000  # max number of allele requests in a batch query
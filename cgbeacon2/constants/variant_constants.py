@@ -1 +1,4 @@
 CHROMOSOMES = [str(i) for i in range(1, 23)] + ["X", "Y", "MT"]
+
+# Number of variants saved to database with each bulk write when loading a VCF file
+BULK_WRITE_BATCH_SIZE = 1000
@@ -10,6 +10,44 @@ DB_PORT = 27017
 DB_NAME = "cgbeacon2-test"
 DB_URI = f"mongodb://{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+# Warn at startup if indexes used by queries are missing or variants lack their dataset list
+# (fix both with: cgbeacon2 index create)
+CHECK_INDEXES = False
+
+# Seconds between checks for dataset changes when reading datasets from the in-memory cache (0: check at every request)
+DATASET_CACHE_TTL = 5
+
+# Access levels of validated auth tokens are cached for max TOKEN_CACHE_TTL seconds (or until token expiration)
+TOKEN_CACHE_SIZE = 1000
+TOKEN_CACHE_TTL = 300
+
+# Max number of cached responses to allele queries (0: disable cache). Cache is cleared whenever datasets or variants are modified
+QUERY_CACHE_SIZE = 1000
+
+# Max number of allele requests in a batch query (/apiv1.0/query/batch). Larger batches are rejected with a 400 error
+BATCH_QUERY_MAX_SIZE = 1000
+
+# Where datasets, public keys, token access levels and query responses are cached.
+# type="memory": every app process keeps its own caches
+# type="redis": caches are shared by all app processes connected to the same Redis server (requires the redis package)
+# and query metrics are aggregated over all app processes
+CACHE_BACKEND = dict(type="memory")
+# CACHE_BACKEND = dict(type="redis", url="redis://localhost:6379/0", prefix="cgbeacon2:")
+
+# Settings of the HTTP client used for requests to external services (OAuth2 servers, Ensembl Biomart)
+HTTP_CLIENT = dict(
+    timeout=(5, 30),  # seconds: (connect timeout, read timeout)
+    retries=3,  # max number of retries for failed connections and error responses 429, 500, 502, 503, 504
+    backoff_factor=0.5,  # sleep between retries: backoff_factor * 2^(retry number - 1) seconds
+    pool_connections=10,  # number of hosts to keep connection pools for
+    pool_maxsize=10,  # max number of connections kept alive for each host
+)
+
+# Number of background threads running add and delete requests sent with "async": true
+JOB_WORKERS = 2
+# Seconds without updates after which a queued or running job is considered lost (i.e. after a server restart) and marked as failed
+JOB_STALE_AFTER = 300
+
 
 ORGANISATION = dict(
     id="scilifelab",  # mandatory
@@ -1,16 +1,22 @@
 # -*- coding: utf-8 -*-
-import pymongo
 from cgbeacon2 import __version__
+from cgbeacon2.utils.cache import DatasetRegistry
 
 
 class Beacon:
     """Represents a general beacon object"""
 
-    def __init__(self, conf_obj, api_version="1.0.0", database=None):
+    def __init__(self, conf_obj, api_version="1.0.0", database=None, dataset_registry=None):
+        snapshot = None
+        if database is not None:
+            # datasets and events are read from the registry, or from database if registry is not provided
+            dataset_registry = dataset_registry or DatasetRegistry()
+            snapshot = dataset_registry.snapshot(database)
+
         self.alternativeUrl = conf_obj.get("alternative_url")
         self.apiVersion = f"v{api_version}"
-        self.createDateTime = self._date_event(database, True)
-        self.updateDateTime = self._date_event(database, False)
+        self.createDateTime = self._date_event(snapshot, True)
+        self.updateDateTime = self._date_event(snapshot, False)
         self.description = conf_obj.get("description")
         self.id = conf_obj.get("id")
         self.name = conf_obj.get("name")
@@ -18,28 +24,23 @@ class Beacon:
         self.sampleAlleleRequests = self._sample_allele_requests()
         self.version = f"v{__version__}"
         self.welcomeUrl = conf_obj.get("welcome_url")
-        self.datasets = self._datasets(database)
-        self.datasets_by_auth_level = self._datasets_by_access_level(database)
+        self.datasets = self._datasets(snapshot)
+        self.datasets_by_auth_level = self._datasets_by_access_level(snapshot)
 
-    def _date_event(self, database, order_asc):
+    def _date_event(self, snapshot, order_asc):
         """Return the date of the first event event created for this beacon
 
         Accepts:
-            database(pymongo.database.Database)
+            snapshot(dict): datasets and events info collected by cgbeacon2.utils.cache.DatasetRegistry
             order_asc(bool): if True get first event else get last event
 
         Returns
             event.created(datetime.datetime): date of creation of the event
         """
-        if database:
+        if snapshot:
             if order_asc is True:
-                order = pymongo.ASCENDING
-            else:
-                order = pymongo.DESCENDING
-
-            events = database["event"].find().sort([("created", order)]).limit(1)
-            for event in events:
-                return event.get("created")
+                return snapshot["first_event"]
+            return snapshot["last_event"]
 
     def introduce(self):
         """Returns a the description of this beacon, with the fields required by the / endpoint"""
@@ -47,17 +48,18 @@ class Beacon:
         beacon_obj.pop("datasets_by_auth_level")
         return beacon_obj
 
-    def _datasets(self, database):
+    def _datasets(self, snapshot):
         """Retrieve all datasets associated to this Beacon
 
         Accepts:
-            database(pymongo.database.Database)
+            snapshot(dict): datasets and events info collected by cgbeacon2.utils.cache.DatasetRegistry
         Returns:
             datasets(list)
         """
-        if database is None:
+        if snapshot is None:
             return []
-        datasets = list(database["dataset"].find())
+        # Copy dataset objects, since they are shared by the registry
+        datasets = [dict(ds) for ds in snapshot["datasets"].values()]
         for ds in datasets:
             if ds.get("samples") is not None:
                 # return number of samples for each dataset, not sample names
@@ -78,21 +80,20 @@ class Beacon:
 
         return datasets
 
-    def _datasets_by_access_level(self, database):
+    def _datasets_by_access_level(self, snapshot):
         """Retrieve all datasets associated to this Beacon, by access level
 
         Accepts:
-            database(pymongo.database.Database)
+            snapshot(dict): datasets and events info collected by cgbeacon2.utils.cache.DatasetRegistry
         Returns:
             datasets_by_level(dict): the keys are "public", "registered", "controlled"
         """
         datasets_by_level = dict(public={}, registered={}, controlled={})
 
-        if database is None:
+        if snapshot is None:
             return datasets_by_level
 
-        datasets = database["dataset"].find()
-        for ds in list(datasets):
+        for ds in snapshot["datasets"].values():
             # add dataset as id=dataset_id, value=dataset to the dataset category
             datasets_by_level[ds["authlevel"]][ds["_id"]] = ds
 
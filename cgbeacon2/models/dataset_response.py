@@ -4,11 +4,23 @@
 class DatasetAlleleResponse:
     """Create a Beacon Dataset Allele Response object to be returned by Beacon Response"""
 
-    def __init__(self, dataset, variants):
+    def __init__(self, dataset, variants=None, counts=None):
+        """Counts are computed from a list of variants, unless they are provided (i.e. computed by a database aggregation)
+
+        Accepts:
+            dataset(dict)
+            variants(list): variants matching a query
+            counts(dict): precomputed counts, with keys sampleCount, callCount and variantCount
+        """
         self.datasetId = dataset["_id"]
-        n_samples, n_alleles, n_variants = self._sample_allele_variant_count(
-            self.datasetId, variants
-        )
+        if counts is None:
+            n_samples, n_alleles, n_variants = self._sample_allele_variant_count(
+                self.datasetId, variants or []
+            )
+        else:
+            n_samples = counts.get("sampleCount", 0)
+            n_alleles = counts.get("callCount", 0)
+            n_variants = counts.get("variantCount", 0)
         self.sampleCount = n_samples
         self.callCount = n_alleles
         self.variantCount = n_variants
@@ -27,6 +27,7 @@ class Variant:
             ]  # is used to denote structural variants: 'INS', 'DUP', 'DEL', 'INV'
         self.assemblyId = genome_assembly  # str
         self.datasetIds = dataset_ids  # list of dictionaries, i.e. [{ dataset_id: { samples : [list of samples]}  }]
+        self.dataset_list = list(dataset_ids.keys())  # ids of the datasets containing the variant (indexed)
         self._id = md5_key(
             self.referenceName,
             self.start,
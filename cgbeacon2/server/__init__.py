@@ -4,6 +4,14 @@ import logging
 import os
 from pymongo import MongoClient
 
+from cgbeacon2.utils import http_client
+from cgbeacon2.utils.auth import configure_key_cache
+from cgbeacon2.utils.cache import DatasetRegistry, InfoCache, QueryCache, TokenCache
+from cgbeacon2.utils.cache_backends import create_backend
+from cgbeacon2.utils.index import missing_indexes
+from cgbeacon2.utils.jobs import JobQueue
+from cgbeacon2.utils.metrics import REGISTRY
+from cgbeacon2.utils.update import missing_dataset_list
 from .blueprints import api_v1
 
 logging.basicConfig(level=logging.INFO)
@@ -45,6 +53,82 @@ def create_app():
     app.db = client[app.config["DB_NAME"]]
     LOG.info("database connection info:{}".format(app.db))
 
+    # Backend shared by the caches below (None: each cache is kept in memory by each app process)
+    cache_backend = create_backend(app.config.get("CACHE_BACKEND"))
+
+    # In-process cache of dataset metadata used by queries
+    app.dataset_registry = DatasetRegistry(
+        ttl=app.config.get("DATASET_CACHE_TTL", 0), backend=cache_backend
+    )
+    # Serialized beacon info document, rebuilt when the dataset registry is reloaded
+    app.info_cache = InfoCache()
+    # Responses to allele queries, dropped when the dataset registry is reloaded
+    app.query_cache = QueryCache(
+        maxsize=app.config.get("QUERY_CACHE_SIZE", 1000), backend=cache_backend
+    )
+
+    # Pooled HTTP session used for requests to external services
+    http_client.configure(app.config.get("HTTP_CLIENT"))
+
+    # Public keys used to validate auth tokens and passports
+    configure_key_cache(cache_backend)
+
+    # Access levels of already validated auth tokens
+    app.token_cache = TokenCache(
+        maxsize=app.config.get("TOKEN_CACHE_SIZE", 1000),
+        ttl=app.config.get("TOKEN_CACHE_TTL", 300),
+        backend=cache_backend,
+    )
+
+    # Query metrics and cache stats, aggregated over all app processes in shared cache backends
+    REGISTRY.configure(cache_backend, dict(token=app.token_cache, query=app.query_cache))
+
+    # Background threads running add and delete requests sent with "async": true
+    app.job_queue = JobQueue(
+        workers=app.config.get("JOB_WORKERS", 2),
+        stale_after=app.config.get("JOB_STALE_AFTER", 300),
+    )
+
+    if app.config.get("CHECK_INDEXES"):
+        check_indexes(app.db)
+        check_dataset_lists(app.db)
+
     app.register_blueprint(api_v1.api1_bp)
 
     return app
+
+
+def check_indexes(database):
+    """Log a warning for each collection missing one or more of the declared indexes
+
+    Accepts:
+        database(pymongo.database.Database)
+    """
+    try:
+        missing = missing_indexes(database)
+    except Exception as err:
+        LOG.warning(f"Could not check database indexes:{err}")
+        return
+
+    for collection, index_names in missing.items():
+        LOG.warning(
+            f"Collection '{collection}' is missing indexes: {', '.join(index_names)}. Run 'cgbeacon2 index create' to create them."
+        )
+
+
+def check_dataset_lists(database):
+    """Log a warning if the database contains variants saved without the list of their datasets
+
+    Accepts:
+        database(pymongo.database.Database)
+    """
+    try:
+        missing = missing_dataset_list(database)
+    except Exception as err:
+        LOG.warning(f"Could not check variants dataset list:{err}")
+        return
+
+    if missing:
+        LOG.warning(
+            "Variant collection contains variants without dataset list, saved by a previous version of the software. These variants are not returned by queries and can't be removed. Run 'cgbeacon2 update dataset-list' or 'cgbeacon2 index create' to update them."
+        )
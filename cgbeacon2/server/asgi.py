@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""ASGI app serving the info and query endpoints of the beacon with asyncio.
+
+Requires the optional dependencies motor and httpx (pip install cgbeacon2[asgi]).
+The app uses the same config file as the Flask app and can be run with any ASGI server, for instance:
+
+    uvicorn --factory cgbeacon2.server.asgi:create_asgi_app
+"""
+import asyncio
+import logging
+import time
+from functools import partial
+from urllib.parse import parse_qs
+
+from flask import current_app, json
+from werkzeug.datastructures import Headers
+from werkzeug.http import http_date, is_resource_modified, quote_etag
+
+from cgbeacon2.server import create_app
+from cgbeacon2.server.blueprints.api_v1.controllers import (
+    allele_counts_pipeline,
+    allele_query,
+    create_ds_allele_response,
+    datasets_query,
+    query_cache_lookup,
+    remove_empty_params,
+    serialize_info,
+)
+from cgbeacon2.server.blueprints.api_v1.views import API_VERSION
+from cgbeacon2.utils import http_client
+from cgbeacon2.utils.auth import authlevel_async
+from cgbeacon2.utils.metrics import (
+    QUERY_ERRORS,
+    QUERY_RESPONSES,
+    QUERY_SECONDS,
+    QUERY_STAGE_SECONDS,
+)
+
+LOG = logging.getLogger(__name__)
+
+
+def create_asgi_app():
+    """Create the ASGI app, configured from the same config file used by the Flask app"""
+    return BeaconASGI(create_app())
+
+
+def async_http_client(settings=None):
+    """Create an asynchronous HTTP client with the same settings of the shared HTTP session
+
+    Accepts:
+        settings(dict): HTTP client settings overriding http_client.DEFAULT_SETTINGS (from the HTTP_CLIENT config param)
+
+    Returns:
+        client(httpx.AsyncClient)
+    """
+    import httpx  # optional dependency: pip install cgbeacon2[asgi]
+
+    http_settings = dict(http_client.DEFAULT_SETTINGS)
+    http_settings.update(settings or {})
+    timeout = http_settings["timeout"]
+    connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        limits=httpx.Limits(
+            max_connections=http_settings["pool_connections"] * http_settings["pool_maxsize"],
+            max_keepalive_connections=http_settings["pool_maxsize"],
+        ),
+        transport=httpx.AsyncHTTPTransport(retries=http_settings["retries"]),
+    )
+
+
+class BeaconASGI:
+    """ASGI app answering info and query requests (/apiv1.0/ and /apiv1.0/query) without blocking on I/O.
+
+    Variants are queried with an asynchronous MongoDB client and tokens are validated with an asynchronous HTTP client.
+    Tokens are validated while the request is parsed, then the database is queried for the datasets accessible to the user
+    only, as in the Flask app. Dataset metadata, caches (including the query cache)
+    and metrics are shared with a Flask app created from the same config, whose helpers are run in a thread pool.
+    """
+
+    def __init__(self, flask_app, db=None, http=None):
+        """Create the ASGI app from a Flask app
+
+        Accepts:
+            flask_app(flask.Flask)
+            db(motor.motor_asyncio.AsyncIOMotorDatabase): asynchronous database client. Created from app config if not provided
+            http(httpx.AsyncClient): asynchronous HTTP client. Created from app config if not provided
+        """
+        self.flask_app = flask_app
+        config = flask_app.config
+        self.client = None
+        if db is None:
+            from motor.motor_asyncio import AsyncIOMotorClient  # optional dependency
+
+            self.client = AsyncIOMotorClient(config["DB_URI"])
+            db = self.client[config["DB_NAME"]]
+        self.db = db
+        self.http = http or async_http_client(config.get("HTTP_CLIENT"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        headers = Headers(
+            [(key.decode("latin-1"), value.decode("latin-1")) for key, value in scope["headers"]]
+        )
+        path = scope["path"].rstrip("/")
+        method = scope["method"]
+
+        try:
+            if path == "/apiv1.0" and method == "GET":
+                status, body, resp_headers = await self.info(headers)
+            elif path == "/apiv1.0/query" and method in ["GET", "POST"]:
+                status, resp_obj = await self.query(scope, receive, headers)
+                with QUERY_STAGE_SECONDS.time(stage="serialization"):
+                    body, resp_headers = self.serialize(resp_obj), []
+            else:
+                status, resp_headers = 404, []
+                body = self.serialize({"message": f"Resource '{scope['path']}' was not found"})
+        except Exception as ex:
+            LOG.exception(f"Error while answering request to {scope['path']}:{ex}")
+            status, resp_headers = 500, []
+            body = self.serialize({"message": "Internal server error"})
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"application/json")]
+                + [(key.encode("latin-1"), value.encode("latin-1")) for key, value in resp_headers],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def lifespan(self, receive, send):
+        """Handle server startup and shutdown events"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.http.aclose()
+                if self.client is not None:
+                    self.client.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def run_in_app_context(self, func, *args):
+        """Run a function of the Flask app in a thread, inside the app context
+
+        Returns:
+            the value returned by func
+        """
+
+        def run():
+            with self.flask_app.app_context():
+                return func(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(None, run)
+
+    def serialize(self, resp_obj):
+        """Serialize a response object to json, with the same helper used by the Flask app views"""
+        with self.flask_app.app_context():
+            return json.dumps(resp_obj).encode("utf-8")
+
+    async def info(self, headers):
+        """Return the beacon info document, or 304 Not Modified to conditional requests (If-None-Match, If-Modified-Since)
+        if the document didn't change, as the info view of the Flask app
+
+        Returns:
+            status(int), body(bytes), headers(list)
+        """
+
+        def cached_info():
+            snapshot = self.flask_app.dataset_registry.snapshot(self.flask_app.db)
+            return self.flask_app.info_cache.get(snapshot, lambda: serialize_info(API_VERSION))
+
+        body, etag, last_modified = await self.run_in_app_context(cached_info)
+        resp_headers = [("ETag", quote_etag(etag))]
+        if last_modified:
+            resp_headers.append(("Last-Modified", http_date(last_modified)))
+
+        conditions = {
+            "REQUEST_METHOD": "GET",
+            "HTTP_IF_NONE_MATCH": headers.get("If-None-Match"),
+            "HTTP_IF_MODIFIED_SINCE": headers.get("If-Modified-Since"),
+        }
+        if not is_resource_modified(conditions, etag=etag, last_modified=last_modified):
+            return 304, b"", resp_headers
+        return 200, body, resp_headers
+
+    async def query(self, scope, receive, headers):
+        """Answer an allele request. Pending auth and database lookups are cancelled when the request is answered
+
+        Returns:
+            status(int), resp_obj(dict)
+        """
+        start = time.perf_counter()
+        tasks = []
+        try:
+            status, resp_obj = await self.answer_query(scope, receive, headers, tasks)
+        finally:
+            for task in tasks:
+                task.cancel()  # no effect on completed tasks
+            QUERY_SECONDS.observe(time.perf_counter() - start)
+
+        if status != 200:
+            QUERY_ERRORS.inc(errorCode=status)
+        return status, resp_obj
+
+    async def answer_query(self, scope, receive, headers, tasks):
+        """Validate the auth token while the request is parsed, then look for the requested allele
+        in the datasets accessible to the user
+
+        Accepts:
+            scope(dict), receive(func), headers(werkzeug.datastructures.Headers): the ASGI request
+            tasks(list): started asyncio tasks are added to this list
+
+        Returns:
+            status(int), resp_obj(dict)
+        """
+        config = self.flask_app.config
+        beacon_id = config.get("BEACON_OBJ", {}).get("id")
+
+        # Validate the auth token while the query is parsed and the dataset registry is checked
+        auth_task = asyncio.ensure_future(self.auth_levels(headers))
+        tasks.append(auth_task)
+
+        try:
+            data, dataset_ids = await self.request_data(scope, receive, headers)
+        except ValueError:
+            return 400, {"message": "Request data could not be parsed"}
+
+        resp_obj = {}
+        with QUERY_STAGE_SECONDS.time(stage="query_building"):
+            mongo_query = await self.run_in_app_context(allele_query, resp_obj, data, dataset_ids)
+
+        auth_levels = await auth_task
+        if isinstance(auth_levels, dict):  # an error must have occurred, otherwise it's a tuple
+            return auth_levels.get("errorCode", 403), auth_levels
+
+        if resp_obj.get("message") is not None:  # invalid request
+            resp_obj["message"]["beaconId"] = beacon_id
+            resp_obj["message"]["apiVersion"] = API_VERSION
+            return resp_obj["message"]["error"]["errorCode"], resp_obj
+
+        response_type = resp_obj["allelRequest"].get("includeDatasetResponses", "NONE")
+        datasets = resp_obj["allelRequest"].get("datasetIds", [])
+        snapshot, dataset_filter, cache_key, response = await self.run_in_app_context(
+            query_cache_lookup, mongo_query, response_type, datasets, auth_levels
+        )
+        if response is None:
+            response = await self.allele_response(
+                mongo_query, response_type, datasets, dataset_filter
+            )
+            await self.run_in_app_context(self.cache_response, snapshot, cache_key, response)
+
+        exists, ds_allele_responses = response
+        QUERY_RESPONSES.inc(exists=str(exists).lower())
+        resp_obj["beaconId"] = beacon_id
+        resp_obj["apiVersion"] = API_VERSION
+        resp_obj["exists"] = exists
+        resp_obj["error"] = None
+        resp_obj["datasetAlleleResponses"] = ds_allele_responses
+        return 200, resp_obj
+
+    async def auth_levels(self, headers):
+        """Return the auth level of a request, recording the time spent validating the auth token
+
+        Returns:
+            auth_level(tuple): ([],bool) == (controlled_access datasets, bona_fide_status) or an error (dict)
+        """
+        with QUERY_STAGE_SECONDS.time(stage="auth"):
+            return await authlevel_async(
+                headers,
+                self.flask_app.config.get("ELIXIR_OAUTH2"),
+                self.flask_app.token_cache,
+                self.http,
+            )
+
+    async def request_data(self, scope, receive, headers):
+        """Collect the parameters of an allele request from query string (GET) or request body (POST)
+
+        Returns:
+            data(dict), dataset_ids(list)
+        """
+        if scope["method"] == "GET":
+            args = parse_qs(scope["query_string"].decode("utf-8"))
+            return {key: values[0] for key, values in args.items()}, args.get("datasetIds", [])
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        if headers.get("Content-type") == "application/x-www-form-urlencoded":
+            form = parse_qs(body.decode("utf-8"))
+            data = {key: values[0] for key, values in form.items()}
+            dataset_ids = form.get("datasetIds", [])
+        else:  # application/json, This should be default
+            data = json.loads(body or b"{}")
+            if not isinstance(data, dict):
+                raise ValueError("Request data is not a JSON object")
+            dataset_ids = data.get("datasetIds", [])
+
+        return remove_empty_params(data), dataset_ids
+
+    async def allele_response(self, mongo_query, response_type, datasets, dataset_filter):
+        """Query the variant collection for an allele request, as the query endpoint of the Flask app.
+        Only variants and counts of the datasets the user has access to are returned by the database
+
+        Accepts:
+            mongo_query(dict): a query dictionary
+            response_type(str): ALL, HIT, MISS or NONE
+            datasets(list): dataset ids from request "datasetIds" field
+            dataset_filter(set): ids of the datasets the user has access to
+
+        Returns:
+            tuple(bool, list): (allele_exists(bool), datasetAlleleResponses(list))
+        """
+        if not dataset_filter:
+            return False, []
+        match_query = {"$and": [mongo_query, datasets_query(dataset_filter)]}
+
+        if response_type == "NONE":
+            # Only allele existence is requested: look for one variant from a dataset the user has access to
+            with QUERY_STAGE_SECONDS.time(stage="database"):
+                variant = await self.db["variant"].find_one(match_query, {"_id": 1})
+            return variant is not None, []
+
+        count_datasets = dataset_filter.intersection(datasets) if datasets else dataset_filter
+        ds_counts = {}
+        with QUERY_STAGE_SECONDS.time(stage="database"):
+            async for result in self.db["variant"].aggregate(
+                allele_counts_pipeline(match_query, count_datasets)
+            ):
+                ds_counts[result.pop("_id")] = result
+        if not ds_counts:
+            return False, []
+        with QUERY_STAGE_SECONDS.time(stage="response_assembly"):
+            return await self.run_in_app_context(
+                partial(create_ds_allele_response, ds_counts=ds_counts), response_type, set(datasets)
+            )
+
+    @staticmethod
+    def cache_response(snapshot, cache_key, response):
+        """Save the response to an allele request in the query cache. Run in the Flask app context"""
+        current_app.query_cache.set(snapshot, cache_key, response)
@@ -1,16 +1,23 @@
 # -*- coding: utf-8 -*-
 import logging
-from flask import request, current_app, jsonify
+from flask import request, current_app, jsonify, url_for
 from cgbeacon2.constants import (
     NO_MANDATORY_PARAMS,
     NO_SECONDARY_PARAMS,
     NO_POSITION_PARAMS,
     INVALID_COORDINATES,
     BUILD_MISMATCH,
+    INVALID_DATASET_IDS,
+    INVALID_BATCH_REQUEST,
+    BATCH_TOO_LARGE,
     QUERY_PARAMS_API_V1,
+    BATCH_QUERY_MAX_SIZE,
+    BULK_WRITE_BATCH_SIZE,
 )
-from cgbeacon2.models import DatasetAlleleResponse
+from cgbeacon2.models import Beacon, DatasetAlleleResponse
 from cgbeacon2.utils.add import add_variants as variants_loader
+from cgbeacon2.utils.cache import QueryCache
+from cgbeacon2.utils.metrics import QUERY_STAGE_SECONDS
 from cgbeacon2.utils.delete import delete_variants as variant_deleter
 from cgbeacon2.utils.update import update_dataset
 from cgbeacon2.utils.parse import (
@@ -22,6 +29,16 @@ from cgbeacon2.utils.parse import (
 from cgbeacon2.utils.md5 import md5_key
 
 RANGE_COORDINATES = ("startMin", "startMax", "endMin", "endMax")
+BATCH_MATCH_FIELDS = [
+    "assemblyId",
+    "referenceName",
+    "referenceBases",
+    "alternateBases",
+    "variantType",
+    "start",
+    "end",
+]
+BATCH_QUERY_CHUNK_SIZE = 500  # max number of ids or coordinates queries sent in a single database query
 LOG = logging.getLogger(__name__)
 
 
@@ -73,19 +90,43 @@ def delete_variants(req):
         resp.status_code = 422
         return resp
 
-    updated, removed = variant_deleter(current_app.db, dataset_id, samples)
-    if updated + removed > 0:
-        result = update_dataset(
-            database=current_app.db, dataset_id=dataset_id, samples=samples, add=False
+    if req_data.get("async") is True:  # run request in background and return job id
+        job_id = current_app.job_queue.submit(
+            current_app._get_current_object(),
+            "delete",
+            req_data,
+            remove_variants,
+            dataset_id,
+            samples,
         )
-    message = {
-        "message": f"Number of updated variants:{updated}. Number of deleted variants:{removed}"
-    }
+        return job_accepted(job_id)
+
+    message = remove_variants(dataset_id, samples)
     resp = jsonify(message)
     resp.status_code = 200
     return resp
 
 
+def remove_variants(dataset_id, samples, progress=None):
+    """Remove the variants of one or more samples of a dataset and update the dataset
+
+    Accepts:
+        dataset_id(str): dataset id
+        samples(list): list of sample names
+        progress(func): function called with the number of processed and modified variants when done
+
+    Returns:
+        message(dict): a message with the number of updated and deleted variants
+    """
+    updated, removed = variant_deleter(current_app.db, dataset_id, samples)
+    if updated + removed > 0:
+        update_dataset(database=current_app.db, dataset_id=dataset_id, samples=samples, add=False)
+        current_app.dataset_registry.invalidate()
+    if progress:
+        progress(updated + removed, updated + removed)
+    return {"message": f"Number of updated variants:{updated}. Number of deleted variants:{removed}"}
+
+
 def add_variants(req):
     """Add variants from a VCF file according to parameters specified in request data.
 
@@ -145,32 +186,102 @@ def add_variants(req):
             resp.status_code = 200
             return resp
 
+    if req_data.get("async") is True:  # run request in background and return job id
+        job_id = current_app.job_queue.submit(
+            current_app._get_current_object(),
+            "add",
+            req_data,
+            load_variants,
+            req_data,
+            filter_intervals,
+        )
+        return job_accepted(job_id)
+
+    message = load_variants(req_data, filter_intervals)
+    resp = jsonify(message)
+    resp.status_code = 200
+    return resp
+
+
+def load_variants(req_data, filter_intervals=None, progress=None):
+    """Save variants from a VCF file according to the parameters of a validated add request and update the dataset
+
+    Accepts:
+        req_data(dict): data of an add request
+        filter_intervals(BedTool): genomic intervals to filter VCF variants with
+        progress(func): function called with the number of processed VCF records and saved variants while loading
+
+    Returns:
+        message(dict): a message with the number of saved variants
+    """
+    db = current_app.db
+    assembly = req_data.get("assemblyId")
+    dataset_id = req_data.get("dataset_id")
+    samples = req_data.get("samples")
+
     vcf_obj = extract_variants(
         vcf_file=req_data.get("vcf_path"), samples=samples, filter=filter_intervals
     )
-    nr_variants = count_variants(vcf_obj)
-    vcf_obj = extract_variants(
-        vcf_file=req_data.get("vcf_path"), samples=samples, filter=filter_intervals
-    )
-    added = variants_loader(
+    nr_variants = None
+    if filter_intervals is None:
+        nr_variants = count_variants(req_data.get("vcf_path"))
+    if progress:
+        progress(0, 0, total=nr_variants)
+
+    added, _ = variants_loader(
         database=db,
         vcf_obj=vcf_obj,
         samples=set(samples),
         assembly=assembly,
         dataset_id=dataset_id,
         nr_variants=nr_variants,
+        batch_size=req_data.get("batch_size", BULK_WRITE_BATCH_SIZE),
+        show_progress=progress is None,
+        progress=progress,
     )
 
     if added > 0:
         # Update dataset object accordingly
         update_dataset(database=db, dataset_id=dataset_id, samples=samples, add=True)
+        current_app.dataset_registry.invalidate()
 
-    message = {"message": f"Number of inserted variants for samples:{samples}:{added}"}
-    resp = jsonify(message)
-    resp.status_code = 200
+    return {"message": f"Number of inserted variants for samples:{samples}:{added}"}
+
+
+def job_accepted(job_id):
+    """Create the response returned when a request is queued as a background job
+
+    Accepts:
+        job_id(str): id of the job
+
+    Returns:
+        resp(json object): a 202 response containing the job id and the url to check job status
+    """
+    resp = jsonify(
+        {
+            "message": "Request accepted",
+            "job_id": job_id,
+            "status_url": url_for("api_v1.job_status", job_id=job_id),
+        }
+    )
+    resp.status_code = 202
     return resp
 
 
+def serialize_info(api_version):
+    """Create the Beacon info document returned by the info endpoint
+
+    Accepts:
+        api_version(str): version of the API
+
+    Returns:
+        body(bytes): json document
+    """
+    beacon_config = current_app.config.get("BEACON_OBJ")
+    beacon = Beacon(beacon_config, api_version, current_app.db, current_app.dataset_registry)
+    return jsonify(beacon.introduce()).get_data()
+
+
 def create_allele_query(resp_obj, req):
     """Populates a dictionary with the parameters provided in the request<<
 
@@ -179,30 +290,57 @@ def create_allele_query(resp_obj, req):
         req(flask.request): request received by server
 
     """
-    customer_query = {}
-    mongo_query = {}
-    exists = False
     data = None
 
     if req.method == "GET":
         data = dict(req.args)
-        customer_query["datasetIds"] = req.args.getlist("datasetIds")
+        dataset_ids = req.args.getlist("datasetIds")
     else:  # POST method
         if req.headers.get("Content-type") == "application/x-www-form-urlencoded":
             data = dict(req.form)
-            customer_query["datasetIds"] = req.form.getlist("datasetIds")
+            dataset_ids = req.form.getlist("datasetIds")
 
         else:  # application/json, This should be default
             data = req.json
-            customer_query["datasetIds"] = data.get("datasetIds", [])
+            dataset_ids = data.get("datasetIds", [])
 
         # Remove null parameters from the query
-        remove_keys = []
-        for key, value in data.items():
-            if value == "":
-                remove_keys.append(key)
-        for key in remove_keys:
-            data.pop(key)
+        data = remove_empty_params(data)
+
+    return allele_query(resp_obj, data, dataset_ids)
+
+
+def remove_empty_params(data):
+    """Remove params with empty values from the data of a request
+
+    Accepts:
+        data(dict): key/values provided in the request
+
+    Returns:
+        data(dict)
+    """
+    remove_keys = []
+    for key, value in data.items():
+        if value == "":
+            remove_keys.append(key)
+    for key in remove_keys:
+        data.pop(key)
+    return data
+
+
+def allele_query(resp_obj, data, dataset_ids):
+    """Populates a dictionary with the parameters of an allele request
+
+    Accepts:
+        resp_obj(dictionary): response data that will be returned by server
+        data(dict): key/values provided in the allele request
+        dataset_ids(list): list of datasets requested by user
+
+    Returns:
+        mongo_query(dict): the query to collect variants from this server. None if request is not valid
+    """
+    customer_query = {"datasetIds": dataset_ids}
+    mongo_query = {}
 
     # loop over all available query params
     for param in QUERY_PARAMS_API_V1:
@@ -225,6 +363,60 @@ def create_allele_query(resp_obj, req):
     return mongo_query
 
 
+def create_batch_allele_queries(resp_obj, req):
+    """Create a database query for each allele request contained in a batch request
+
+    Accepts:
+        resp_obj(dictionary): response data that will be returned by server
+        req(flask.request): request received by server
+
+    Returns:
+        allele_queries(list): list of tuples (allele response obj(dict), mongo_query(dict) or None), one for each allele request
+    """
+    data = req.get_json(silent=True)
+    queries = data.get("queries") if isinstance(data, dict) else None
+
+    if (
+        isinstance(queries, list) is False
+        or queries == []
+        or any(isinstance(query, dict) is False for query in queries)
+    ):
+        resp_obj["message"] = dict(error=INVALID_BATCH_REQUEST)
+        return
+
+    if any(valid_dataset_ids(query.get("datasetIds", [])) is False for query in queries):
+        resp_obj["message"] = dict(error=INVALID_DATASET_IDS)
+        return
+
+    max_size = current_app.config.get("BATCH_QUERY_MAX_SIZE", BATCH_QUERY_MAX_SIZE)
+    if len(queries) > max_size:
+        error = dict(BATCH_TOO_LARGE)
+        error["errorMessage"] = error["errorMessage"].format(max_size)
+        resp_obj["message"] = dict(error=error)
+        return
+
+    allele_queries = []
+    for query in queries:
+        query_data = remove_empty_params(dict(query))
+        allele_resp = {}
+        mongo_query = allele_query(allele_resp, query_data, query_data.get("datasetIds", []))
+        allele_queries.append((allele_resp, mongo_query))
+
+    return allele_queries
+
+
+def valid_dataset_ids(dataset_ids):
+    """Check that the datasetIds param of a request is a list of dataset ids
+
+    Accepts:
+        dataset_ids: value of the datasetIds param
+
+    Returns:
+        bool
+    """
+    return isinstance(dataset_ids, list) and all(isinstance(ds_id, str) for ds_id in dataset_ids)
+
+
 def check_allele_request(resp_obj, customer_query, mongo_query):
     """Check that the query to the server is valid
 
@@ -269,12 +461,22 @@ def check_allele_request(resp_obj, customer_query, mongo_query):
         )
         return
 
+    if valid_dataset_ids(customer_query.get("datasetIds", [])) is False:
+        resp_obj["message"] = dict(
+            error=INVALID_DATASET_IDS,
+            allelRequest=customer_query,
+        )
+        return
+
     # check if genome build requested corresponds to genome build of the available datasets:
     if len(customer_query.get("datasetIds", [])) > 0:
-        dset_builds = current_app.db["dataset"].find(
-            {"_id": {"$in": customer_query["datasetIds"]}}, {"assembly_id": 1, "_id": 0}
-        )
-        dset_builds = [dset["assembly_id"] for dset in dset_builds if dset["assembly_id"]]
+        all_dsets = current_app.dataset_registry.datasets(current_app.db)
+        dset_builds = [
+            all_dsets[ds_id].get("assembly_id")
+            for ds_id in customer_query["datasetIds"]
+            if ds_id in all_dsets
+        ]
+        dset_builds = [build for build in dset_builds if build]
         for dset in dset_builds:
             if dset != customer_query["assemblyId"]:
                 # return a bad request 400 error with explanation message
@@ -370,7 +572,9 @@ def check_allele_request(resp_obj, customer_query, mongo_query):
 
 
 def dispatch_query(mongo_query, response_type, datasets=[], auth_levels=([], False)):
-    """Query variant collection using a query dictionary
+    """Query variant collection using a query dictionary.
+    Responses are cached by query, response type, requested datasets and datasets accessible to the user,
+    until datasets or variants are modified
 
     Accepts:
         mongo_query(dic): a query dictionary
@@ -386,16 +590,147 @@ def dispatch_query(mongo_query, response_type, datasets=[], auth_levels=([], Fal
         tuple(bool, list): (allele_exists(bool), datasetAlleleResponses(list))
 
     """
+    snapshot, dataset_filter, cache_key, response = query_cache_lookup(
+        mongo_query, response_type, datasets, auth_levels
+    )
+    if response is None:
+        response = _dispatch_query(mongo_query, response_type, datasets, dataset_filter)
+        current_app.query_cache.set(snapshot, cache_key, response)
+    return response
+
+
+def query_cache_lookup(mongo_query, response_type, datasets, auth_levels):
+    """Look for the response to an allele query in the query cache
+
+    Accepts:
+        mongo_query(dic): a query dictionary
+        response_type(str): ALL, HIT, MISS or NONE
+        datasets(list): dataset ids from request "datasetIds" field
+        auth_levels(tuple): (registered access datasets(list), bona_fide_status(bool))
+
+    Returns:
+        snapshot(dict): dataset registry snapshot, to be used when saving the response to the cache
+        dataset_filter(set): ids of the datasets the user has access to
+        cache_key(str): key of the query in the cache
+        response(tuple): cached (allele_exists(bool), datasetAlleleResponses(list)) or None
+    """
+    snapshot = current_app.dataset_registry.snapshot(current_app.db)
+    with QUERY_STAGE_SECONDS.time(stage="auth_filter"):
+        dataset_filter = authorized_datasets(auth_levels)
+    cache_key = QueryCache.key(mongo_query, response_type, datasets, dataset_filter)
+    response = current_app.query_cache.get(snapshot, cache_key)
+    if response is not None:
+        LOG.info(f"Returning cached response to query -----------> {mongo_query}.")
+    return snapshot, dataset_filter, cache_key, response
+
+
+def _dispatch_query(mongo_query, response_type, datasets, dataset_filter):
+    """Query variant collection using a query dictionary, without using the query cache
+
+    Accepts:
+        mongo_query(dic): a query dictionary
+        response_type(str): ALL, HIT, MISS or NONE
+        datasets(list): dataset ids from request "datasetIds" field
+        dataset_filter(set): ids of the datasets the user has access to
+
+    Returns:
+        tuple(bool, list): (allele_exists(bool), datasetAlleleResponses(list))
+    """
     variant_collection = current_app.db["variant"]
 
     LOG.info(f"Perform database query -----------> {mongo_query}.")
     LOG.info(f"Response level (datasetAlleleResponses) -----> {response_type}.")
 
-    # End users are only interested in knowing which datasets have one or more specific vars, return only datasets and callCount
-    variants = list(
-        variant_collection.find(mongo_query, {"_id": 0, "datasetIds": 1, "call_count": 1})
-    )
+    if response_type != "NONE":
+        # Count samples, calls and variants for each dataset in the database and return only the counts
+        with QUERY_STAGE_SECONDS.time(stage="database"):
+            ds_counts = dataset_allele_counts(mongo_query, datasets, dataset_filter=dataset_filter)
+        if not ds_counts:
+            return False, []
+        with QUERY_STAGE_SECONDS.time(stage="response_assembly"):
+            return create_ds_allele_response(response_type, set(datasets), ds_counts=ds_counts)
+
+    # Only allele existence is requested: look for one variant from a dataset the user has access to
+    if not dataset_filter:
+        return False, []
+
+    with QUERY_STAGE_SECONDS.time(stage="database"):
+        variant = variant_collection.find_one(
+            {"$and": [mongo_query, datasets_query(dataset_filter)]}, {"_id": 1}
+        )
+    return variant is not None, []
+
+
+def dataset_allele_counts(mongo_query, datasets=[], auth_levels=([], False), dataset_filter=None):
+    """Compute sample, call and variant counts for each dataset with variants matching a query, using an aggregation pipeline.
+    Counts are computed only for the datasets the user has access to.
+
+    Accepts:
+        mongo_query(dic): a query dictionary
+        datasets(list): dataset ids from request "datasetIds" field. If empty, counts are computed for all datasets
+        auth_levels(tuple): (registered access datasets(list), bona_fide_status(bool))
+        dataset_filter(set): ids of the datasets the user has access to, if already computed from auth_levels
+
+    Returns:
+        ds_counts(dict): dataset ids as keys and dict(sampleCount, callCount, variantCount) as values
+    """
+    if dataset_filter is None:
+        dataset_filter = authorized_datasets(auth_levels)
+    if not dataset_filter:
+        return {}
+
+    match_query = {"$and": [mongo_query, datasets_query(dataset_filter)]}
+    if datasets:
+        dataset_filter = dataset_filter.intersection(datasets)
+    pipeline = allele_counts_pipeline(match_query, dataset_filter)
 
+    ds_counts = {}
+    for result in current_app.db["variant"].aggregate(pipeline):
+        ds_id = result.pop("_id")
+        ds_counts[ds_id] = result
+    return ds_counts
+
+
+def allele_counts_pipeline(match_query, datasets):
+    """Create the aggregation pipeline counting samples, calls and variants for each dataset with variants matching a query
+
+    Accepts:
+        match_query(dict): query selecting the variants
+        datasets(set): ids of the datasets to count variants for
+
+    Returns:
+        pipeline(list)
+    """
+    return [
+        {"$match": match_query},
+        {"$project": {"_id": 0, "call_count": 1, "datasets": {"$objectToArray": "$datasetIds"}}},
+        {"$unwind": "$datasets"},
+        {"$match": {"datasets.k": {"$in": sorted(datasets)}}},
+        {
+            "$group": {
+                "_id": "$datasets.k",
+                "sampleCount": {
+                    "$sum": {"$size": {"$objectToArray": {"$ifNull": ["$datasets.v.samples", {}]}}}
+                },
+                "callCount": {"$sum": "$call_count"},
+                "variantCount": {"$sum": 1},
+            }
+        },
+    ]
+
+
+def variants_allele_response(variants, response_type, datasets=[], auth_levels=([], False)):
+    """Create the response to an allele request from the variants matching it
+
+    Accepts:
+        variants(list): variants returned by the database query
+        response_type(str): ALL, HIT, MISS or NONE
+        datasets(list): dataset ids from request "datasetIds" field
+        auth_levels(tuple): (registered access datasets(list), bona_fide_status(bool))
+
+    Returns:
+        tuple(bool, list): (allele_exists(bool), datasetAlleleResponses(list))
+    """
     if len(variants) == 0:
         return False, []
 
@@ -417,6 +752,95 @@ def dispatch_query(mongo_query, response_type, datasets=[], auth_levels=([], Fal
     return False, []
 
 
+def dispatch_batch_query(mongo_queries, auth_levels=([], False)):
+    """Query variant collection for a list of allele requests using a few database queries.
+    Queries by variant _id are resolved with $in lookups, the others with $or queries, whose results are then
+    assigned to the matching requests.
+
+    Accepts:
+        mongo_queries(list): list of query dictionaries
+        auth_levels(tuple): (registered access datasets(list), bona_fide_status(bool))
+
+    Returns:
+        query_variants(list): a list of matching variants for each query
+    """
+    variant_collection = current_app.db["variant"]
+
+    # Collect only variants from datasets the user has access to, and only the sub-documents of these datasets
+    dataset_filter = authorized_datasets(auth_levels)
+    if not dataset_filter:
+        return [[] for _ in mongo_queries]
+    auth_query = datasets_query(dataset_filter)
+    projection = {field: 1 for field in BATCH_MATCH_FIELDS + ["call_count"]}
+    projection.update({f"datasetIds.{ds_id}": 1 for ds_id in dataset_filter})
+
+    variants_by_id = {}
+    variant_ids = list({query["_id"] for query in mongo_queries if "_id" in query})
+    for chunk in _chunks(variant_ids, BATCH_QUERY_CHUNK_SIZE):
+        id_query = {"$and": [{"_id": {"$in": chunk}}, auth_query]}
+        for variant in variant_collection.find(id_query, projection):
+            variants_by_id[variant["_id"]] = variant
+
+    # Group variants found by coordinates queries by build, chromosome and reference bases
+    variants_by_locus = {}
+    coord_queries = [query for query in mongo_queries if "_id" not in query]
+    for chunk in _chunks(coord_queries, BATCH_QUERY_CHUNK_SIZE):
+        coord_query = {"$and": [{"$or": chunk}, auth_query]}
+        for variant in variant_collection.find(coord_query, projection):
+            variant = variants_by_id.setdefault(variant["_id"], variant)
+            variants_by_locus.setdefault(_locus(variant), {})[variant["_id"]] = variant
+
+    LOG.info(
+        f"Batch of {len(mongo_queries)} queries resolved with {len(variant_ids)} variant ids and {len(coord_queries)} coordinate queries"
+    )
+
+    query_variants = []
+    for query in mongo_queries:
+        if "_id" in query:
+            variant = variants_by_id.get(query["_id"])
+            query_variants.append([variant] if variant else [])
+            continue
+        candidates = variants_by_locus.get(_locus(query), {}).values()
+        query_variants.append([variant for variant in candidates if _match_query(variant, query)])
+
+    return query_variants
+
+
+def _chunks(items, size):
+    """Split a list into chunks of a given size"""
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _locus(item):
+    """Return build, chromosome and reference bases of a variant or a coordinates query"""
+    return (item.get("assemblyId"), item.get("referenceName"), item.get("referenceBases"))
+
+
+def _match_query(variant, mongo_query):
+    """Check if a variant satisfies a coordinates query (equality and $gte/$lte conditions)
+
+    Accepts:
+        variant(dict): a variant document
+        mongo_query(dict): a query created by check_allele_request
+
+    Returns:
+        bool
+    """
+    for field, condition in mongo_query.items():
+        value = variant.get(field)
+        if isinstance(condition, dict):
+            if value is None:
+                return False
+            if "$gte" in condition and value < condition["$gte"]:
+                return False
+            if "$lte" in condition and value > condition["$lte"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
 def results_filter_by_auth(variants, auth_levels):
     """Filter variants returned by query using auth levels (specified by token, if present, otherwise public access only datasets)
 
@@ -428,41 +852,61 @@ def results_filter_by_auth(variants, auth_levels):
         filtered_variants(list): Variants filtered using authlevel criteria
     """
 
+    dataset_filter = authorized_datasets(auth_levels)
+
+    # Filter results
+    LOG.info(f"Filtering out results with datasets different from :{dataset_filter}")
+    return [
+        variant
+        for variant in variants
+        if dataset_filter.isdisjoint(variant.get("datasetIds", {})) is False
+    ]
+
+
+def authorized_datasets(auth_levels):
+    """Return the ids of the datasets a user has access to
+
+    Accepts:
+        auth_levels(tuple): (registered access datasets(list), bona_fide_status(bool))
+
+    Returns:
+        dataset_filter(set): public datasets + registered datasets from token + controlled datasets (if user is bona fide)
+    """
     # Filter variants by auth level (specified by token, if present, otherwise public access only datasets)
-    ds_collection = current_app.db["dataset"]
-    public_ds = ds_collection.find({"authlevel": "public"})
-    pyblic_ds_ids = [ds["_id"] for ds in public_ds]
+    registry = current_app.dataset_registry
+    pyblic_ds_ids = registry.dataset_ids(current_app.db, "public")
 
-    LOG.info(f"The following public dataset were found in database:{public_ds}")
+    LOG.info(f"The following public dataset were found in database:{pyblic_ds_ids}")
 
     registered_access_ds_ids = auth_levels[0]
     controlled_access_ds_ids = []
 
     if auth_levels[1] is True:  # user has access to controlled access datasets
-        controlled_access_ds = ds_collection.find({"authlevel": "controlled"})
-        controlled_access_ds_ids = [ds["_id"] for ds in controlled_access_ds]
+        controlled_access_ds_ids = registry.dataset_ids(current_app.db, "controlled")
 
-    dataset_filter = pyblic_ds_ids + registered_access_ds_ids + controlled_access_ds_ids
+    return set(pyblic_ds_ids + registered_access_ds_ids + controlled_access_ds_ids)
 
-    # Filter results
-    LOG.info(f"Filtering out results with datasets different from :{dataset_filter}")
-    filtered_variants = []
 
-    for variant in variants:
-        for key in variant.get("datasetIds", []):
-            if key in dataset_filter:
-                filtered_variants.append(variant)
+def datasets_query(dataset_ids):
+    """Create a query matching variants found in one or more datasets
+
+    Accepts:
+        dataset_ids(list): list of dataset ids
 
-    return filtered_variants
+    Returns:
+        query(dict)
+    """
+    return {"dataset_list": {"$in": sorted(dataset_ids)}}
 
 
-def create_ds_allele_response(response_type, req_dsets, variants):
+def create_ds_allele_response(response_type, req_dsets, variants=None, ds_counts=None):
     """Create a Beacon Dataset Allele Response
 
     Accepts:
         response_type(str): ALL, HIT or MISS
         req_dsets(set): datasets requested, could be empty
         variants(list): a list of query results
+        ds_counts(dict): counts computed by dataset_allele_counts, used instead of variants
 
     Returns:
         ds_responses(list): list of cgbeacon2.model.DatasetAlleleResponse
@@ -470,8 +914,7 @@ def create_ds_allele_response(response_type, req_dsets, variants):
     ds_responses = []
     exists = False
 
-    all_dsets = current_app.db["dataset"].find()
-    all_dsets = {ds["_id"]: ds for ds in all_dsets}
+    all_dsets = current_app.dataset_registry.datasets(current_app.db)
 
     if len(req_dsets) == 0:  # if query didn't specify any dataset
         # Use all datasets present in this beacon
@@ -483,7 +926,10 @@ def create_ds_allele_response(response_type, req_dsets, variants):
             LOG.info(f"Provided dataset {ds} could not be found in database")
             continue
 
-        ds_response = DatasetAlleleResponse(all_dsets[ds], variants).__dict__
+        if ds_counts is not None:
+            ds_response = DatasetAlleleResponse(all_dsets[ds], counts=ds_counts.get(ds)).__dict__
+        else:
+            ds_response = DatasetAlleleResponse(all_dsets[ds], variants).__dict__
 
         # collect responses according to the type of response requested
         if (
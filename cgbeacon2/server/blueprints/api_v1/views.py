@@ -11,10 +11,31 @@ from flask import (
 )
 from flask_negotiate import consumes
 from cgbeacon2.constants import CHROMOSOMES
-from cgbeacon2.models import Beacon
 from cgbeacon2.utils.auth import authlevel
+from cgbeacon2.utils.jobs import job_status as job_info
+from cgbeacon2.utils.metrics import (
+    BATCH_QUERY_ERRORS,
+    BATCH_QUERY_RESPONSES,
+    BATCH_QUERY_SECONDS,
+    BATCH_QUERY_STAGE_SECONDS,
+    CONTENT_TYPE,
+    QUERY_ERRORS,
+    QUERY_RESPONSES,
+    QUERY_SECONDS,
+    QUERY_STAGE_SECONDS,
+    REGISTRY,
+)
 from cgbeacon2.utils.parse import validate_add_request
-from .controllers import create_allele_query, dispatch_query, add_variants, delete_variants
+from .controllers import (
+    create_allele_query,
+    create_batch_allele_queries,
+    dispatch_query,
+    dispatch_batch_query,
+    variants_allele_response,
+    add_variants,
+    delete_variants,
+    serialize_info,
+)
 
 API_VERSION = "1.0.0"
 LOG = logging.getLogger(__name__)
@@ -34,14 +55,21 @@ def info():
     Example:
         curl -X GET 'http://localhost:5000/apiv1.0/'
 
+    Supports conditional requests using the ETag and Last-Modified headers of the response
     """
 
-    beacon_config = current_app.config.get("BEACON_OBJ")
-    beacon = Beacon(beacon_config, API_VERSION, current_app.db)
+    # Info document is serialized once and served again until datasets or events change
+    snapshot = current_app.dataset_registry.snapshot(current_app.db)
+    body, etag, last_modified = current_app.info_cache.get(
+        snapshot, lambda: serialize_info(API_VERSION)
+    )
 
-    resp = jsonify(beacon.introduce())
-    resp.status_code = 200
-    return resp
+    resp = current_app.response_class(body, status=200, mimetype="application/json")
+    resp.set_etag(etag)
+    if last_modified:
+        resp.last_modified = last_modified
+    # Return 304 Not Modified to conditional requests (If-None-Match, If-Modified-Since) if document didn't change
+    return resp.make_conditional(request)
 
 
 @api1_bp.route("/apiv1.0/query_form", methods=["GET", "POST"])
@@ -53,8 +81,7 @@ def query_form():
     http://127.0.0.1:5000/apiv1.0/query_form
     """
 
-    all_dsets = current_app.db["dataset"].find()
-    all_dsets = [ds["_id"] for ds in all_dsets]
+    all_dsets = list(current_app.dataset_registry.datasets(current_app.db))
     resp_obj = {}
 
     if request.method == "POST":
@@ -108,6 +135,8 @@ def add():
     "vcf_path": "path/to/cgbeacon2/resources/demo/test_trio.vcf.gz",
     "samples" : ["ADM1059A1", "ADM1059A2"],
     "assemblyId": "GRCh37"}' http://localhost:5000/apiv1.0/add
+
+    Adding "async": true to the request data runs the request in background and returns a job id (status code 202)
     """
 
     resp = None
@@ -132,12 +161,34 @@ def delete():
     -H 'Content-Type: application/json' \
     -d '{"dataset_id": "test_public",
     "samples" : ["ADM1059A1", "ADM1059A2"]' http://localhost:5000/apiv1.0/delete
+
+    Adding "async": true to the request data runs the request in background and returns a job id (status code 202)
     """
     resp = delete_variants(request)
     return resp
 
 
+@api1_bp.route("/apiv1.0/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Return status, progress and result of an add or delete request run in background (request param "async": true)
+
+    Example:
+        curl -X GET 'http://localhost:5000/apiv1.0/jobs/<job_id>'
+
+    """
+    job = job_info(current_app.db, job_id, current_app.job_queue.stale_after)
+    if job is None:
+        resp = jsonify({"message": f"Job '{job_id}' was not found on the server"})
+        resp.status_code = 404
+        return resp
+
+    resp = jsonify(job)
+    resp.status_code = 200
+    return resp
+
+
 @api1_bp.route("/apiv1.0/query", methods=["GET", "POST"])
+@QUERY_SECONDS.time()
 def query():
     """Create a query from params provided in the request and return a response with eventual results, or errors
 
@@ -158,32 +209,37 @@ def query():
 
     """
 
-    beacon_config = current_app.config.get("BEACON_OBJ")
-    beacon_obj = Beacon(beacon_config, API_VERSION, current_app.db)
+    beacon_id = current_app.config.get("BEACON_OBJ", {}).get("id")
 
     resp_obj = {}
     resp_status = 200
 
     # Check request headers to define user access level
     # Public access only has auth_levels = ([], False)
-    auth_levels = authlevel(request, current_app.config.get("ELIXIR_OAUTH2"))
+    with QUERY_STAGE_SECONDS.time(stage="auth"):
+        auth_levels = authlevel(
+            request, current_app.config.get("ELIXIR_OAUTH2"), current_app.token_cache
+        )
 
     if isinstance(auth_levels, dict):  # an error must have occurred, otherwise it's a tuple
         resp = jsonify(auth_levels)
         resp.status_code = auth_levels.get("errorCode", 403)
+        QUERY_ERRORS.inc(errorCode=resp.status_code)
         return resp
 
     # Create database query object
-    query = create_allele_query(resp_obj, request)
+    with QUERY_STAGE_SECONDS.time(stage="query_building"):
+        query = create_allele_query(resp_obj, request)
 
     if resp_obj.get("message") is not None:
         # an error must have occurred
         resp_status = resp_obj["message"]["error"]["errorCode"]
-        resp_obj["message"]["beaconId"] = beacon_obj.id
+        resp_obj["message"]["beaconId"] = beacon_id
         resp_obj["message"]["apiVersion"] = API_VERSION
+        QUERY_ERRORS.inc(errorCode=resp_status)
 
     else:
-        resp_obj["beaconId"] = beacon_obj.id
+        resp_obj["beaconId"] = beacon_id
         resp_obj["apiVersion"] = API_VERSION
 
         # query database (it should return a datasetAlleleResponses object)
@@ -196,7 +252,93 @@ def query():
         resp_obj["exists"] = exists
         resp_obj["error"] = None
         resp_obj["datasetAlleleResponses"] = ds_allele_responses
+        QUERY_RESPONSES.inc(exists=str(exists).lower())
 
-    resp = jsonify(resp_obj)
+    with QUERY_STAGE_SECONDS.time(stage="serialization"):
+        resp = jsonify(resp_obj)
     resp.status_code = resp_status
     return resp
+
+
+@consumes("application/json")
+@api1_bp.route("/apiv1.0/query/batch", methods=["POST"])
+@BATCH_QUERY_SECONDS.time()
+def query_batch():
+    """Resolve a list of allele requests and return a response for each one of them, in the same order
+
+    Example:
+    ########### POST request ###########
+    curl -X POST \
+    -H 'Content-Type: application/json' \
+    -d '{"queries": [
+        {"referenceName": "1", "start": 156146085, "referenceBases": "C", "alternateBases": "A", "assemblyId": "GRCh37"},
+        {"referenceName": "1", "startMin": 156146000, "startMax": 156147000, "referenceBases": "C", "variantType": "DEL", "assemblyId": "GRCh37", "includeDatasetResponses": "HIT"}
+    ]}' http://localhost:5000/apiv1.0/query/batch
+
+    """
+    beacon_id = current_app.config.get("BEACON_OBJ", {}).get("id")
+
+    resp_obj = {}
+
+    # Auth level is the same for all queries of the batch
+    with BATCH_QUERY_STAGE_SECONDS.time(stage="auth"):
+        auth_levels = authlevel(
+            request, current_app.config.get("ELIXIR_OAUTH2"), current_app.token_cache
+        )
+
+    if isinstance(auth_levels, dict):  # an error must have occurred, otherwise it's a tuple
+        resp = jsonify(auth_levels)
+        resp.status_code = auth_levels.get("errorCode", 403)
+        BATCH_QUERY_ERRORS.inc(errorCode=resp.status_code)
+        return resp
+
+    with BATCH_QUERY_STAGE_SECONDS.time(stage="query_building"):
+        allele_queries = create_batch_allele_queries(resp_obj, request)
+
+    if resp_obj.get("message") is not None:  # invalid batch request
+        resp_obj["message"]["beaconId"] = beacon_id
+        resp_obj["message"]["apiVersion"] = API_VERSION
+        resp = jsonify(resp_obj)
+        resp.status_code = resp_obj["message"]["error"]["errorCode"]
+        BATCH_QUERY_ERRORS.inc(errorCode=resp.status_code)
+        return resp
+
+    valid_queries = [mongo_query for _, mongo_query in allele_queries if mongo_query is not None]
+    with BATCH_QUERY_STAGE_SECONDS.time(stage="database"):
+        query_variants = iter(dispatch_batch_query(valid_queries, auth_levels))
+
+    results = []
+    with BATCH_QUERY_STAGE_SECONDS.time(stage="response_assembly"):
+        for allele_resp, mongo_query in allele_queries:
+            if mongo_query is None:  # allele request not valid, return error
+                results.append(allele_resp["message"])
+                BATCH_QUERY_ERRORS.inc(errorCode=allele_resp["message"]["error"]["errorCode"])
+                continue
+
+            response_type = allele_resp["allelRequest"].get("includeDatasetResponses", "NONE")
+            query_datasets = allele_resp["allelRequest"].get("datasetIds", [])
+            exists, ds_allele_responses = variants_allele_response(
+                next(query_variants), response_type, query_datasets, auth_levels
+            )
+            allele_resp["exists"] = exists
+            allele_resp["error"] = None
+            allele_resp["datasetAlleleResponses"] = ds_allele_responses
+            results.append(allele_resp)
+            BATCH_QUERY_RESPONSES.inc(exists=str(exists).lower())
+
+    resp_obj["beaconId"] = beacon_id
+    resp_obj["apiVersion"] = API_VERSION
+    resp_obj["results"] = results
+
+    with BATCH_QUERY_STAGE_SECONDS.time(stage="serialization"):
+        resp = jsonify(resp_obj)
+    resp.status_code = 200
+    return resp
+
+
+@api1_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Return query latencies and counters, and cache usage stats in Prometheus text format"""
+
+    caches = dict(token=current_app.token_cache, query=current_app.query_cache)
+    return current_app.response_class(REGISTRY.render(caches), content_type=CONTENT_TYPE)
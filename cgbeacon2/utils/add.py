@@ -1,12 +1,30 @@
 # -*- coding: utf-8 -*-
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from cyvcf2 import VCF
+import numpy as np
 from progress.bar import Bar
+from progress.counter import Counter
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 
-from cgbeacon2.constants import CHROMOSOMES
+from cgbeacon2.constants import CHROMOSOMES, BULK_WRITE_BATCH_SIZE
 from cgbeacon2.models.variant import Variant
-from cgbeacon2.utils.parse import variant_called, bnd_mate_name, sv_end
+from cgbeacon2.utils.parse import (
+    SPANNING_DELETION,
+    alleles_called,
+    allele_type,
+    bnd_mate_name,
+    sv_end,
+    trim_alleles,
+    variant_called,
+    vcf_contigs,
+)
 
 LOG = logging.getLogger(__name__)
+DUPLICATE_KEY_ERROR = 11000
+PROGRESS_INTERVAL = 1000  # number of VCF records between calls to the progress function of add_variants
 
 
 def add_dataset(database, dataset_dict, update=False):
@@ -50,7 +68,18 @@ def add_dataset(database, dataset_dict, update=False):
     return result.inserted_id
 
 
-def add_variants(database, vcf_obj, samples, assembly, dataset_id, nr_variants):
+def add_variants(
+    database,
+    vcf_obj,
+    samples,
+    assembly,
+    dataset_id,
+    nr_variants=None,
+    batch_size=BULK_WRITE_BATCH_SIZE,
+    region=None,
+    show_progress=True,
+    progress=None,
+):
     """Build variant objects from a cyvcf2 VCF iterator
 
     Accepts:
@@ -59,25 +88,44 @@ def add_variants(database, vcf_obj, samples, assembly, dataset_id, nr_variants):
         samples(set): set of samples to add variants for
         assembly(str): chromosome build
         dataset_id(str): dataset id
-        nr_variant(int): number of variants contained in VCF file
+        nr_variant(int): number of variants contained in VCF file, if known. Used to display progress only
+        batch_size(int): number of variants saved with each bulk write. If 0, variants are saved one at a time
+        region(str): parse only variants in a genomic region (i.e. "1" or "1:10000-20000"). Requires an indexed VCF
+        show_progress(bool): print parsing progress to the terminal
+        progress(func): function called every PROGRESS_INTERVAL records with the number of VCF records parsed and variants saved
     Returns:
-        inserted_vars, samples(tuple): (int,list)
+        inserted_vars, parsed_vars(tuple): (int,int) number of variants saved and number of VCF records parsed
 
     """
     LOG.info("Parsing variants..\n")
     new_samples = set()
 
     # Collect position to check genotypes for (only samples provided by user)
-    gt_positions = []
-    for i, sample in enumerate(vcf_obj.samples):
-        if sample in samples:
-            gt_positions.append(i)
+    gt_positions = np.array(
+        [i for i, sample in enumerate(vcf_obj.samples) if sample in samples], dtype=np.intp
+    )
 
     vcf_samples = vcf_obj.samples
 
     inserted_vars = 0
-    with Bar("Processing", max=nr_variants) as bar:
-        for vcf_variant in vcf_obj:
+    parsed_vars = 0
+    batch = []
+    # Progress is shown as a bar if the number of variants is known, otherwise as a counter
+    if show_progress is False:
+        progress_bar = Counter(file=None)
+    elif nr_variants:
+        progress_bar = Bar("Processing", max=nr_variants)
+    else:
+        progress_bar = Counter("Processing variant ")
+
+    records = vcf_obj(region) if region else vcf_obj
+
+    with progress_bar as bar:
+        for vcf_variant in records:
+            parsed_vars += 1
+            bar.next()
+            if progress and parsed_vars % PROGRESS_INTERVAL == 0:
+                progress(parsed_vars, inserted_vars)
             chrom = vcf_variant.CHROM.replace("chr", "")
             if chrom not in CHROMOSOMES:
                 LOG.warning(
@@ -85,57 +133,271 @@ def add_variants(database, vcf_obj, samples, assembly, dataset_id, nr_variants):
                 )
                 continue
 
-            # Check if variant was called in provided samples
-            sample_calls = variant_called(
-                vcf_samples, gt_positions, vcf_variant.gt_types
-            )
+            if len(vcf_variant.ALT) > 1:
+                # Split multi-allelic records into one variant for each alternate allele
+                alleles_calls = zip(
+                    vcf_variant.ALT,
+                    alleles_called(
+                        vcf_samples,
+                        gt_positions,
+                        vcf_variant.genotype.array(),
+                        len(vcf_variant.ALT),
+                    ),
+                )
+            else:
+                # Check if variant was called in provided samples
+                alleles_calls = [
+                    (
+                        "".join(vcf_variant.ALT),
+                        variant_called(vcf_samples, gt_positions, vcf_variant.gt_types),
+                    )
+                ]
+
+            for alt, sample_calls in alleles_calls:
+                if sample_calls == {} or alt == SPANNING_DELETION:
+                    continue  # allele was not called in samples of interest
+
+                parsed_variant = _parse_allele(
+                    vcf_variant, chrom, alt, multiallelic=len(vcf_variant.ALT) > 1
+                )
+                dataset_dict = {dataset_id: {"samples": sample_calls}}
+                # Create standard variant object with specific _id
+                variant = Variant(parsed_variant, dataset_dict, assembly)
 
-            if sample_calls == {}:
-                continue  # variant was not called in samples of interest
+                if batch_size:
+                    batch.append(variant)
+                    if len(batch) >= batch_size:
+                        inserted_vars += add_variants_bulk(database, batch, dataset_id)
+                        batch = []
+                else:
+                    # Load variant into database or update an existing one with new samples and dataset
+                    result = add_variant(
+                        database=database, variant=variant, dataset_id=dataset_id
+                    )
+                    if result is not None:
+                        inserted_vars += 1
 
-            parsed_variant = dict(
-                chromosome=chrom,
-                start=vcf_variant.start,  # 0-based coordinate
-                end=vcf_variant.end,  # 0-based coordinate
-                reference_bases=vcf_variant.REF,
-                alternate_bases=vcf_variant.ALT,
-            )
+    if batch:
+        inserted_vars += add_variants_bulk(database, batch, dataset_id)
 
-            if vcf_variant.var_type == "sv":
-                sv_type = vcf_variant.INFO["SVTYPE"]
-                parsed_variant["variant_type"] = sv_type
+    if progress:
+        progress(parsed_vars, inserted_vars)
 
-                alt = vcf_variant.ALT[0]
+    return inserted_vars, parsed_vars
 
-                # Check if a better variant end can be extracted from INFO field
-                end = sv_end(
-                    pos=vcf_variant.POS,
-                    alt=alt,
-                    svend=vcf_variant.INFO.get("END"),
-                    svlen=vcf_variant.INFO.get("SVLEN"),
-                )
-                parsed_variant["end"] = end
 
-                if sv_type == "BND":
-                    parsed_variant["mate_name"] = bnd_mate_name(alt, chrom)
+def _parse_allele(vcf_variant, chrom, alt, multiallelic=False):
+    """Collect the fields of a variant allele from a VCF record
+
+    Accepts:
+        vcf_variant(cyvcf2.Variant)
+        chrom(str): chromosome name, without "chr" prefix
+        alt(str): alternate allele
+        multiallelic(bool): True if the record has other alternate alleles. Alleles of multi-allelic records are trimmed
+
+    Returns:
+        parsed_variant(dict)
+    """
+    parsed_variant = dict(
+        chromosome=chrom,
+        start=vcf_variant.start,  # 0-based coordinate
+        end=vcf_variant.end,  # 0-based coordinate
+        reference_bases=vcf_variant.REF,
+        alternate_bases=alt,
+    )
+
+    if vcf_variant.var_type == "sv":
+        sv_type = vcf_variant.INFO["SVTYPE"]
+        parsed_variant["variant_type"] = sv_type
+
+        # Check if a better variant end can be extracted from INFO field
+        end = sv_end(
+            pos=vcf_variant.POS,
+            alt=alt,
+            svend=vcf_variant.INFO.get("END"),
+            svlen=vcf_variant.INFO.get("SVLEN"),
+        )
+        parsed_variant["end"] = end
+
+        if sv_type == "BND":
+            parsed_variant["mate_name"] = bnd_mate_name(alt, chrom)
+
+    elif multiallelic:
+        # Represent each allele with its minimal coordinates, as if it was found in a bi-allelic record
+        ref, alt, start, end = trim_alleles(vcf_variant.REF, alt, vcf_variant.start)
+        parsed_variant.update(
+            start=start, end=end, reference_bases=ref, alternate_bases=alt
+        )
+        parsed_variant["variant_type"] = allele_type(ref, alt)
+    else:
+        parsed_variant["variant_type"] = vcf_variant.var_type.upper()
+
+    return parsed_variant
+
+
+def add_variants_parallel(
+    db_uri,
+    db_name,
+    vcf_file,
+    samples,
+    assembly,
+    dataset_id,
+    workers,
+    batch_size=BULK_WRITE_BATCH_SIZE,
+):
+    """Save variants from an indexed VCF file using a pool of processes, each one parsing and saving the variants of a contig
+
+    Accepts:
+        db_uri(str): database connection string
+        db_name(str): database name
+        vcf_file(str): path to an indexed VCF file
+        samples(set): set of samples to add variants for
+        assembly(str): chromosome build
+        dataset_id(str): dataset id
+        workers(int): number of processes
+        batch_size(int): number of variants saved with each bulk write
+
+    Returns:
+        inserted_vars, parsed_vars(tuple): (int,int) number of variants saved and number of VCF records parsed
+    """
+    contigs = vcf_contigs(vcf_file)
+    LOG.info(f"Parsing variants from {len(contigs)} contigs using {workers} processes..")
+
+    inserted_vars = 0
+    parsed_vars = 0
+    # Processes are spawned, since database clients can't be shared with forked processes
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = {
+            executor.submit(
+                _add_contig_variants,
+                db_uri,
+                db_name,
+                vcf_file,
+                contig,
+                list(samples),
+                assembly,
+                dataset_id,
+                batch_size,
+            ): contig
+            for contig in contigs
+        }
+        for future in as_completed(futures):
+            inserted, parsed = future.result()
+            LOG.info(f"Contig {futures[future]}: {parsed} variants parsed, {inserted} saved")
+            inserted_vars += inserted
+            parsed_vars += parsed
+
+    return inserted_vars, parsed_vars
+
+
+def _add_contig_variants(
+    db_uri, db_name, vcf_file, contig, samples, assembly, dataset_id, batch_size
+):
+    """Save the variants of a contig of a VCF file. Executed by the processes of add_variants_parallel
+
+    Returns:
+        inserted_vars, parsed_vars(tuple): (int,int) number of variants saved and number of VCF records parsed
+    """
+    client = MongoClient(db_uri)
+    try:
+        return add_variants(
+            database=client[db_name],
+            vcf_obj=VCF(vcf_file, samples=samples),
+            samples=set(samples),
+            assembly=assembly,
+            dataset_id=dataset_id,
+            batch_size=batch_size,
+            region=contig,
+            show_progress=False,
+        )
+    finally:
+        client.close()
 
-            else:
-                parsed_variant["variant_type"] = vcf_variant.var_type.upper()
 
-            dataset_dict = {dataset_id: {"samples": sample_calls}}
-            # Create standard variant object with specific _id
-            variant = Variant(parsed_variant, dataset_dict, assembly)
+def add_variants_bulk(database, variants, dataset_id):
+    """Save a batch of variants using a single unordered bulk write, without reading them first
 
-            # Load variant into database or update an existing one with new samples and dataset
-            result = add_variant(
-                database=database, variant=variant, dataset_id=dataset_id
+    Each sample call is an upsert that inserts the variant if missing, or adds the sample
+    and increments the variant call_count if the sample is not already saved for the dataset.
+    Upserts for samples already saved fail with a duplicate key error and are ignored.
+    The dataset is then added to the dataset_list of the variants with at least one saved sample call,
+    so that variants are never listed in a dataset they have no samples for if a write fails.
+    Variant and allele counts of the dataset are incremented by the number of variants new to the dataset
+    and by the allele calls saved.
+
+    Accepts:
+        database(pymongo.database.Database)
+        variants(list): list of cgbeacon2.models.Variant
+        dataset_id(str): current dataset in use
+
+    Returns:
+        n_variants(int): number of variants inserted or updated with new samples
+    """
+    requests = []
+    request_variant_ids = []
+    request_alleles = []
+
+    for variant in variants:
+        # Variant fields saved only when a new document is created
+        new_variant_fields = {
+            key: value
+            for key, value in variant.__dict__.items()
+            if key not in ["_id", "datasetIds", "dataset_list", "call_count"]
+        }
+        for sample, value in variant.datasetIds[dataset_id]["samples"].items():
+            sample_key = ".".join(["datasetIds", dataset_id, "samples", sample])
+            requests.append(
+                UpdateOne(
+                    {"_id": variant._id, sample_key: {"$exists": False}},
+                    {
+                        "$setOnInsert": new_variant_fields,
+                        "$set": {sample_key: value},
+                        "$inc": {"call_count": value["allele_count"]},
+                    },
+                    upsert=True,
+                )
             )
-            if result is not None:
-                inserted_vars += 1
+            request_variant_ids.append(variant._id)
+            request_alleles.append(value["allele_count"])
 
-            bar.next()
+    if not requests:
+        return 0
 
-    return inserted_vars
+    failed_requests = set()
+    try:
+        database["variant"].bulk_write(requests, ordered=False)
+    except BulkWriteError as bwe:
+        for error in bwe.details.get("writeErrors", []):
+            if error.get("code") != DUPLICATE_KEY_ERROR:
+                LOG.error(f"Error while saving variant to database:{error.get('errmsg')}")
+            failed_requests.add(error["index"])
+
+    saved_variants = set()
+    saved_alleles = 0
+    for index, variant_id in enumerate(request_variant_ids):
+        if index in failed_requests:
+            continue
+        saved_variants.add(variant_id)
+        saved_alleles += request_alleles[index]
+
+    # Add dataset to the variants with saved samples not yet listed in this dataset (new ones included), and count them
+    new_ds_variants = 0
+    if saved_variants:
+        membership_requests = [
+            UpdateOne(
+                {"_id": variant_id, "dataset_list": {"$ne": dataset_id}},
+                {"$addToSet": {"dataset_list": dataset_id}},
+            )
+            for variant_id in saved_variants
+        ]
+        new_ds_variants = (
+            database["variant"].bulk_write(membership_requests, ordered=False).modified_count
+        )
+
+    update_dataset_counts(database, dataset_id, new_ds_variants, saved_alleles)
+    return len(saved_variants)
 
 
 def add_variant(database, variant, dataset_id):
@@ -159,6 +421,7 @@ def add_variant(database, variant, dataset_id):
         # insert variant into database
         variant.call_count = cumulative_allele_count(current_samples)
         result = database["variant"].insert_one(variant.__dict__)
+        update_dataset_counts(database, dataset_id, 1, variant.call_count)
         return result.inserted_id
 
     else:  # update pre-existing variant
@@ -166,13 +429,14 @@ def add_variant(database, variant, dataset_id):
             "datasetIds", {}
         )  # dictionary where dataset ids are keys
         allele_count = 0
+        new_ds_variant = dataset_id not in updated_datasets
         if dataset_id in updated_datasets:  # variant was already found in this dataset
             updated_samples = updated_datasets[dataset_id]["samples"]
             for sample, value in current_samples.items():
                 if sample not in updated_samples:
                     updated_samples[sample] = value
                     allele_count += value["allele_count"]
-            updated_datasets[dataset_id] = updated_samples
+            updated_datasets[dataset_id]["samples"] = updated_samples
         else:
             updated_datasets[dataset_id] = {"samples": current_samples}
             allele_count = cumulative_allele_count(current_samples)
@@ -184,12 +448,30 @@ def add_variant(database, variant, dataset_id):
                     "$set": {
                         "datasetIds": updated_datasets,  # this is actually updated now
                         "call_count": old_variant["call_count"] + allele_count,
-                    }
+                    },
+                    "$addToSet": {"dataset_list": dataset_id},
                 },
             )
+            update_dataset_counts(database, dataset_id, int(new_ds_variant), allele_count)
             return allele_count
 
 
+def update_dataset_counts(database, dataset_id, n_variants, n_alleles):
+    """Increment (or decrement, if negative numbers are provided) variant and allele counts of a dataset
+
+    Accepts:
+        database(pymongo.database.Database)
+        dataset_id(str): dataset id
+        n_variants(int): variants added to the dataset
+        n_alleles(int): allele calls added to the dataset
+    """
+    if n_variants == 0 and n_alleles == 0:
+        return
+    database["dataset"].update_one(
+        {"_id": dataset_id}, {"$inc": {"variant_count": n_variants, "allele_count": n_alleles}}
+    )
+
+
 def cumulative_allele_count(samples_obj):
     """Return cumulative allele count for each sample in a dictionary
 
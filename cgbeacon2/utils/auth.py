@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import logging
-import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import jwt  # https://github.com/jpadilla/pyjwt
 from authlib.jose import jwt as jjwt
@@ -23,45 +26,44 @@ from cgbeacon2.constants import (
     NO_GA4GH_USERDATA,
     PASSPORTS_ERROR,
 )
+from cgbeacon2.utils import http_client
+from cgbeacon2.utils.cache_backends import MemoryBackend
 
 LOG = logging.getLogger(__name__)
 GA4GH_SCOPES = ["openid", "ga4gh_passport_v1"]
 
+JWKS_CACHE_TTL = 3600  # seconds a public key set is used without refreshing it
+JWKS_CACHE_STALE_TTL = 86400  # seconds an expired key set can still be used while it is refreshed in background
+JWKS_KID_REFRESH_INTERVAL = 60  # min seconds between refreshes of a key set missing a requested key id
+JWKS_CACHE_SIZE = 100  # max number of cached key sets (one for each server url)
+PASSPORT_WORKERS = 8  # max number of threads downloading public keys and validating passports
+
 # Authentication code is based on:
 # https://elixir-europe.org/services/compute/aai
 
 
-def authlevel(request, oauth2_settings):
+def authlevel(request, oauth2_settings, token_cache=None):
     """Returns auth level from a request object
 
     Accepts:
         request(flask.request) request received by server
         oauth2_settings(dict) Elixie AAI Oauth2 settings (server, issuers, userinfo)
+        token_cache(cgbeacon2.utils.cache.TokenCache): cache of access levels of already validated tokens (optional)
 
     Returns:
         auth_level(tuple): ([],bool) == (controlled_access datasets, bona_fide_status)
 
     """
-    token = None
-
-    auth_level = (
-        [],
-        False,
-    )  # (controlled datasets the user has access to, bona fide status)
-
-    if "Authorization" not in request.headers:
-        return ([], False)
+    token = bearer_token(request.headers)
+    if not isinstance(token, str):  # no token (public access) or error
+        return token
 
-    try:
-        scheme, token = request.headers.get("Authorization").split(" ")
-    except ValueError:
-        return MISSING_TOKEN
-    if scheme != "Bearer":
-        return WRONG_SCHEME
-    elif token == "":
-        return MISSING_TOKEN
+    if token_cache is not None:
+        cached_auth_level = token_cache.get(token)
+        if cached_auth_level is not None:
+            return cached_auth_level
 
-    public_key = elixir_key(oauth2_settings["server"])
+    public_key = elixir_key(oauth2_settings["server"], token_kid(token))
     if public_key == MISSING_PUBLIC_KEY:
         return MISSING_PUBLIC_KEY
 
@@ -93,37 +95,402 @@ def authlevel(request, oauth2_settings):
         if auth_level == PASSPORTS_ERROR:
             return PASSPORTS_ERROR
 
-    except MissingClaimError as ex:
+        if token_cache is not None:
+            token_cache.set(token, auth_level, decoded_token.get("exp"))
+
+    except Exception as ex:
+        return token_error(ex)
+
+    return auth_level
+
+
+async def authlevel_async(headers, oauth2_settings, token_cache=None, http=None):
+    """Returns auth level from the headers of a request, without blocking the event loop.
+    Public keys and user info are downloaded with an asynchronous HTTP client, passports are validated in a thread
+
+    Accepts:
+        headers(werkzeug.datastructures.Headers): request headers
+        oauth2_settings(dict) Elixie AAI Oauth2 settings (server, issuers, userinfo)
+        token_cache(cgbeacon2.utils.cache.TokenCache): cache of access levels of already validated tokens (optional)
+        http(httpx.AsyncClient): asynchronous HTTP client
+
+    Returns:
+        auth_level(tuple): ([],bool) == (controlled_access datasets, bona_fide_status)
+    """
+    token = bearer_token(headers)
+    if not isinstance(token, str):  # no token (public access) or error
+        return token
+
+    if token_cache is not None:
+        cached_auth_level = token_cache.get(token)
+        if cached_auth_level is not None:
+            return cached_auth_level
+
+    server = oauth2_settings["server"]
+    await prefetch_keys(http, [(server, token_kid(token))])
+    public_key = JWKS_CACHE.cached(server)
+    if public_key is None:
+        return MISSING_PUBLIC_KEY
+
+    try:
+        decoded_token = jjwt.decode(token, public_key, claims_options=claims(oauth2_settings))
+        decoded_token.validate()  # validate the token contents
+        LOG.info(f'Identified as {decoded_token["sub"]} user by {decoded_token["iss"]}.')
+
+        # retrieve Elixir AAI passports associated to the user described by the auth token
+        all_passports = None
+        if ga4gh_scopes(decoded_token):
+            all_passports = await ga4gh_userdata_async(http, token, oauth2_settings.get("userinfo"))
+
+        if all_passports == NO_GA4GH_USERDATA:
+            return NO_GA4GH_USERDATA
+        elif all_passports is None:
+            return ([], False)
+
+        # download keys used to sign the passports, then validate passports in a thread
+        await prefetch_keys(http, passport_keys(all_passports))
+        auth_level = await asyncio.get_running_loop().run_in_executor(
+            None, check_passports, all_passports, oauth2_settings.get("bona_fide_requirements")
+        )
+
+        if auth_level == PASSPORTS_ERROR:
+            return PASSPORTS_ERROR
+
+        if token_cache is not None:
+            token_cache.set(token, auth_level, decoded_token.get("exp"))
+
+    except Exception as ex:
+        return token_error(ex)
+
+    return auth_level
+
+
+def bearer_token(headers):
+    """Return the auth token provided in the Authorization header of a request
+
+    Accepts:
+        headers(werkzeug.datastructures.Headers): request headers
+
+    Returns:
+        token(str), ([], False) if request has no Authorization header (public access) or an error
+    """
+    if "Authorization" not in headers:
+        return ([], False)
+
+    try:
+        scheme, token = headers.get("Authorization").split(" ")
+    except ValueError:
+        return MISSING_TOKEN
+    if scheme != "Bearer":
+        return WRONG_SCHEME
+    elif token == "":
+        return MISSING_TOKEN
+    return token
+
+
+def token_error(ex):
+    """Return the error corresponding to an exception raised while validating an auth token
+
+    Accepts:
+        ex(Exception)
+
+    Returns:
+        error(dict)
+    """
+    if isinstance(ex, MissingClaimError):
         return MISSING_TOKEN_CLAIMS
-    except InvalidClaimError as ex:
+    if isinstance(ex, InvalidClaimError):
         return INVALID_TOKEN_CLAIMS
-    except InvalidTokenError as ex:
+    if isinstance(ex, InvalidTokenError):
         return INVALID_TOKEN_AUTH
-    except ExpiredTokenError as ex:
+    if isinstance(ex, ExpiredTokenError):
         return EXPIRED_TOKEN_SIGNATURE
-    except Exception as ex:
-        return {"errorCode": 403, "errorMessage": str(ex)}
+    return {"errorCode": 403, "errorMessage": str(ex)}
+
+
+class KeySetCache:
+    """Cache of JSON Web Key Sets by server url.
+
+    A cached key set is used for `ttl` seconds. After that it is still returned for `stale_ttl` seconds,
+    while a fresh copy is downloaded in background. A key set not containing a requested key id (kid)
+    is downloaded again (at most every `kid_refresh_interval` seconds), to follow key rotations.
+    """
+
+    def __init__(
+        self,
+        ttl=JWKS_CACHE_TTL,
+        stale_ttl=JWKS_CACHE_STALE_TTL,
+        kid_refresh_interval=JWKS_KID_REFRESH_INTERVAL,
+        maxsize=JWKS_CACHE_SIZE,
+        backend=None,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.kid_refresh_interval = kid_refresh_interval
+        self.maxsize = maxsize
+        self.backend = backend or MemoryBackend(maxsize)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Remove all cached key sets"""
+        self.backend.clear("jwks:")
+
+    def _entry(self, server):
+        """Return the cached key set of a server with its download time
+
+        Returns:
+            entry(tuple): (key set, download time as seconds since epoch) or None
+        """
+        entry = self.backend.get("jwks:" + server)
+        if entry is None:
+            return None
+        key_set, downloaded = entry
+        return key_set, downloaded
+
+    def store(self, server, key_set):
+        """Save a key set to the cache, removing the least recently used one if cache is full"""
+        self.backend.set("jwks:" + server, (key_set, time.time()), ttl=self.ttl + self.stale_ttl)
+
+    def _download(self, server):
+        """Download a key set and save it in the cache
+
+        Returns:
+            key_set(dict) or MISSING_PUBLIC_KEY
+        """
+        key_set = download_key(server)
+        if key_set != MISSING_PUBLIC_KEY:
+            self.store(server, key_set)
+        return key_set
+
+    def _background_refresh(self, server):
+        """Download a key set in a separate thread, unless a download is already in progress"""
+
+        def refresh():
+            try:
+                self._download(server)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(server)
+
+        with self._lock:
+            if server in self._refreshing:
+                return
+            self._refreshing.add(server)
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def cached(self, server):
+        """Return the cached key set of a server, without downloading it
+
+        Accepts:
+            server(str): HTTP address of a server providing a public key set
+
+        Returns:
+            key_set(dict) or None if key set is missing or too old to be used
+        """
+        entry = self._entry(server)
+        if entry is None or time.time() - entry[1] >= self.ttl + self.stale_ttl:
+            return None
+        return entry[0]
+
+    def refresh_stale(self, server):
+        """Download again in background the key set of a server if it is older than `ttl` seconds but still usable
+
+        Accepts:
+            server(str): HTTP address of a server providing a public key set
+        """
+        entry = self._entry(server)
+        if entry is None:
+            return
+        age = time.time() - entry[1]
+        if self.ttl <= age < self.ttl + self.stale_ttl:
+            self._background_refresh(server)
+
+    def fresh(self, server, kid=None):
+        """Check if the key set of a server can be returned by get() without downloading it
+
+        Accepts:
+            server(str): HTTP address of a server providing a public key set
+            kid(str): id of the key that should be included in the key set
+
+        Returns:
+            bool
+        """
+        entry = self._entry(server)
+        if entry is None:
+            return False
+        key_set, downloaded = entry
+        age = time.time() - downloaded
+        if age >= self.ttl + self.stale_ttl:
+            return False
+        return not (kid and not _contains_kid(key_set, kid) and age >= self.kid_refresh_interval)
+
+    def get(self, server, kid=None):
+        """Return the key set provided by a server
+
+        Accepts:
+            server(str): HTTP address of a server providing a public key set
+            kid(str): id of the key that should be included in the key set
+
+        Returns:
+            key_set(dict) or MISSING_PUBLIC_KEY
+        """
+        entry = self._entry(server)
+        if entry is None:
+            return self._download(server)
+
+        key_set, downloaded = entry
+        age = time.time() - downloaded
+
+        if age >= self.ttl + self.stale_ttl:  # too old to be used
+            return self._download(server)
+
+        if kid and not _contains_kid(key_set, kid) and age >= self.kid_refresh_interval:
+            # Key might have been rotated, download key set again
+            new_key_set = self._download(server)
+            return key_set if new_key_set == MISSING_PUBLIC_KEY else new_key_set
+
+        if age >= self.ttl:  # stale key set, use it while refreshing it
+            self._background_refresh(server)
+
+        return key_set
+
+
+def _contains_kid(key_set, kid):
+    """Check if a key set contains a key with a given id
+
+    Accepts:
+        key_set(dict): a JSON Web Key Set or a single JSON Web Key
+        kid(str): key id
+
+    Returns:
+        bool
+    """
+    keys = key_set.get("keys", [key_set]) if isinstance(key_set, dict) else []
+    return any(isinstance(key, dict) and key.get("kid") == kid for key in keys)
 
-    return auth_level
 
+JWKS_CACHE = KeySetCache()
 
-def elixir_key(server):
-    """Retrieves Elixir AAI public key from Elixir JWK server
+
+def configure_key_cache(backend=None):
+    """Set up the backend of the public key set cache
+
+    Accepts:
+        backend(cgbeacon2.utils.cache_backends.RedisBackend): a shared cache backend. If None, key sets are cached in memory
+    """
+    JWKS_CACHE.backend = backend or MemoryBackend(JWKS_CACHE.maxsize)
+
+
+def token_kid(token):
+    """Return the id of the key used to sign a JWT token, read from its unverified header
+
+    Accepts:
+        token(str)
+
+    Returns:
+        kid(str) or None
+    """
+    try:
+        return jwt.get_unverified_header(token).get("kid")
+    except Exception:
+        return None
+
+
+def elixir_key(server, kid=None):
+    """Retrieves Elixir AAI public key from Elixir JWK server. Keys are cached by server url
 
     Accepts:
         server(str). HTTP address to an Elixir server providing public key
+        kid(str): id of the key used to sign the token to validate (optional)
+
+    Returns:
+        key(json) json content of the server response or Error
+    """
+    return JWKS_CACHE.get(server, kid)
+
+
+def download_key(server):
+    """Download a public key set from a JWK server
+
+    Accepts:
+        server(str). HTTP address to a server providing public key
 
     Returns:
         key(json) json content of the server response or Error
     """
     try:
-        r = requests.get(server)
+        r = http_client.get(server)
+        r.raise_for_status()
         return r.json()
 
     except Exception as ex:
         return MISSING_PUBLIC_KEY
 
 
+async def download_key_async(http, server):
+    """Download a public key set from a JWK server using an asynchronous HTTP client
+
+    Accepts:
+        http(httpx.AsyncClient)
+        server(str). HTTP address to a server providing public key
+
+    Returns:
+        key(json) json content of the server response or Error
+    """
+    try:
+        r = await http.get(server)
+        r.raise_for_status()
+        return r.json()
+
+    except Exception as ex:
+        LOG.warning(f"Could not download public key set from {server}:{ex}")
+        return MISSING_PUBLIC_KEY
+
+
+async def prefetch_keys(http, keys):
+    """Download concurrently the key sets missing from the key set cache, or too old to be used.
+    Stale key sets (older than the cache ttl) are used and refreshed in background
+
+    Accepts:
+        http(httpx.AsyncClient)
+        keys(iterable): (server, kid) tuples
+    """
+    servers = set()
+    for server, kid in keys:
+        if not server:
+            continue
+        if JWKS_CACHE.fresh(server, kid):
+            # a stale key set is used while it is refreshed, as with KeySetCache.get
+            JWKS_CACHE.refresh_stale(server)
+        else:
+            servers.add(server)
+    servers = sorted(servers)
+    key_sets = await asyncio.gather(*[download_key_async(http, server) for server in servers])
+    for server, key_set in zip(servers, key_sets):
+        if key_set != MISSING_PUBLIC_KEY:
+            JWKS_CACHE.store(server, key_set)
+
+
+def passport_keys(passports):
+    """Return the servers (jku) and key ids (kid) of the keys used to sign a list of passports
+
+    Accepts:
+        passports(list): encoded passports
+
+    Returns:
+        keys(set): (server, kid) tuples
+    """
+    keys = set()
+    for passport in passports:
+        try:
+            header = jwt.get_unverified_header(passport)
+        except Exception:
+            continue  # invalid passports are reported by check_passports
+        keys.add((header.get("jku"), header.get("kid")))
+    return keys
+
+
 def claims(oauth2_settings):
     """Set up web tokens claims options
 
@@ -176,16 +543,19 @@ def check_passports(passports, bona_fide_terms):
     except Exception as ex:
         return PASSPORTS_ERROR
 
+    # validate all passports at once, concurrently
+    validated = validate_passports(registered_passports + bona_fide_passports)
+
     # validate controlled passports and retrieve datasets user has access to
-    registered_datasets = get_ga4gh_registered_datasets(registered_passports)
+    registered_datasets = get_ga4gh_registered_datasets(registered_passports, validated)
 
     # validate bona fide passports and retrieve datasets user has access to
-    bona_fide_status = is_bona_fide(bona_fide_passports, bona_fide_terms)
+    bona_fide_status = is_bona_fide(bona_fide_passports, bona_fide_terms, validated)
 
     return (list(registered_datasets), bona_fide_status)
 
 
-def is_bona_fide(bona_fide_passports, bona_fide_terms):
+def is_bona_fide(bona_fide_passports, bona_fide_terms, validated=None):
     """Retrieve bona fide status based on provided passports
 
     Documentation from GA4GH: https://github.com/ga4gh-duri/ga4gh-duri.github.io/blob/master/researcher_ids/ga4gh_passport_v1.md#registered-access
@@ -193,6 +563,7 @@ def is_bona_fide(bona_fide_passports, bona_fide_terms):
     Accepts:
         bona_fide_passports(list): [ (passport(str), header, payload),.. ]
         bona_fide_terms(str): link to a document where the terms to be a bona fide researcher are stated
+        validated(dict): decoded passports returned by validate_passports. Passports are validated if not provided
 
     Returns:
         True or False
@@ -202,8 +573,11 @@ def is_bona_fide(bona_fide_passports, bona_fide_terms):
     etics = False
     status = False
 
+    if validated is None:
+        validated = validate_passports(bona_fide_passports)
+
     for passport in bona_fide_passports:
-        validated_status = validate_passport(passport)
+        validated_status = validated.get(passport[0])
         # check if passport is validated. If it's not, skip it
         if validated_status is None:
             continue
@@ -223,19 +597,23 @@ def is_bona_fide(bona_fide_passports, bona_fide_terms):
     return etics and status  # must be both True
 
 
-def get_ga4gh_registered_datasets(registered_passports):
+def get_ga4gh_registered_datasets(registered_passports, validated=None):
     """Retrieve registered datasets based on provided passports
 
     Accepts:
         registered_passports(list): [ (passport(str), header),.. ]
+        validated(dict): decoded passports returned by validate_passports. Passports are validated if not provided
 
     Returns:
         datasets(set): a set of controlled datasets the user has access to
     """
     LOG.info("Getting passport-specific datasets with registered access from GA4GH")
     datasets = set()
+    if validated is None:
+        validated = validate_passports(registered_passports)
+
     for registered in registered_passports:
-        validated_pass = validate_passport(registered)
+        validated_pass = validated.get(registered[0])
         if validated_pass is None:
             continue
         dataset = validated_pass.get("ga4gh_visa_v1", {}).get("value").split("/")[-1]
@@ -244,11 +622,72 @@ def get_ga4gh_registered_datasets(registered_passports):
     return datasets
 
 
-def validate_passport(passport):
+def validate_passports(passports):
+    """Validate a list of passports concurrently, using a bounded thread pool.
+    Identical passports are validated once and the public key set of each server (jku) is retrieved once,
+    before passports are validated
+
+    Accepts:
+        passports(list): [ (passport(str), header),.. ] or [ (passport(str), header, payload),.. ]
+
+    Returns:
+        validated(dict): decoded passport (or None if validation failed) by passport(str)
+    """
+    unique_passports = {}
+    for passport in passports:
+        unique_passports.setdefault(passport[0], passport[1])
+    if not unique_passports:
+        return {}
+
+    # Collect the ids of the keys required from each server
+    server_kids = {}
+    for header in unique_passports.values():
+        server_kids.setdefault(header.get("jku"), set()).add(header.get("kid"))
+
+    def server_key(server):
+        key_set = None
+        for kid in sorted(server_kids[server], key=str):
+            key_set = elixir_key(server, kid)
+        return key_set
+
+    def validate(item):
+        token, header = item
+        return token, validate_passport((token, header), key_sets[header.get("jku")])
+
+    if len(unique_passports) == 1:  # no need for threads
+        key_sets = {server: server_key(server) for server in server_kids}
+        return dict(map(validate, unique_passports.items()))
+
+    executor = passport_executor()
+    key_sets = dict(zip(server_kids, executor.map(server_key, server_kids)))
+    return dict(executor.map(validate, unique_passports.items()))
+
+
+_passport_executor = None
+_passport_executor_lock = threading.Lock()
+
+
+def passport_executor():
+    """Return the thread pool used to validate passports, creating it at first use
+
+    Returns:
+        executor(concurrent.futures.ThreadPoolExecutor)
+    """
+    global _passport_executor
+    with _passport_executor_lock:
+        if _passport_executor is None:
+            _passport_executor = ThreadPoolExecutor(
+                max_workers=PASSPORT_WORKERS, thread_name_prefix="passport"
+            )
+        return _passport_executor
+
+
+def validate_passport(passport, public_key=None):
     """Validate passport claims
 
     Accepts:
         passport(tuple) : ( passport(str), header ) or ( passport(str), header, payload )
+        public_key(dict): key set of the server that signed the passport. Retrieved from the passport jku if not provided
 
     """
     LOG.info("Validating passport")
@@ -259,7 +698,8 @@ def validate_passport(passport):
     claims_options = {"aud": {"essential": False}}
     try:
         # obtain public key for this passport
-        public_key = elixir_key(header.get("jku"))
+        if public_key is None:
+            public_key = elixir_key(header.get("jku"), header.get("kid"))
         # Try decoding the token using the public key
         decoded_passport = jjwt.decode(token, public_key, claims_options=claims_options)
         # And validating the signature
@@ -305,13 +745,8 @@ def ga4gh_passports(decoded_token, token, oauth2_settings):
     """
     passports = None
 
-    if "scope" not in decoded_token:
-        return passports
-
-    token_scopes = decoded_token["scope"].split(" ")
-
     # If token scopes does NOT overlap with GA4GH scopes, return
-    if not all(scope in token_scopes for scope in GA4GH_SCOPES):
+    if ga4gh_scopes(decoded_token) is False:
         return passports
 
     # Send a GET request to Elixir userifo endpoint, with token
@@ -323,6 +758,22 @@ def ga4gh_passports(decoded_token, token, oauth2_settings):
     return passports
 
 
+def ga4gh_scopes(decoded_token):
+    """Check if a token was issued with all the scopes required to retrieve GA4GH passports
+
+    Accepts:
+        decoded_token(dict): A JWT token's payload
+
+    Returns:
+        bool
+    """
+    if "scope" not in decoded_token:
+        return False
+
+    token_scopes = decoded_token["scope"].split(" ")
+    return all(scope in token_scopes for scope in GA4GH_SCOPES)
+
+
 def ga4gh_userdata(token, elixir_oidc):
     """Sends a request to the Elixir OIDC Broker to retrieve user info (permissions)
 
@@ -338,10 +789,31 @@ def ga4gh_userdata(token, elixir_oidc):
     headers = {"Authorization": f"Bearer {token}"}
     passport_info = None
     try:
-        resp = requests.get(elixir_oidc, headers=headers)
+        resp = http_client.get(elixir_oidc, headers=headers)
         data = resp.json()
         passport_info = data.get("ga4gh_passport_v1")
     except Exception as ex:
         return NO_GA4GH_USERDATA
 
     return passport_info
+
+
+async def ga4gh_userdata_async(http, token, elixir_oidc):
+    """Sends a request to the Elixir OIDC Broker to retrieve user info (permissions) using an asynchronous HTTP client
+
+    Accepts:
+        http(httpx.AsyncClient)
+        token(str): token provided by initial request
+        elixir_oidc(str): url to Elixir OIDC broker
+
+    Returns:
+        passport_info(list)
+    """
+    LOG.info("Sending a request to Elixir AAI to get userinfo associated to token")
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        resp = await http.get(elixir_oidc, headers=headers)
+        return resp.json().get("ga4gh_passport_v1")
+    except Exception as ex:
+        LOG.warning(f"Could not retrieve user info from {elixir_oidc}:{ex}")
+        return NO_GA4GH_USERDATA
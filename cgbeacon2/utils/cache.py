@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import pymongo
+
+from cgbeacon2.utils.cache_backends import MemoryBackend
+
+LOG = logging.getLogger(__name__)
+
+SNAPSHOT_TTL = 86400  # seconds a dataset registry snapshot is kept in a shared cache backend
+QUERY_CACHE_TTL = 3600  # seconds a query response is kept in cache
+
+
+class DatasetRegistry:
+    """In-process cache of the datasets saved in the database.
+
+    Datasets are reloaded whenever a new event is registered in the event collection
+    (every change to datasets and variants is recorded as an event) or the number of datasets changes.
+    The database is checked for changes at most once every `ttl` seconds.
+    With a shared cache backend, datasets reloaded by one app process are reused by the others.
+    """
+
+    def __init__(self, ttl=0, backend=None):
+        self.ttl = ttl
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._signal = None
+        self._checked = 0
+
+    def invalidate(self):
+        """Force a reload of the datasets at next access"""
+        with self._lock:
+            self._snapshot = None
+            self._signal = None
+
+    def _change_signal(self, database):
+        """Return a value that changes whenever datasets or variants are modified
+
+        Accepts:
+            database(pymongo.database.Database)
+
+        Returns:
+            signal(tuple): (number of events, last event id, number of datasets)
+        """
+        last_event = database["event"].find_one(
+            {}, {"_id": 1}, sort=[("created", pymongo.DESCENDING)]
+        )
+        last_event_id = last_event["_id"] if last_event else None
+        return (
+            database["event"].estimated_document_count(),
+            last_event_id,
+            database["dataset"].estimated_document_count(),
+        )
+
+    def _load(self, database):
+        """Collect datasets and event dates from the database
+
+        Accepts:
+            database(pymongo.database.Database)
+
+        Returns:
+            snapshot(dict)
+        """
+        LOG.info("Loading datasets into the dataset registry")
+        datasets = {ds["_id"]: ds for ds in database["dataset"].find()}
+
+        by_authlevel = dict(public=[], registered=[], controlled=[])
+        for ds_id, ds in datasets.items():
+            by_authlevel.setdefault(ds.get("authlevel"), []).append(ds_id)
+
+        event_dates = {}
+        for key, order in [("first", pymongo.ASCENDING), ("last", pymongo.DESCENDING)]:
+            event = database["event"].find_one({}, {"created": 1}, sort=[("created", order)])
+            event_dates[key] = event.get("created") if event else None
+
+        return dict(
+            datasets=datasets,
+            by_authlevel=by_authlevel,
+            first_event=event_dates["first"],
+            last_event=event_dates["last"],
+        )
+
+    def _shared_load(self, database, version):
+        """Return the datasets saved in the cache backend for a database version, or load them from the database
+
+        Accepts:
+            database(pymongo.database.Database)
+            version(str): string computed from the database change signal
+
+        Returns:
+            snapshot(dict)
+        """
+        key = f"datasets:{version}"
+        snapshot = self.backend.get(key) if self.backend is not None else None
+        if snapshot is None:
+            snapshot = self._load(database)
+            snapshot["version"] = version
+            if self.backend is not None:
+                self.backend.set(key, snapshot, ttl=SNAPSHOT_TTL)
+        return snapshot
+
+    def snapshot(self, database):
+        """Return the cached datasets, reloading them if database was modified.
+        The returned objects are shared and should not be modified.
+
+        Accepts:
+            database(pymongo.database.Database)
+
+        Returns:
+            snapshot(dict): with keys
+                datasets(dict): dataset objects by dataset id
+                by_authlevel(dict): list of dataset ids for each authlevel (public, registered, controlled)
+                first_event(datetime.datetime): date of the first event registered in the database
+                last_event(datetime.datetime): date of the last event registered in the database
+                version(str): changes whenever datasets or variants are modified
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot is not None and now - self._checked < self.ttl:
+                return self._snapshot
+
+            signal = self._change_signal(database)
+            if self._snapshot is None or signal != self._signal:
+                version = "-".join(str(value) for value in signal)
+                self._snapshot = self._shared_load(database, version)
+                self._signal = signal
+            self._checked = now
+            return self._snapshot
+
+    def datasets(self, database):
+        """Return all datasets by dataset id
+
+        Accepts:
+            database(pymongo.database.Database)
+
+        Returns:
+            datasets(dict)
+        """
+        return self.snapshot(database)["datasets"]
+
+    def dataset_ids(self, database, authlevel):
+        """Return the ids of the datasets with a given access level
+
+        Accepts:
+            database(pymongo.database.Database)
+            authlevel(str): public, registered or controlled
+
+        Returns:
+            dataset_ids(list)
+        """
+        return self.snapshot(database)["by_authlevel"].get(authlevel, [])
+
+
+class InfoCache:
+    """Pre-serialized beacon info document, rebuilt only when the dataset registry reloads its datasets.
+
+    The ETag of the document is a hash of its content and its Last-Modified date is the date
+    of the latest event saved in the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._entry = None
+
+    def invalidate(self):
+        """Force a rebuild of the info document at next access"""
+        with self._lock:
+            self._snapshot = None
+            self._entry = None
+
+    def get(self, snapshot, build):
+        """Return the info document built from a dataset registry snapshot
+
+        Accepts:
+            snapshot(dict): datasets and events info returned by DatasetRegistry.snapshot
+            build(func): function returning the serialized info document (bytes)
+
+        Returns:
+            entry(tuple): (document(bytes), etag(str), last_modified(datetime.datetime))
+        """
+        with self._lock:
+            if self._entry is None or self._snapshot is not snapshot:
+                body = build()
+                etag = hashlib.md5(body).hexdigest()
+                self._entry = (body, etag, snapshot["last_event"])
+                self._snapshot = snapshot
+            return self._entry
+
+
+class QueryCache:
+    """Bounded LRU cache of allele query responses.
+
+    Responses are cached together with the version of the dataset registry snapshot they were computed from,
+    so that a new event saved in the database makes all cached responses obsolete.
+    Obsolete responses are removed from in-memory backends and expire after `ttl` seconds in shared backends,
+    which keep max `maxsize` responses too.
+    """
+
+    def __init__(self, maxsize=1000, ttl=QUERY_CACHE_TTL, backend=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend or MemoryBackend(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(mongo_query, response_type, datasets, dataset_filter):
+        """Return the cache key of an allele query
+
+        Accepts:
+            mongo_query(dict): a query dictionary
+            response_type(str): ALL, HIT, MISS or NONE
+            datasets(list): dataset ids from request "datasetIds" field
+            dataset_filter(set): ids of the datasets the user has access to
+
+        Returns:
+            key(str)
+        """
+        normalized = json.dumps(
+            [mongo_query, response_type, sorted(set(datasets)), sorted(dataset_filter)],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def get(self, snapshot, key):
+        """Return the response cached for a query
+
+        Accepts:
+            snapshot(dict): dataset registry snapshot used to answer the query
+            key(str): query key
+
+        Returns:
+            response(tuple): (allele_exists(bool), datasetAlleleResponses(list)) or None
+        """
+        version = snapshot["version"]
+        with self._lock:
+            if version != self._version:  # database was modified
+                if not self.backend.shared:
+                    self.backend.clear("query:")
+                self._version = version
+
+        response = self.backend.get(f"query:{version}:{key}")
+        with self._lock:
+            if response is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        exists, ds_allele_responses = response
+        return exists, ds_allele_responses
+
+    def set(self, snapshot, key, response):
+        """Save the response to a query. Responses computed from an outdated registry snapshot are not saved.
+        The saved response is shared and should not be modified.
+
+        Accepts:
+            snapshot(dict): dataset registry snapshot used to answer the query
+            key(str): query key
+            response(tuple): (allele_exists(bool), datasetAlleleResponses(list))
+        """
+        if self.maxsize <= 0:
+            return
+        version = snapshot["version"]
+        cache_key = f"query:{version}:{key}"
+        with self._lock:
+            if version != self._version:
+                return
+            if not self.backend.shared:
+                # saved under the lock, so that the backend can't be cleared by get() in the meantime
+                self.backend.set(cache_key, response, ttl=self.ttl)
+                return
+        # shared backends keep max `maxsize` responses, removing the oldest ones
+        self.backend.set(
+            cache_key, response, ttl=self.ttl, index="query:index", maxsize=self.maxsize
+        )
+
+    def clear(self):
+        """Remove all cached responses"""
+        self.backend.clear("query:")
+
+    def stats(self):
+        """Return cache usage counters
+
+        Returns:
+            stats(dict): hits, misses and number of cached responses (None for shared backends)
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=self.backend.size("query:"))
+
+
+class TokenCache:
+    """Bounded LRU cache of the access levels granted to auth tokens.
+
+    Tokens are stored as SHA-256 hashes. A cached access level expires after `ttl` seconds
+    or when the token itself expires (`exp` claim), whatever comes first.
+    """
+
+    def __init__(self, maxsize=1000, ttl=300, backend=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend or MemoryBackend(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return "token:" + hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token):
+        """Return the access level cached for a token
+
+        Accepts:
+            token(str)
+
+        Returns:
+            auth_level(tuple): (registered access datasets(list), bona_fide_status(bool)) or None
+        """
+        entry = self.backend.get(self._key(token))  # [registered datasets, bona fide status, expiry time]
+        with self._lock:
+            if entry is None or entry[2] <= time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+        registered_datasets, bona_fide, _ = entry
+        return (list(registered_datasets), bona_fide)
+
+    def set(self, token, auth_level, token_exp=None):
+        """Save the access level granted to a token
+
+        Accepts:
+            token(str)
+            auth_level(tuple): (registered access datasets(list), bona_fide_status(bool))
+            token_exp(int): token expiration time, as seconds since epoch
+        """
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        now = time.time()
+        expiry = now + self.ttl
+        if token_exp is not None:
+            expiry = min(expiry, token_exp)
+        if expiry <= now:
+            return
+        registered_datasets, bona_fide = auth_level
+        self.backend.set(
+            self._key(token), (tuple(registered_datasets), bona_fide, expiry), ttl=expiry - now
+        )
+
+    def clear(self):
+        """Remove all cached tokens"""
+        self.backend.clear("token:")
+
+    def stats(self):
+        """Return cache usage counters
+
+        Returns:
+            stats(dict): hits, misses and number of cached tokens (None for shared backends)
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=self.backend.size("token:"))
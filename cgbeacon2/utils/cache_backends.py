@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""Storage backends of the app caches (datasets, public key sets, token access levels and query responses).
+
+Every backend provides the same methods: get(key), set(key, value, ttl, index, maxsize), delete(key), clear(prefix)
+and size(prefix).
+Shared backends also provide increment(key, amounts) and counts(key), used to aggregate the metrics of all app processes.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from bson import json_util
+
+LOG = logging.getLogger(__name__)
+
+JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)  # return dates as saved in database
+
+
+class MemoryBackend:
+    """In-process LRU cache backend, with max `maxsize` entries. Each app process keeps its own copy of the cached values"""
+
+    shared = False
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key: (value, expiry time)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value saved with a key
+
+        Accepts:
+            key(str)
+
+        Returns:
+            value or None if key is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expiry = entry
+            if expiry is not None and expiry <= time.time():
+                self._entries.pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, index=None, maxsize=None):
+        """Save a value, removing the least recently used one if cache is full
+
+        Accepts:
+            key(str)
+            value: any object. Saved objects are shared and should not be modified
+            ttl(float): seconds before the value expires (optional)
+            index(str), maxsize(int): not used, the number of values is limited by the backend maxsize
+        """
+        if self.maxsize <= 0:
+            return
+        expiry = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expiry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove a key from the cache"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self, prefix=""):
+        """Remove all keys starting with a prefix"""
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._entries.pop(key)
+
+    def size(self, prefix=""):
+        """Return the number of keys starting with a prefix
+
+        Returns:
+            size(int)
+        """
+        with self._lock:
+            return sum(1 for key in self._entries if key.startswith(prefix))
+
+
+class RedisBackend:
+    """Cache backend saving values in a Redis server (or any server supporting the Redis protocol).
+    Cached values are shared by all app processes connected to the same server and survive app restarts.
+
+    Values are serialized as MongoDB extended JSON, so tuples are returned as lists.
+    Errors connecting to the server are logged and handled as cache misses.
+    """
+
+    shared = True
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="cgbeacon2:", client=None):
+        if client is None:
+            import redis  # optional dependency: pip install cgbeacon2[redis]
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        """Return the value saved with a key
+
+        Accepts:
+            key(str)
+
+        Returns:
+            value or None if key is missing, expired or server could not be reached
+        """
+        try:
+            serialized = self.client.get(self.prefix + key)
+        except Exception as ex:
+            LOG.warning(f"Could not read key '{key}' from Redis cache:{ex}")
+            return None
+        if serialized is None:
+            return None
+        return json_util.loads(serialized, json_options=JSON_OPTIONS)
+
+    def set(self, key, value, ttl=None, index=None, maxsize=None):
+        """Save a value
+
+        Accepts:
+            key(str)
+            value: any object that can be serialized as MongoDB extended JSON
+            ttl(float): seconds before the value expires (optional)
+            index(str): key of a sorted set collecting the keys of a group of values, by saving time (optional)
+            maxsize(int): max number of values of the index group. The oldest values are removed (optional)
+        """
+        expiry_ms = max(int(ttl * 1000), 1) if ttl is not None else None
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            pipeline.set(
+                self.prefix + key, json_util.dumps(value, json_options=JSON_OPTIONS), px=expiry_ms
+            )
+            if index is not None:
+                pipeline.zadd(self.prefix + index, {self.prefix + key: time.time()})
+                if expiry_ms is not None:  # index expires with its last value
+                    pipeline.pexpire(self.prefix + index, expiry_ms)
+                pipeline.zcard(self.prefix + index)
+            results = pipeline.execute()
+
+            excess = results[-1] - maxsize if index is not None and maxsize else 0
+            if excess > 0:
+                oldest = self.client.zpopmin(self.prefix + index, excess)
+                self.client.delete(*[old_key for old_key, _ in oldest])
+        except Exception as ex:
+            LOG.warning(f"Could not save key '{key}' to Redis cache:{ex}")
+
+    def delete(self, key):
+        """Remove a key from the cache"""
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as ex:
+            LOG.warning(f"Could not remove key '{key}' from Redis cache:{ex}")
+
+    def clear(self, prefix=""):
+        """Remove all keys starting with a prefix"""
+        try:
+            keys = list(self.client.scan_iter(match=self.prefix + prefix + "*"))
+            if keys:
+                self.client.delete(*keys)
+        except Exception as ex:
+            LOG.warning(f"Could not clear Redis cache:{ex}")
+
+    def increment(self, key, amounts):
+        """Add amounts to the fields of a counter, with a single request to the server
+
+        Accepts:
+            key(str)
+            amounts(dict): amounts (int or float) to add, by field name
+
+        Returns:
+            bool: True if the counter was updated
+        """
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for field, amount in amounts.items():
+                pipeline.hincrbyfloat(self.prefix + key, field, amount)
+            pipeline.execute()
+        except Exception as ex:
+            LOG.warning(f"Could not update counter '{key}' in Redis cache:{ex}")
+            return False
+        return True
+
+    def counts(self, key):
+        """Return the fields of a counter
+
+        Accepts:
+            key(str)
+
+        Returns:
+            counts(dict): field names as keys and float values as values. Empty if server could not be reached
+        """
+        try:
+            fields = self.client.hgetall(self.prefix + key)
+        except Exception as ex:
+            LOG.warning(f"Could not read counter '{key}' from Redis cache:{ex}")
+            return {}
+        return {field.decode("utf-8"): float(value) for field, value in fields.items()}
+
+    def size(self, prefix=""):
+        """Number of keys is not collected, as it would require scanning all keys of the server
+
+        Returns:
+            None
+        """
+        return None
+
+
+def create_backend(settings=None):
+    """Create the cache backend shared by the app caches
+
+    Accepts:
+        settings(dict): CACHE_BACKEND config param. Key "type" (memory or redis) and, for redis, keys "url" and "prefix"
+
+    Returns:
+        backend(RedisBackend) or None if every cache should keep its own in-memory backend
+    """
+    settings = dict(settings or {})
+    backend_type = settings.pop("type", "memory")
+    if backend_type == "memory":
+        return None
+    if backend_type == "redis":
+        LOG.info("Using Redis cache backend")
+        return RedisBackend(**settings)
+    raise ValueError(f"Unknown cache backend type:{backend_type}")
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 import logging
 
+from pymongo import UpdateOne
+
+from cgbeacon2.constants import BULK_WRITE_BATCH_SIZE
+from cgbeacon2.utils.add import update_dataset_counts
+
 LOG = logging.getLogger(__name__)
 
 
@@ -22,12 +27,16 @@ def delete_genes(collection, build="GRCh37"):
     return result.deleted_count
 
 
-def delete_dataset(database, id):
-    """Delete a dataset from dataset collection
+def delete_dataset(database, id, batch_size=BULK_WRITE_BATCH_SIZE):
+    """Delete a dataset from dataset collection, together with its variants
+
+    Variants are removed or updated with delete_dataset_variants before the dataset document is deleted,
+    so that no variant is left pointing to a dataset that doesn't exist.
 
     Accepts:
         database(pymongo.database.Database)
         id(str): dataset id
+        batch_size(int): number of variants deleted or updated by each database operation. If 0, all at once
 
     Returns:
         result.deleted(int): number of deleted documents
@@ -36,6 +45,7 @@ def delete_dataset(database, id):
     collection = "dataset"
 
     try:
+        delete_dataset_variants(database, id, batch_size)
         result = database[collection].delete_one({"_id": id})
     except Exception as err:
         LOG.error(err)
@@ -43,79 +53,123 @@ def delete_dataset(database, id):
     return result.deleted_count
 
 
-def delete_variants(database, ds_id, samples):
-    """Delete variants for one or more samples
+def delete_dataset_variants(database, ds_id, batch_size=BULK_WRITE_BATCH_SIZE, progress=None):
+    """Remove all variants of a dataset
+
+    Variants found only in this dataset are deleted, variants shared with other datasets are updated
+    by removing the dataset and decreasing their call_count by the allele calls of its samples.
+    When batch_size is set, variants are handled in chunks of batch_size documents: every chunk removes
+    the processed variants from the dataset, so an interrupted run can be resumed by running it again.
 
     Accepts:
         database(pymongo.database.Database)
         ds_id(str): dataset id
-        samples(tuple): name of samples in this dataset
+        batch_size(int): number of variants deleted or updated by each database operation. If 0, all at once
+        progress(func): function called after each chunk with the number of variants processed and modified
 
     Returns:
         n_updated, n_removed(tuple): number of variants updated/removed from database
     """
+    collection = database["variant"]
+    ds_key = ".".join(["datasetIds", ds_id])
     n_updated = 0
     n_removed = 0
-    query = {"$or": []}
-
-    sample_list = list(samples)
-    for sample in sample_list:
-        nested_doc_id = ".".join(["datasetIds", ds_id, "samples", sample])
-        query["$or"].append({nested_doc_id: {"$exists": True}})
 
-    results = database["variant"].find(query)
-    for res in results:
-        updated, removed = delete_variant(database, ds_id, res, sample_list)
-        if updated is True:
-            n_updated += 1
-        if removed is True:
-            n_removed += 1
+    # Variants found only in this dataset
+    only_ds_query = {"dataset_list": [ds_id]}
+    while True:
+        if batch_size:
+            variant_ids = [
+                variant["_id"]
+                for variant in collection.find(only_ds_query, {"_id": 1}).limit(batch_size)
+            ]
+            if not variant_ids:
+                break
+            deleted = collection.delete_many(
+                {"_id": {"$in": variant_ids}, **only_ds_query}
+            ).deleted_count
+        else:
+            deleted = collection.delete_many(only_ds_query).deleted_count
+        if deleted == 0:
+            break
+        n_removed += deleted
+        if progress:
+            progress(n_updated + n_removed, n_updated + n_removed)
+
+    # Variants found also in other datasets
+    while True:
+        cursor = collection.find({"dataset_list": ds_id}, {ds_key: 1})
+        if batch_size:
+            cursor = cursor.limit(batch_size)
+        requests = []
+        for variant in cursor:
+            ds_samples = variant.get("datasetIds", {}).get(ds_id, {}).get("samples", {})
+            requests.append(
+                UpdateOne(
+                    {"_id": variant["_id"], "dataset_list": ds_id},
+                    {
+                        "$unset": {ds_key: ""},
+                        "$pull": {"dataset_list": ds_id},
+                        "$inc": {
+                            "call_count": -sum(
+                                sample["allele_count"] for sample in ds_samples.values()
+                            )
+                        },
+                    },
+                )
+            )
+        if not requests:
+            break
+        n_updated += collection.bulk_write(requests, ordered=False).modified_count
+        if progress:
+            progress(n_updated + n_removed, n_updated + n_removed)
 
     return n_updated, n_removed
 
 
-def delete_variant(database, dataset_id, variant, samples):
-    """Delete one variant from database or just update the samples having it
+def delete_variants(database, ds_id, samples):
+    """Delete variants for one or more samples using a few server-side bulk updates
+
+    For each sample and each allele count saved for it, the sample is unset from all its variants
+    and the allele count is subtracted from the variants call_count with a single update_many.
+    Variants left without samples in the dataset are then removed from the dataset, or deleted
+    if they are not found in other datasets.
+    Variant and allele counts of the dataset are decremented by the number of variants removed from the dataset
+    and by the allele calls removed.
 
     Accepts:
         database(pymongo.database.Database)
-        dataset_id(str): dataset id
-        variant(dict): one variant
-        samples(list) : list of samples to remove this variant for
+        ds_id(str): dataset id
+        samples(tuple): name of samples in this dataset
 
     Returns:
-        (updated, removed)(tuple of bool): if variant was updated or removed
-
+        n_updated, n_removed(tuple): number of variants updated/removed from database
     """
-    updated = False
-    removed = False
-
-    # {sample1:{allele_count:2}, sample2:{allele_count:1}, ..}
-    dataset_samples = variant["datasetIds"][dataset_id].get("samples", {})
-
-    remove_allele_count = 0
-    for sample in samples:  # loop over the samples to remove
-        if sample in dataset_samples:
-            remove_allele_count += dataset_samples[sample]["allele_count"]
-            dataset_samples.pop(sample)
-
-    # If there are still samples in database with this variant
-    # Keep variant and update the list of samples
-    if dataset_samples != {}:
-        results = database["variant"].find_one_and_update(
-            {"_id": variant["_id"]},
-            {
-                "$set": {
-                    ".".join(["datasetIds", dataset_id, "samples"]): dataset_samples,
-                    "call_count": variant["call_count"] - remove_allele_count,
-                }
-            },
-        )
-        if results is not None:
-            updated = True
-    else:  # No samples in database with this variant, remove it
-        results = database["variant"].find_one_and_delete({"_id": variant["_id"]})
-        if results is not None:
-            removed = True
-
-    return updated, removed
+    collection = database["variant"]
+    sample_keys = [".".join(["datasetIds", ds_id, "samples", sample]) for sample in samples]
+    n_variants = collection.count_documents(
+        {"dataset_list": ds_id, "$or": [{key: {"$exists": True}} for key in sample_keys]}
+    )
+    if n_variants == 0:
+        return 0, 0
+
+    removed_alleles = 0
+    for sample_key in sample_keys:
+        allele_key = ".".join([sample_key, "allele_count"])
+        for allele_count in collection.distinct(allele_key, {"dataset_list": ds_id}):
+            result = collection.update_many(
+                {"dataset_list": ds_id, allele_key: allele_count},
+                {"$unset": {sample_key: ""}, "$inc": {"call_count": -allele_count}},
+            )
+            removed_alleles += allele_count * result.modified_count
+
+    # Variants no longer found in any sample of the dataset
+    ds_samples_key = ".".join(["datasetIds", ds_id, "samples"])
+    n_removed = collection.delete_many({"dataset_list": [ds_id], ds_samples_key: {}}).deleted_count
+    n_left_ds = collection.update_many(
+        {"dataset_list": ds_id, ds_samples_key: {}},
+        {"$unset": {".".join(["datasetIds", ds_id]): ""}, "$pull": {"dataset_list": ds_id}},
+    ).modified_count
+
+    update_dataset_counts(database, ds_id, -(n_removed + n_left_ds), -removed_alleles)
+    return n_variants - n_removed, n_removed
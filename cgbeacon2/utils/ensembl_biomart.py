@@ -1,6 +1,7 @@
 """Code for downloading all genes with coordinates from Ensembl Biomart"""
 import logging
-import requests
+
+from cgbeacon2.utils import http_client
 
 BIOMART_37 = "http://grch37.ensembl.org/biomart/martservice?query="
 BIOMART_38 = "http://ensembl.org/biomart/martservice?query="
@@ -108,7 +109,7 @@ class EnsemblBiomartClient:
         """
         url = "".join([self.server, self.xml])
         try:
-            with requests.get(url, stream=True) as r:
+            with http_client.get(url, stream=True) as r:
                 for line in r.iter_lines():
                     yield line.decode("utf-8")
         except Exception as ex:
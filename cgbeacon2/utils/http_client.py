@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Shared HTTP session used for all requests sent to external services (OAuth2/OIDC servers, Ensembl Biomart)"""
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = dict(
+    timeout=(5, 30),  # seconds: (connect timeout, read timeout)
+    retries=3,  # max number of retries for failed connections and retriable error responses
+    backoff_factor=0.5,  # sleep between retries: backoff_factor * 2^(retry number - 1) seconds
+    pool_connections=10,  # number of hosts to keep connection pools for
+    pool_maxsize=10,  # max number of connections kept alive for each host
+)
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+_session = None
+_settings = dict(DEFAULT_SETTINGS)
+_lock = threading.Lock()
+
+
+def _create_session(settings):
+    """Create a requests session with connection pooling and retries
+
+    Accepts:
+        settings(dict): HTTP client settings (see DEFAULT_SETTINGS)
+
+    Returns:
+        session(requests.Session)
+    """
+    retry = Retry(
+        total=settings["retries"],
+        backoff_factor=settings["backoff_factor"],
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=["HEAD", "GET", "OPTIONS"],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings["pool_connections"],
+        pool_maxsize=settings["pool_maxsize"],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def configure(settings=None):
+    """Set up the shared HTTP session
+
+    Accepts:
+        settings(dict): HTTP client settings overriding DEFAULT_SETTINGS (from the HTTP_CLIENT config param)
+    """
+    global _session, _settings
+    new_settings = dict(DEFAULT_SETTINGS)
+    new_settings.update(settings or {})
+    with _lock:
+        old_session = _session
+        _settings = new_settings
+        _session = _create_session(new_settings)
+    if old_session is not None:
+        old_session.close()
+
+
+def session():
+    """Return the shared HTTP session, creating it with default settings if it doesn't exist
+
+    Returns:
+        session(requests.Session)
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _create_session(_settings)
+        return _session
+
+
+def get(url, **kwargs):
+    """Send a GET request using the shared HTTP session. The configured timeout is used unless provided
+
+    Accepts:
+        url(str)
+        kwargs: any other parameter accepted by requests.Session.get
+
+    Returns:
+        response(requests.Response)
+    """
+    kwargs.setdefault("timeout", _settings["timeout"])
+    return session().get(url, **kwargs)
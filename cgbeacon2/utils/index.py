@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from cgbeacon2.constants import INDEXES
+
+LOG = logging.getLogger(__name__)
+
+
+def _collections(collections=None):
+    """Return the names of the collections to handle indexes for
+
+    Accepts:
+        collections(list): collection names or None (all collections with a declared index set)
+
+    Returns:
+        collections(list)
+    """
+    if not collections:
+        return list(INDEXES.keys())
+    return [collection for collection in collections if collection in INDEXES]
+
+
+def create_indexes(database, collections=None):
+    """Create the declared indexes for one or more database collections
+
+    Accepts:
+        database(pymongo.database.Database)
+        collections(list): collection names or None (all collections)
+
+    Returns:
+        created(dict): collection names as keys and list of created index names as values
+    """
+    created = {}
+    for collection in _collections(collections):
+        LOG.info(f"Creating indexes for collection '{collection}'")
+        created[collection] = database[collection].create_indexes(INDEXES[collection])
+    return created
+
+
+def drop_indexes(database, collections=None):
+    """Drop the declared indexes for one or more database collections
+
+    Accepts:
+        database(pymongo.database.Database)
+        collections(list): collection names or None (all collections)
+
+    Returns:
+        dropped(dict): collection names as keys and list of dropped index names as values
+    """
+    dropped = {}
+    for collection in _collections(collections):
+        existing = database[collection].index_information()
+        dropped[collection] = []
+        for index in INDEXES[collection]:
+            index_name = index.document["name"]
+            if index_name not in existing:
+                continue
+            LOG.info(f"Dropping index '{index_name}' from collection '{collection}'")
+            database[collection].drop_index(index_name)
+            dropped[collection].append(index_name)
+    return dropped
+
+
+def missing_indexes(database, collections=None):
+    """Check which declared indexes are not present in the database
+
+    Accepts:
+        database(pymongo.database.Database)
+        collections(list): collection names or None (all collections)
+
+    Returns:
+        missing(dict): collection names as keys and list of missing index names as values.
+            Collections with all indexes in place are not included
+    """
+    missing = {}
+    for collection in _collections(collections):
+        existing = database[collection].index_information()
+        missing_names = [
+            index.document["name"]
+            for index in INDEXES[collection]
+            if index.document["name"] not in existing
+        ]
+        if missing_names:
+            missing[collection] = missing_names
+    return missing
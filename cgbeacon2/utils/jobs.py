@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+LOG = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 30  # seconds between updates of the "updated" field of queued and running jobs
+STALE_AFTER = 300  # seconds without updates after which a queued or running job is considered lost
+ACTIVE_STATUSES = ["queued", "running"]
+
+
+class JobQueue:
+    """Runs long requests (variants add and delete) in a pool of background threads.
+    A job is "queued" until a thread picks it up, then "running", "completed" or "failed".
+
+    Jobs are saved in the job collection of the database with their status, progress and result,
+    so that they can be checked by any process of the server. Each job also saves the process running it
+    (owner host and pid) and the time of its last update, refreshed every `heartbeat` seconds while the job
+    is queued or running, so that jobs lost when a server process stops can be marked as failed (see fail_lost_jobs).
+    """
+
+    def __init__(self, workers=2, heartbeat=HEARTBEAT_INTERVAL, stale_after=STALE_AFTER):
+        self.workers = workers
+        self.heartbeat = heartbeat
+        self.stale_after = stale_after
+        self._executor = None
+        self._lock = threading.Lock()
+        self._active = set()  # ids of the jobs queued or running in this process
+        self._collection = None
+        self._stop = threading.Event()
+        self._heartbeat_thread = None
+
+    def _pool(self):
+        """Return the thread pool running the jobs, creating it and the heartbeat thread at first use"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="cgbeacon2-job"
+                )
+                self._stop.clear()
+                self._heartbeat_thread = threading.Thread(
+                    target=self._beat, name="cgbeacon2-job-heartbeat", daemon=True
+                )
+                self._heartbeat_thread.start()
+            return self._executor
+
+    def _beat(self):
+        """Refresh the update time of the jobs queued or running in this process, until the queue is shut down"""
+        while not self._stop.wait(self.heartbeat):
+            with self._lock:
+                job_ids = list(self._active)
+                collection = self._collection
+            if not job_ids:
+                continue
+            try:
+                collection.update_many(
+                    {"_id": {"$in": job_ids}, "status": {"$in": ACTIVE_STATUSES}},
+                    {"$set": {"updated": datetime.datetime.now()}},
+                )
+            except Exception as err:
+                LOG.warning(f"Could not update jobs heartbeat:{err}")
+
+    def submit(self, app, job_type, params, func, *args):
+        """Save a new job to the database and queue it for execution
+
+        Accepts:
+            app(flask.Flask): the app, providing the context the job is run in
+            job_type(str): add or delete
+            params(dict): request parameters, saved with the job
+            func(function): function executing the job. Called with args and a progress function (progress kwarg)
+            args: positional arguments of func
+
+        Returns:
+            job_id(str)
+        """
+        job_id = uuid.uuid4().hex
+        now = datetime.datetime.now()
+        app.db["job"].insert_one(
+            dict(
+                _id=job_id,
+                type=job_type,
+                status="queued",
+                params=params,
+                owner=dict(host=socket.gethostname(), pid=os.getpid()),
+                created=now,
+                updated=now,
+                progress=dict(processed=0, modified=0, total=None),
+            )
+        )
+        with self._lock:
+            self._active.add(job_id)
+            self._collection = app.db["job"]
+        self._pool().submit(self._run, app, job_id, func, args)
+        return job_id
+
+    def _run(self, app, job_id, func, args):
+        """Execute a job inside the app context and save its outcome"""
+        try:
+            self._execute(app, job_id, func, args)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def _execute(self, app, job_id, func, args):
+        """Set a job as running, execute it and save its result or error"""
+        collection = app.db["job"]
+        now = datetime.datetime.now()
+        collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "running", "started": now, "updated": now}},
+        )
+        with app.app_context():
+            try:
+                result = func(*args, progress=job_progress(collection, job_id))
+            except Exception as err:
+                LOG.exception(f"Job {job_id} failed")
+                now = datetime.datetime.now()
+                collection.update_one(
+                    {"_id": job_id},
+                    {
+                        "$set": {
+                            "status": "failed",
+                            "error": str(err),
+                            "finished": now,
+                            "updated": now,
+                        }
+                    },
+                )
+                return
+
+        now = datetime.datetime.now()
+        collection.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": "completed",
+                    "result": result,
+                    "finished": now,
+                    "updated": now,
+                }
+            },
+        )
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and release the worker threads
+
+        Accepts:
+            wait(bool): wait for running and queued jobs to finish
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+            self._stop.set()
+
+
+def job_progress(collection, job_id):
+    """Create the function used by a job to save its progress
+
+    Accepts:
+        collection(pymongo.collection.Collection): job collection
+        job_id(str)
+
+    Returns:
+        progress(func): function accepting the number of processed and modified items and, optionally, the total items
+    """
+
+    def progress(processed, modified, total=None):
+        fields = {
+            "progress.processed": processed,
+            "progress.modified": modified,
+            "updated": datetime.datetime.now(),
+        }
+        if total is not None:
+            fields["progress.total"] = total
+        collection.update_one({"_id": job_id}, {"$set": fields})
+
+    return progress
+
+
+def owner_alive(owner):
+    """Check if the process that created a job is still running
+
+    Accepts:
+        owner(dict): host and pid of the process that created the job
+
+    Returns:
+        bool: False only if the process ran on this host and doesn't exist anymore
+    """
+    if not owner or owner.get("host") != socket.gethostname():
+        return True  # processes of other hosts can't be checked, rely on job heartbeat
+    try:
+        os.kill(owner["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True  # process exists, but belongs to another user
+    return True
+
+
+def fail_lost_jobs(database, job_ids=None, stale_after=STALE_AFTER):
+    """Mark as failed the queued or running jobs whose process has stopped (i.e. after a server restart):
+    jobs created by a process of this host that doesn't exist anymore and jobs not updated for `stale_after` seconds
+
+    Accepts:
+        database(pymongo.database.Database)
+        job_ids(list): only check these jobs (optional)
+        stale_after(float): seconds without heartbeat after which a job is considered lost
+
+    Returns:
+        n_failed(int): number of jobs marked as failed
+    """
+    query = {"status": {"$in": ACTIVE_STATUSES}}
+    if job_ids is not None:
+        query["_id"] = {"$in": list(job_ids)}
+
+    now = datetime.datetime.now()
+    stale_time = now - datetime.timedelta(seconds=stale_after)
+    n_failed = 0
+    for job in database["job"].find(query, {"owner": 1, "updated": 1, "created": 1}):
+        last_update = job.get("updated") or job.get("created")
+        if owner_alive(job.get("owner")) and last_update is not None and last_update >= stale_time:
+            continue
+        result = database["job"].update_one(
+            {"_id": job["_id"], "status": {"$in": ACTIVE_STATUSES}},  # job might have finished in the meantime
+            {
+                "$set": {
+                    "status": "failed",
+                    "error": "Job was interrupted: the server process running it has stopped",
+                    "finished": now,
+                    "updated": now,
+                }
+            },
+        )
+        if result.modified_count:
+            LOG.warning(f"Job {job['_id']} was lost and was marked as failed")
+            n_failed += 1
+    return n_failed
+
+
+def job_status(database, job_id, stale_after=STALE_AFTER):
+    """Return status, progress and throughput of a job. Lost jobs are marked as failed (see fail_lost_jobs)
+
+    Accepts:
+        database(pymongo.database.Database)
+        job_id(str)
+        stale_after(float): seconds without heartbeat after which a queued or running job is considered lost
+
+    Returns:
+        job(dict): job document with throughput (processed items per second) or None if job doesn't exist
+    """
+    job = database["job"].find_one({"_id": job_id})
+    if job is None:
+        return None
+
+    if job["status"] in ACTIVE_STATUSES and fail_lost_jobs(database, [job_id], stale_after):
+        job = database["job"].find_one({"_id": job_id})
+
+    job["throughput"] = None
+    if job.get("started"):
+        elapsed = (job.get("finished") or datetime.datetime.now()) - job["started"]
+        seconds = elapsed.total_seconds()
+        if seconds > 0:
+            job["throughput"] = round(job["progress"]["processed"] / seconds, 2)
+    return job
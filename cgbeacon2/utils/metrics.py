@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""Lightweight request metrics (counters and latency histograms), exposed in Prometheus text format.
+
+Metrics are collected in memory by each app process and only cost a lock and a few additions
+per observation. When the app caches use a shared backend (i.e. Redis, CACHE_BACKEND config param),
+each process adds the values collected since its last update to the backend every few seconds,
+and metrics are returned from the backend, aggregated over all the processes (workers) of the app.
+"""
+import atexit
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+LOG = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SYNC_INTERVAL = 5  # seconds between updates of the metrics saved in a shared backend
+CACHE_COUNTERS = ["hits", "misses"]
+
+
+def _escape(value):
+    """Escape a label value according to Prometheus text format"""
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _labels(labelnames, labelvalues, extra=()):
+    """Format labels as {name="value",..}
+
+    Accepts:
+        labelnames(tuple): label names
+        labelvalues(tuple): label values, in the same order
+        extra(list): additional (name, value) labels, i.e. histogram bucket
+
+    Returns:
+        labels(str): formatted labels, an empty string if no label is provided
+    """
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    """Format a number according to Prometheus text format"""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class of metrics with values identified by label values"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values: metric value
+        self._synced = {}  # label values: metric value already added to the shared backend
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        """Return label values in the order of label names"""
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self, values=None):
+        """Return the lines describing the metric in Prometheus text format
+
+        Accepts:
+            values(dict): metric values by label values (default: values collected by this process)
+
+        Returns:
+            lines(list)
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        if values is None:
+            with self._lock:
+                values = self._copy_values()
+        for labelvalues, value in sorted(values.items()):
+            lines += self._format(labelvalues, value)
+        return lines
+
+    def _copy_values(self):
+        return dict(self._values)
+
+    def _format(self, labelvalues, value):
+        return [f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"]
+
+    def _fields(self, labelvalues, value):
+        """Return the backend fields of a value, with their amounts"""
+        return {json.dumps(list(labelvalues)): value}
+
+    def _from_fields(self, fields):
+        """Return metric values from the fields saved in the backend"""
+        return {tuple(json.loads(field)): amount for field, amount in fields.items()}
+
+    def unsynced(self):
+        """Return the amounts collected since the last update of the shared backend
+
+        Returns:
+            amounts(dict): backend fields and amounts to add to them
+            values(dict): current values, to be passed to mark_synced once the backend is updated
+        """
+        with self._lock:
+            values = self._copy_values()
+        synced = {}
+        for labelvalues, value in self._synced.items():
+            synced.update(self._fields(labelvalues, value))
+        amounts = {}
+        for labelvalues, value in values.items():
+            for field, amount in self._fields(labelvalues, value).items():
+                if amount != synced.get(field, 0):
+                    amounts[field] = amount - synced.get(field, 0)
+        return amounts, values
+
+    def mark_synced(self, values):
+        """Save the values already added to the shared backend"""
+        self._synced = values
+
+    def clear(self):
+        """Reset all values"""
+        with self._lock:
+            self._values.clear()
+            self._synced = {}
+
+
+class Counter(Metric):
+    """A value that can only increase, i.e. number of requests"""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter identified by the provided label values"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the current value of a counter"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(Metric):
+    """Distribution of observed values (i.e. latencies) in cumulative buckets"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Record a value for the histogram identified by the provided label values"""
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one count for each bucket plus values above the largest bucket, then sum of values
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    break
+            else:
+                index = len(self.buckets)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager recording the seconds spent running the code it contains"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        """Return the number of observed values"""
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return sum(counts[:-1]) if counts else 0
+
+    def _format(self, labelvalues, counts):
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts[:-1]):
+            cumulative += bucket_count
+            labels = _labels(self.labelnames, labelvalues, [("le", _number(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _labels(self.labelnames, labelvalues)
+        lines.append(f"{self.name}_sum{labels} {_number(counts[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def _fields(self, labelvalues, counts):
+        # one field for each bucket count and one for the sum, by label values and position
+        return {
+            json.dumps(list(labelvalues) + [index]): amount for index, amount in enumerate(counts)
+        }
+
+    def _from_fields(self, fields):
+        values = {}
+        for field, amount in fields.items():
+            *labelvalues, index = json.loads(field)
+            counts = values.setdefault(tuple(labelvalues), [0] * (len(self.buckets) + 1) + [0.0])
+            if index < len(counts):
+                counts[index] = amount
+        return values
+
+    def _copy_values(self):
+        return {key: list(counts) for key, counts in self._values.items()}
+
+
+class Registry:
+    """Collection of the metrics exposed by the app"""
+
+    def __init__(self):
+        self.metrics = []
+        self.backend = None
+        self.caches = {}
+        self._synced_caches = {}  # (counter, cache name): value already added to the shared backend
+        self._sync_lock = threading.Lock()
+        self._stop = None
+        self._exit_sync = False
+
+    def counter(self, name, documentation, labelnames=()):
+        """Create a counter and add it to the registry"""
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Create a histogram and add it to the registry"""
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def configure(self, backend=None, caches=None, interval=SYNC_INTERVAL):
+        """Set the caches whose usage stats are returned with the metrics and, for shared cache
+        backends, aggregate metrics over all app processes in the backend
+
+        Accepts:
+            backend(RedisBackend): shared cache backend. If None, each process returns its metrics
+            caches(dict): objects providing a stats() method (i.e. TokenCache), by cache name
+            interval(float): seconds between updates of the backend
+        """
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        self.caches = dict(caches or {})
+        self.backend = backend if getattr(backend, "shared", False) else None
+        if self.backend is None:
+            return
+
+        for metric in self.metrics:  # values collected before are not added to the backend
+            with metric._lock:
+                metric.mark_synced(metric._copy_values())
+        self._synced_caches = self._cache_counters()
+
+        stop = self._stop = threading.Event()
+
+        def sync_loop():
+            while not stop.wait(interval):
+                self.sync()
+
+        threading.Thread(target=sync_loop, name="cgbeacon2-metrics", daemon=True).start()
+        if not self._exit_sync:
+            atexit.register(self.sync)  # save the values collected after the last update
+            self._exit_sync = True
+
+    def _cache_counters(self, caches=None):
+        """Return hits and misses of the caches
+
+        Returns:
+            counters(dict): (counter name, cache name) as keys and values as values
+        """
+        counters = {}
+        for cache_name, cache in (self.caches if caches is None else caches).items():
+            stats = cache.stats()
+            for key in CACHE_COUNTERS:
+                counters[(key, cache_name)] = stats.get(key) or 0
+        return counters
+
+    def sync(self):
+        """Add the values collected by this process since the last update to the shared backend"""
+        backend = self.backend
+        if backend is None:
+            return
+        with self._sync_lock:
+            for metric in self.metrics:
+                amounts, values = metric.unsynced()
+                if not amounts or backend.increment(f"metrics:{metric.name}", amounts):
+                    metric.mark_synced(values)
+
+            counters = self._cache_counters()
+            amounts = {
+                json.dumps(list(key)): value - self._synced_caches.get(key, 0)
+                for key, value in counters.items()
+                if value != self._synced_caches.get(key, 0)
+            }
+            if not amounts or backend.increment("metrics:cache", amounts):
+                self._synced_caches = counters
+
+    def render(self, caches=None):
+        """Return all metrics in Prometheus text format
+
+        Accepts:
+            caches(dict): objects providing a stats() method (i.e. TokenCache), by cache name.
+                Caches set with configure() are used if not provided
+
+        Returns:
+            text(str)
+        """
+        caches = self.caches if caches is None else caches
+        lines = []
+        if self.backend is None:
+            for metric in self.metrics:
+                lines += metric.samples()
+            lines += cache_samples({name: cache.stats() for name, cache in caches.items()})
+            return "\n".join(lines) + "\n"
+
+        # Return metrics of all app processes from the shared backend
+        self.sync()
+        for metric in self.metrics:
+            fields = self.backend.counts(f"metrics:{metric.name}")
+            lines += metric.samples(metric._from_fields(fields))
+        stats = {name: {} for name in caches}
+        for field, value in self.backend.counts("metrics:cache").items():
+            key, cache_name = json.loads(field)
+            stats.setdefault(cache_name, {})[key] = value
+        lines += cache_samples(stats)
+        return "\n".join(lines) + "\n"
+
+
+def cache_samples(stats):
+    """Return hits, misses and size of a list of caches in Prometheus text format
+
+    Accepts:
+        stats(dict): hits, misses and size (missing or None if not available) by cache name
+
+    Returns:
+        lines(list)
+    """
+    lines = []
+    for key, metric_type, documentation in [
+        ("hits", "counter", "Number of values found in cache"),
+        ("misses", "counter", "Number of values not found in cache"),
+        ("size", "gauge", "Number of values in cache"),
+    ]:
+        if metric_type == "counter":
+            name = f"cgbeacon2_cache_{key}_total"
+        else:
+            name = f"cgbeacon2_cache_{key}"
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+        for cache_name, cache_stats in sorted(stats.items()):
+            if cache_stats.get(key) is not None:
+                labels = _labels(("cache",), (cache_name,))
+                lines.append(f"{name}{labels} {_number(cache_stats[key])}")
+    return lines
+
+
+REGISTRY = Registry()
+
+QUERY_SECONDS = REGISTRY.histogram(
+    "cgbeacon2_query_duration_seconds", "Time spent answering allele queries"
+)
+QUERY_STAGE_SECONDS = REGISTRY.histogram(
+    "cgbeacon2_query_stage_duration_seconds",
+    "Time spent in each stage of allele queries "
+    "(auth, query_building, auth_filter, database, response_assembly, serialization)",
+    ["stage"],
+)
+QUERY_RESPONSES = REGISTRY.counter(
+    "cgbeacon2_query_responses_total",
+    "Number of answered allele queries, by allele existence",
+    ["exists"],
+)
+QUERY_ERRORS = REGISTRY.counter(
+    "cgbeacon2_query_errors_total",
+    "Number of allele queries returning an error, by errorCode",
+    ["errorCode"],
+)
+BATCH_QUERY_SECONDS = REGISTRY.histogram(
+    "cgbeacon2_batch_query_duration_seconds", "Time spent answering batch queries"
+)
+BATCH_QUERY_STAGE_SECONDS = REGISTRY.histogram(
+    "cgbeacon2_batch_query_stage_duration_seconds",
+    "Time spent in each stage of batch queries "
+    "(auth, query_building, database, response_assembly, serialization)",
+    ["stage"],
+)
+BATCH_QUERY_RESPONSES = REGISTRY.counter(
+    "cgbeacon2_batch_query_responses_total",
+    "Number of answered allele requests of batch queries, by allele existence",
+    ["exists"],
+)
+BATCH_QUERY_ERRORS = REGISTRY.counter(
+    "cgbeacon2_batch_query_errors_total",
+    "Number of batch queries and allele requests of batch queries returning an error, "
+    "by errorCode",
+    ["errorCode"],
+)
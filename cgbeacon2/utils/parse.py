@@ -2,6 +2,7 @@
 import json
 import logging
 from cyvcf2 import VCF
+import numpy as np
 import os
 import re
 from pybedtools.bedtool import BedTool
@@ -12,6 +13,10 @@ from cgbeacon2.resources import variants_add_schema_path
 
 BND_ALT_PATTERN = re.compile(r".*[\],\[](.*?):(.*?)[\],\[]")
 CHR_PATTERN = re.compile(r"(chr)?(.*)", re.IGNORECASE)
+VCF_INDEX_EXTENSIONS = [".tbi", ".csi"]
+GT_HET = 1  # cyvcf2 gt_types value for heterozygous calls
+GT_HOM_ALT = 3  # cyvcf2 gt_types value for homozygous alternate calls
+SPANNING_DELETION = "*"  # ALT allele overlapping a deletion described in another record
 
 LOG = logging.getLogger(__name__)
 
@@ -182,32 +187,52 @@ def _compute_intersections(vcf_file, filter):
     """
 
     vcf_bed = BedTool(vcf_file)
-    LOG.info(
-        "Extracting %s intervals from the %s total entries of the VCF file.",
-        filter.count(),
-        vcf_bed.count(),
-    )
+    LOG.info("Extracting %s intervals from the VCF file.", filter.count())
     intersections = vcf_bed.intersect(filter, header=True)
-    intersected_vars = intersections.count()
-    LOG.info("Number of variants found in the intervals:%s", intersected_vars)
 
     return intersections
 
 
-def count_variants(vcf_obj):
-    """Count how many variants are contained in a VCF object
+def vcf_indexed(vcf_file):
+    """Check if a VCF file has a tabix or CSI index
 
     Accepts:
-        vcf_obj(cyvcf2.VCF): a VCF object
+        vcf_file(str): path to VCF file
+
+    Returns:
+        bool
+    """
+    return any(os.path.isfile(vcf_file + ext) for ext in VCF_INDEX_EXTENSIONS)
+
+
+def vcf_contigs(vcf_file):
+    """Return the names of the contigs of an indexed VCF file
+
+    Accepts:
+        vcf_file(str): path to VCF file
 
     Returns:
-        nr_variants(int): number of variants
+        contigs(list): contig names, as written in the VCF file
     """
-    nr_variants = 0
-    for vcf_variant in vcf_obj:
-        nr_variants += 1
+    return list(VCF(vcf_file).seqnames)
+
 
-    return nr_variants
+def count_variants(vcf_file):
+    """Return the number of records contained in a VCF file, as stored in its tabix or CSI index.
+    The VCF file is not parsed, so the number is available only for indexed files.
+
+    Accepts:
+        vcf_file(str): path to VCF file
+
+    Returns:
+        nr_variants(int): number of variants or None if VCF file is not indexed
+    """
+    if vcf_indexed(vcf_file) is False:
+        return None
+    try:
+        return VCF(vcf_file).num_records
+    except Exception as err:
+        LOG.warning(f"Could not read number of variants from VCF index:{err}")
 
 
 def merge_intervals(panels):
@@ -232,29 +257,87 @@ def variant_called(vcf_samples, gt_positions, g_types):
 
     Accepts:
         vcf_samples(list): list of samples contained in VCF, ordered
-        gt_positions(list): list of positions to check GT for, i.e [0,2]: (check first and third sample)
-        g_types(list): list of GTypes, one for each sample, ordered.
+        gt_positions(numpy.ndarray or list): positions to check GT for, i.e [0,2]: (check first and third sample)
+        g_types(numpy.ndarray): GTypes, one for each sample, ordered (cyvcf2 gt_types).
 
     Returns:
         samples_with_call(dict): a dictionary of samples having the specific variant call with the allele count.
             Example: {sample1:1, sample2:2}
     """
+    # gt_types is array of 0,1,2,3==HOM_REF, HET, UNKNOWN, HOM_ALT
+    positions = np.asarray(gt_positions, dtype=np.intp)
+    selected_gts = np.asarray(g_types)[positions]
 
-    samples_with_call = {}
-    allele_count = 0
+    # Collect only samples with HET or HOM_ALT calls
+    allele_counts = (selected_gts == GT_HET) + 2 * (selected_gts == GT_HOM_ALT)
+    called = np.flatnonzero(allele_counts)
+    if called.size == 0:
+        return {}
 
-    for i, g_type in enumerate(g_types):
-        if i not in gt_positions:  # this sampple should not be considered, skip
-            continue
+    return {
+        vcf_samples[positions[i]]: {"allele_count": int(allele_counts[i])} for i in called
+    }
 
-        if g_type in [1, 3]:
-            # gt_types is array of 0,1,2,3==HOM_REF, HET, UNKNOWN, HOM_ALT
-            # Collect only samples with HET or HOM_ALT calls
-            if g_type == 1:
-                allele_count = 1  # HET
-            else:
-                allele_count = 2  # HOM_ALT
 
-            samples_with_call[vcf_samples[i]] = {"allele_count": allele_count}
+def alleles_called(vcf_samples, gt_positions, genotypes, n_alts):
+    """Return the samples carrying each alternate allele of a multi-allelic VCF record
 
-    return samples_with_call
+    Accepts:
+        vcf_samples(list): list of samples contained in VCF, ordered
+        gt_positions(numpy.ndarray or list): positions to check GT for, i.e [0,2]: (check first and third sample)
+        genotypes(numpy.ndarray): cyvcf2 genotype array, one row for each sample with allele indexes followed by phasing
+        n_alts(int): number of alternate alleles of the record
+
+    Returns:
+        alleles_calls(list): one dictionary for each alternate allele, with the samples carrying the allele
+            and their allele count. Example: [{sample1:{"allele_count":1}}, {sample1:{"allele_count":1}, sample2:{"allele_count":2}}]
+    """
+    positions = np.asarray(gt_positions, dtype=np.intp)
+    # Allele indexes called for each sample (-1: missing call, -2: padding for lower ploidy)
+    sample_alleles = np.asarray(genotypes)[positions, :-1]
+
+    # Number of copies of each alternate allele (columns) in each sample (rows)
+    allele_counts = (sample_alleles[:, :, np.newaxis] == np.arange(1, n_alts + 1)).sum(axis=1)
+
+    alleles_calls = []
+    for alt_counts in allele_counts.T:
+        called = np.flatnonzero(alt_counts)
+        alleles_calls.append(
+            {vcf_samples[positions[i]]: {"allele_count": int(alt_counts[i])} for i in called}
+        )
+    return alleles_calls
+
+
+def trim_alleles(ref, alt, start):
+    """Remove the bases shared by the reference and an alternate allele of a multi-allelic record,
+    first from the end and then from the start of the alleles, keeping at least one base in each allele
+
+    Accepts:
+        ref(str): reference bases of the VCF record
+        alt(str): alternate bases
+        start(int): 0-based start coordinate of the VCF record
+
+    Returns:
+        ref, alt, start, end(tuple): trimmed alleles and their 0-based coordinates
+    """
+    while len(ref) > 1 and len(alt) > 1 and ref[-1] == alt[-1]:
+        ref, alt = ref[:-1], alt[:-1]
+    while len(ref) > 1 and len(alt) > 1 and ref[0] == alt[0]:
+        ref, alt = ref[1:], alt[1:]
+        start += 1
+    return ref, alt, start, start + len(ref)
+
+
+def allele_type(ref, alt):
+    """Return the type of a small variant allele, as assigned by cyvcf2 to bi-allelic records
+
+    Accepts:
+        ref(str): reference bases
+        alt(str): alternate bases
+
+    Returns:
+        variant_type(str): SNP, MNP or INDEL
+    """
+    if len(ref) != len(alt):
+        return "INDEL"
+    return "SNP" if len(ref) == 1 else "MNP"
@@ -2,6 +2,8 @@
 from flask.cli import current_app
 import datetime
 import logging
+from pymongo import UpdateOne
+from cgbeacon2.constants import BULK_WRITE_BATCH_SIZE
 from .delete import delete_genes
 
 LOG = logging.getLogger(__name__)
@@ -78,7 +80,8 @@ def update_event(database, dataset_id, updated_collection, add):
 
 
 def update_dataset(database, dataset_id, samples, add):
-    """Update dataset object in dataset collection after adding or removing variants
+    """Update dataset object in dataset collection after adding or removing variants.
+    Variant and allele counts are not recomputed here: they are incremented while variants are saved or removed
 
     Accepts:
         database(pymongo.database.Database)
@@ -91,19 +94,11 @@ def update_dataset(database, dataset_id, samples, add):
     # update list of samples for this dataset
     updated_samples = update_dataset_samples(dataset_obj, samples, add)
 
-    # update variants count for this dataset
-    n_variants = update_dataset_variant_count(database, dataset_id)
-
-    # Update number of allele calls for this dataset
-    n_alleles = update_dataset_allele_count(database, dataset_id, list(updated_samples))
-
     result = database["dataset"].find_one_and_update(
         {"_id": dataset_id},
         {
             "$set": {
                 "samples": list(updated_samples),
-                "variant_count": n_variants,
-                "allele_count": n_alleles,
                 "updated": datetime.datetime.now(),
             }
         },
@@ -138,79 +133,119 @@ def update_dataset_samples(dataset_obj, samples, add=True):
     return datasets_samples
 
 
-def update_dataset_variant_count(database, dataset_id):
-    """Count how many variants there are for a dataset and update dataset object with this number
+def dataset_stats(database, dataset_ids=None):
+    """Count variants and allele calls of one or more datasets from the variant collection, using a single aggregation
 
     Accepts:
         database(pymongo.database.Database)
-        dataset_id(str): id of dataset to be updated
+        dataset_ids(list): ids of the datasets to count variants for. If None, all datasets are considered
 
     Returns:
-        n_variants(int): the number of variants with calls for this dataset
+        stats(dict): dataset ids as keys and dict(variant_count, allele_count) as values
     """
+    pipeline = []
+    if dataset_ids:
+        pipeline.append({"$match": {"dataset_list": {"$in": list(dataset_ids)}}})
+    pipeline += [
+        {"$project": {"datasets": {"$objectToArray": "$datasetIds"}}},
+        {"$unwind": "$datasets"},
+    ]
+    if dataset_ids:
+        pipeline.append({"$match": {"datasets.k": {"$in": list(dataset_ids)}}})
+    pipeline += [
+        {
+            "$project": {
+                "dataset": "$datasets.k",
+                "samples": {"$objectToArray": {"$ifNull": ["$datasets.v.samples", {}]}},
+            }
+        },
+        {"$project": {"dataset": 1, "alleles": {"$sum": "$samples.v.allele_count"}}},
+        {
+            "$group": {
+                "_id": "$dataset",
+                "variant_count": {"$sum": 1},
+                "allele_count": {"$sum": "$alleles"},
+            }
+        },
+    ]
 
-    variant_collection = database["variant"]
-    # Get all variants present with calls for this dataset
-    query = {".".join(["datasetIds", dataset_id]): {"$exists": True}}
-    n_variants = sum(1 for i in variant_collection.find(query))
-
-    LOG.info(f"Updated dataset contains {n_variants} variants")
-    return n_variants
+    stats = {}
+    for result in database["variant"].aggregate(pipeline):
+        stats[result["_id"]] = dict(
+            variant_count=result["variant_count"], allele_count=result["allele_count"]
+        )
+    return stats
 
 
-def update_dataset_allele_count(database, dataset_id, samples):
-    """Count how many allele calls are present for a dataset and update dataset object with this number
+def update_dataset_stats(database, dataset_ids=None):
+    """Recompute variant and allele counts of one or more datasets and save them in the dataset collection.
+    An event is registered for each dataset with modified counts, so that cached datasets and query responses are reloaded
 
     Accepts:
         database(pymongo.database.Database)
-        dataset_id(str): id of dataset to be updated
-        samples(list): list of dataset samples
+        dataset_ids(list): ids of the datasets to update. If None, all datasets are updated
 
     Returns:
-        updated_dataset(obj): the updated dataset
+        stats(dict): dataset ids as keys and dict(variant_count, allele_count) as values
     """
-    allele_count = 0
-    variant_collection = database["variant"]
+    if not dataset_ids:
+        dataset_ids = [ds["_id"] for ds in database["dataset"].find({}, {"_id": 1})]
 
-    n_beacon_datasets = sum(1 for i in database["dataset"].find())
+    counts = dataset_stats(database, dataset_ids)
+    stats = {}
+    for ds_id in dataset_ids:
+        stats[ds_id] = counts.get(ds_id, dict(variant_count=0, allele_count=0))
+        result = database["dataset"].update_one({"_id": ds_id}, {"$set": stats[ds_id]})
+        if result.modified_count:
+            update_event(database, ds_id, "dataset", True)
+        LOG.info(f"Dataset {ds_id} contains {stats[ds_id]['variant_count']} variants")
+    return stats
 
-    # If beacon contains only one dataset, then allele count is the sum of allele count for each variant
-    if n_beacon_datasets == 1:
-        pipe = [{"$group": {"_id": None, "alleles": {"$sum": "$call_count"}}}]
-        aggregate_res = variant_collection.aggregate(pipeline=pipe)
-        for res in aggregate_res:
-            allele_count += res.get("alleles")
 
-    # Else count calls for each sample of this dataset in variant collection and sum them up
-    else:
-        allele_count = _samples_calls(variant_collection, dataset_id, samples)
+def missing_dataset_list(database):
+    """Check if the database contains variants saved without the list of their datasets (dataset_list field).
+    These variants are not returned by queries and can't be removed until update_variants_dataset_list is run
 
-    return allele_count
+    Accepts:
+        database(pymongo.database.Database)
 
+    Returns:
+        bool
+    """
+    return database["variant"].find_one({"dataset_list": {"$exists": False}}, {"_id": 1}) is not None
 
-def _samples_calls(variant_collection, dataset_id, samples):
-    """Count all allele calls for a dataset in variants collection
+
+def update_variants_dataset_list(database, batch_size=BULK_WRITE_BATCH_SIZE):
+    """Save the list of datasets containing each variant (dataset_list field) from its datasetIds keys.
+    Used to migrate variants saved before the dataset_list field was introduced.
+    An event is registered for each dataset with updated variants, so that cached query responses are dropped
 
     Accepts:
-        variant_collection(pymongo.database.Database.Collection)
-        dataset_id(str): id of dataset to be updated
-        samples(list): list of dataset samples
+        database(pymongo.database.Database)
+        batch_size(int): number of variants updated with each bulk write
+
     Returns:
-        allele_count(int)
+        n_updated(int): number of updated variants
     """
-    allele_count = 0
-
-    for sample in samples:
-        pipe = [
-            {
-                "$group": {
-                    "_id": None,
-                    "alleles": {"$sum": f"$datasetIds.{dataset_id}.samples.{sample}.allele_count"},
-                }
-            }
-        ]
-        aggregate_res = variant_collection.aggregate(pipeline=pipe)
-        for res in aggregate_res:
-            allele_count += res.get("alleles")
+    variant_collection = database["variant"]
+    n_updated = 0
+    requests = []
+    updated_datasets = set()  # datasets added to or removed from the dataset_list of any variant
+
+    for variant in variant_collection.find({}, {"datasetIds": 1, "dataset_list": 1}):
+        dataset_list = list(variant.get("datasetIds", {}).keys())
+        if variant.get("dataset_list") == dataset_list:
+            continue
+        updated_datasets.update(set(dataset_list) ^ set(variant.get("dataset_list") or []))
+        requests.append(UpdateOne({"_id": variant["_id"]}, {"$set": {"dataset_list": dataset_list}}))
+        if len(requests) >= max(batch_size, 1):
+            n_updated += variant_collection.bulk_write(requests, ordered=False).modified_count
+            requests = []
+
+    if requests:
+        n_updated += variant_collection.bulk_write(requests, ordered=False).modified_count
+
+    for ds_id in sorted(updated_datasets):
+        update_event(database, ds_id, "variant", True)
 
-    return allele_count
+    return n_updated
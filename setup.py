@@ -107,6 +107,10 @@ setup(
     keywords = KEYWORDS,
     packages=find_packages(),
     install_requires=REQUIRED,
+    extras_require={
+        'asgi': ['motor', 'httpx'],
+        'redis': ['redis'],
+    },
     include_package_data=True,
     license=LICENSE,
     classifiers=[
@@ -497,3 +497,35 @@ def test_add_snv_sv_variants(mock_app, public_dataset, database):
     # THEN more variants should have been added to the database
     new_saved_vars = sum(1 for i in database["variant"].find())
     assert new_saved_vars > saved_snvs
+
+
+def test_add_variants_workers_no_index(mock_app, public_dataset, database):
+    """Test loading variants with multiple workers from a VCF file without index"""
+
+    # GIVEN a database with a dataset
+    database["dataset"].insert_one(public_dataset)
+
+    runner = mock_app.test_cli_runner()
+
+    # When invoking the add variants command with multiple workers and a VCF file with no index
+    result = runner.invoke(
+        cli,
+        [
+            "add",
+            "variants",
+            "-ds",
+            public_dataset["_id"],
+            "-vcf",
+            test_snv_vcf_path,
+            "-sample",
+            "ADM1059A1",
+            "--workers",
+            2,
+        ],
+    )
+
+    # Then the command should return error
+    assert result.exit_code == 1
+    assert "requires a VCF file with a tabix or CSI index" in result.output
+    # And no variants should be saved
+    assert database["variant"].find_one() is None
@@ -2,6 +2,7 @@
 import click
 
 from cgbeacon2.cli.commands import cli
+from cgbeacon2.resources import test_snv_vcf_path
 
 
 def test_delete_non_existing_dataset(mock_app):
@@ -60,3 +61,42 @@ def test_delete_existing_dataset(public_dataset, mock_app, database):
     # And 2 events should have been saved: one for the added dataset and one for the deleted dataset
     saved_events = sum(1 for i in database["event"].find())
     assert saved_events == 2
+
+
+def test_delete_dataset_with_variants(public_dataset, mock_app, database):
+    """Test the command line to delete a dataset and its variants"""
+
+    runner = mock_app.test_cli_runner()
+
+    # GIVEN a dataset with variants
+    database["dataset"].insert_one(public_dataset)
+    result = runner.invoke(
+        cli,
+        [
+            "add",
+            "variants",
+            "-ds",
+            public_dataset["_id"],
+            "-vcf",
+            test_snv_vcf_path,
+            "-sample",
+            "ADM1059A1",
+        ],
+    )
+    n_variants = database["variant"].count_documents({})
+    assert n_variants > 0
+
+    # WHEN the dataset delete command is invoked with a chunk size smaller than the number of variants
+    result = runner.invoke(
+        cli, ["delete", "dataset", "-id", public_dataset["_id"], "-batch_size", 100]
+    )
+
+    # THEN the command should be executed with no errors
+    assert result.exit_code == 0
+    assert f"Number of variants updated:0, removed:{n_variants}" in result.output
+    assert "Dataset was successfully deleted" in result.output
+
+    # And dataset and variants should be removed from the database
+    assert database["dataset"].find_one() is None
+    assert database["variant"].find_one() is None
+
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from cgbeacon2.cli.commands import cli
+from cgbeacon2.constants import INDEXES
+
+
+def test_index_status_missing(mock_app):
+    """Test the cli command that shows the missing database indexes"""
+
+    runner = mock_app.test_cli_runner()
+
+    # When the status command is invoked on a database without indexes
+    result = runner.invoke(cli, ["index", "status"])
+
+    # Then the command should run
+    assert result.exit_code == 0
+    # And list the missing indexes
+    assert "Collection 'variant' - missing indexes" in result.output
+
+
+def test_index_create(mock_app, database):
+    """Test the cli command that creates the database indexes"""
+
+    runner = mock_app.test_cli_runner()
+
+    # When the create command is invoked
+    result = runner.invoke(cli, ["index", "create"])
+    assert result.exit_code == 0
+
+    # Then all declared indexes should be found in the database
+    for collection, indexes in INDEXES.items():
+        existing = database[collection].index_information()
+        for index in indexes:
+            assert index.document["name"] in existing
+
+    # And the status command should report no missing index
+    result = runner.invoke(cli, ["index", "status"])
+    assert "All indexes are in place" in result.output
+
+
+def test_index_drop(mock_app, database):
+    """Test the cli command that drops the database indexes"""
+
+    runner = mock_app.test_cli_runner()
+
+    # Having a database with indexes
+    runner.invoke(cli, ["index", "create"])
+
+    # When the drop command is invoked for the variant collection
+    result = runner.invoke(cli, ["index", "drop", "-collection", "variant"], input="y\n")
+    assert result.exit_code == 0
+
+    # Then the variant collection indexes should be removed
+    existing = database["variant"].index_information()
+    for index in INDEXES["variant"]:
+        assert index.document["name"] not in existing
+    # While the other collections should keep their indexes
+    assert len(database["dataset"].index_information()) > 1
+
+
+def test_index_create_dataset_list(mock_app, database, test_snv):
+    """Test that the index create command saves the dataset list of variants saved without it"""
+
+    # Having a variant saved by a previous version of the software, without dataset list
+    test_snv.pop("dataset_list", None)
+    database["variant"].insert_one(test_snv)
+
+    # When the create command is invoked
+    runner = mock_app.test_cli_runner()
+    result = runner.invoke(cli, ["index", "create"])
+
+    # Then the dataset list of the variant should be saved
+    assert result.exit_code == 0
+    assert "Saved dataset list of 1 variants" in result.output
+    assert database["variant"].find_one()["dataset_list"] == list(test_snv["datasetIds"])
@@ -50,3 +50,66 @@ def test_update_genes_build_38(mock_app, database):
     assert f"Number of inserted genes for build {build}: 3" in result.output
     genes = list(database["gene"].find())
     assert len(genes) == 3
+
+
+def test_update_dataset_list(mock_app, database, test_snv, test_sv):
+    """Test the cli command that saves the list of datasets of each variant"""
+
+    # GIVEN a database with variants saved without a dataset list
+    for variant in [test_snv, test_sv]:
+        variant.pop("dataset_list", None)
+    database["variant"].insert_many([test_snv, test_sv])
+
+    # WHEN invoking the update dataset-list command
+    runner = mock_app.test_cli_runner()
+    result = runner.invoke(cli, ["update", "dataset-list", "-batch_size", 1])
+
+    # THEN the command shouldn't return error
+    assert result.exit_code == 0
+    assert "Number of updated variants: 2" in result.output
+
+    # And each variant should contain the list of its datasets
+    for variant in database["variant"].find():
+        assert variant["dataset_list"] == list(variant["datasetIds"])
+
+    # And an event should be registered for each dataset of the updated variants
+    datasets = {ds_id for variant in database["variant"].find() for ds_id in variant["datasetIds"]}
+    events = list(database["event"].find())
+    assert {event["dataset"] for event in events} == datasets
+    assert all(event["updated_collection"] == "variant" for event in events)
+
+
+def test_update_stats_full(mock_app, database, public_dataset, test_snv, test_sv):
+    """Test the cli command that recounts variants and allele calls of datasets"""
+
+    # GIVEN a dataset with wrong variant and allele counts
+    public_dataset["variant_count"] = 10
+    public_dataset["allele_count"] = 10
+    database["dataset"].insert_one(public_dataset)
+
+    # And 2 variants of the dataset
+    database["variant"].insert_many([test_snv, test_sv])
+
+    # WHEN invoking the update stats command with the --full option
+    runner = mock_app.test_cli_runner()
+    result = runner.invoke(cli, ["update", "stats", "--full"])
+
+    # THEN the command shouldn't return error
+    assert result.exit_code == 0
+
+    # And dataset counts should be fixed
+    dataset = database["dataset"].find_one()
+    assert dataset["variant_count"] == 2
+    assert dataset["allele_count"] == 3
+    assert "variants:2, allele calls:3" in result.output
+
+    # And an event should be registered for the updated dataset
+    event = database["event"].find_one()
+    assert event["dataset"] == public_dataset["_id"]
+    assert event["updated_collection"] == "dataset"
+
+    # WHEN counts are recomputed again
+    result = runner.invoke(cli, ["update", "stats", "--full"])
+
+    # THEN no event should be registered for datasets with unchanged counts
+    assert database["event"].count_documents({}) == 1
@@ -69,6 +69,7 @@ def test_snv():
         "alternateBases": "T",
         "assemblyId": "GRCh37",
         "datasetIds": {"public_ds": {"samples": {"ADM1059A1": {"allele_count": 2}}}},
+        "dataset_list": ["public_ds"],
         "call_count": 2,
     }
     return variant
@@ -87,6 +88,7 @@ def test_sv():
         "variantType": "DEL",
         "assemblyId": "GRCh37",
         "datasetIds": {"public_ds": {"samples": {"ADM1059A1": {"allele_count": 1}}}},
+        "dataset_list": ["public_ds"],
         "call_count": 1,
     }
     return variant
@@ -106,6 +108,7 @@ def test_bnd_sv():
         "variantType": "BND",
         "assemblyId": "GRCh37",
         "datasetIds": {"test_public": {"samples": {"ADM1059A1": {"allele_count": 1}}}},
+        "dataset_list": ["test_public"],
         "call_count": 1,
     }
     return variant
@@ -353,3 +356,34 @@ def bona_fide_passport_info(header, pem):
     passport_info = [jwt.encode(header, passport, pem).decode("utf-8") for passport in passports]
 
     return passport_info
+
+
+class MockResponse:
+    """Response of the mock asynchronous HTTP client"""
+
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.content
+
+
+class MockAsyncClient:
+    """Asynchronous HTTP client returning predefined contents by url"""
+
+    def __init__(self, contents):
+        self.contents = contents
+        self.requests = []
+
+    async def get(self, url, **kwargs):
+        self.requests.append(url)
+        return MockResponse(self.contents[url])
+
+
+@pytest.fixture
+def mock_async_client():
+    """Returns the class of a mock asynchronous HTTP client (same interface of httpx.AsyncClient.get)"""
+    return MockAsyncClient
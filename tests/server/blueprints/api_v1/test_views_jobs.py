@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+from cgbeacon2.resources import test_snv_vcf_path
+
+HEADERS = {"Content-type": "application/json", "Accept": "application/json"}
+
+
+def wait_for_job(client, job_id, timeout=30):
+    """Poll the job status endpoint until the job is completed or failed"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = json.loads(client.get(f"/apiv1.0/jobs/{job_id}").data)
+        if job["status"] in ["completed", "failed"]:
+            return job
+        time.sleep(0.1)
+    raise TimeoutError(f"Job {job_id} didn't finish in {timeout} seconds")
+
+
+def test_job_status_not_found(mock_app):
+    """Test the job status endpoint with a job id not present in database"""
+
+    # WHEN the status of a non-existing job is requested
+    response = mock_app.test_client().get("/apiv1.0/jobs/foo")
+    # THEN the endpoint should return not found
+    assert response.status_code == 404
+    assert "Job 'foo' was not found" in json.loads(response.data)["message"]
+
+
+def test_add_delete_variants_api_async(mock_app, public_dataset, database):
+    """Test adding and removing variants using background jobs"""
+
+    # GIVEN a database containing a public dataset
+    database["dataset"].insert_one(public_dataset)
+    client = mock_app.test_client()
+
+    # WHEN the add endpoint receives a valid request to be run in background
+    data = {
+        "dataset_id": public_dataset["_id"],
+        "vcf_path": test_snv_vcf_path,
+        "assemblyId": "GRCh37",
+        "samples": ["ADM1059A1"],
+        "async": True,
+    }
+    response = client.post("/apiv1.0/add", json=data, headers=HEADERS)
+
+    # THEN it should return the id of the job and the url to check its status
+    assert response.status_code == 202
+    resp_data = json.loads(response.data)
+    assert resp_data["status_url"] == f"/apiv1.0/jobs/{resp_data['job_id']}"
+
+    # AND the job should load the variants
+    job = wait_for_job(client, resp_data["job_id"])
+    assert job["status"] == "completed"
+    assert job["type"] == "add"
+    assert "inserted variants for samples" in job["result"]["message"]
+    n_inserted = database["variant"].count_documents({})
+    assert n_inserted > 0
+    assert job["progress"]["modified"] == n_inserted
+    assert job["progress"]["processed"] >= n_inserted
+    assert job["throughput"] > 0
+    # And update the dataset
+    assert database["dataset"].find_one()["samples"] == ["ADM1059A1"]
+
+    # WHEN the delete endpoint receives a request to remove the variants in background
+    data = {"dataset_id": public_dataset["_id"], "samples": ["ADM1059A1"], "async": True}
+    response = client.post("/apiv1.0/delete", json=data, headers=HEADERS)
+    assert response.status_code == 202
+
+    # THEN the job should remove the variants of the sample
+    job = wait_for_job(client, json.loads(response.data)["job_id"])
+    assert job["status"] == "completed"
+    assert f"Number of deleted variants:{n_inserted}" in job["result"]["message"]
+    assert database["variant"].find_one() is None
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from cgbeacon2.utils.metrics import (
+    BATCH_QUERY_ERRORS,
+    BATCH_QUERY_RESPONSES,
+    BATCH_QUERY_SECONDS,
+    BATCH_QUERY_STAGE_SECONDS,
+    QUERY_ERRORS,
+    QUERY_RESPONSES,
+    QUERY_STAGE_SECONDS,
+)
+
+HEADERS = {"Content-type": "application/json", "Accept": "application/json"}
+
+QUERY = "/apiv1.0/query?assemblyId=GRCh37&referenceName=1&referenceBases=TA&start=235826381&alternateBases=T&includeDatasetResponses=HIT"
+
+
+def test_metrics(mock_app, public_dataset, test_snv):
+    """Test the endpoint returning query metrics in Prometheus text format"""
+
+    # GIVEN a database with a public dataset with a variant
+    mock_app.db["dataset"].insert_one(public_dataset)
+    mock_app.db["variant"].insert_one(test_snv)
+
+    hits = QUERY_RESPONSES.value(exists="true")
+    errors = QUERY_ERRORS.value(errorCode=400)
+    database_queries = QUERY_STAGE_SECONDS.count(stage="database")
+
+    # WHEN a valid and an invalid query are sent
+    assert mock_app.test_client().get(QUERY, headers=HEADERS).status_code == 200
+    assert mock_app.test_client().get("/apiv1.0/query?assemblyId=GRCh37").status_code == 400
+
+    # THEN query results, errors and database stage should be counted
+    assert QUERY_RESPONSES.value(exists="true") == hits + 1
+    assert QUERY_ERRORS.value(errorCode=400) == errors + 1
+    assert QUERY_STAGE_SECONDS.count(stage="database") == database_queries + 1
+
+    # AND returned by the metrics endpoint
+    response = mock_app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    text = response.data.decode()
+    assert 'cgbeacon2_query_stage_duration_seconds_count{stage="auth"}' in text
+    assert 'cgbeacon2_query_errors_total{errorCode="400"}' in text
+    assert 'cgbeacon2_cache_misses_total{cache="query"} 1' in text
+
+
+def test_metrics_batch_query(mock_app, public_dataset, test_snv):
+    """Test that batch queries are counted in metrics"""
+
+    # GIVEN a database with a public dataset with a variant
+    mock_app.db["dataset"].insert_one(public_dataset)
+    mock_app.db["variant"].insert_one(test_snv)
+
+    batches = BATCH_QUERY_SECONDS.count()
+    hits = BATCH_QUERY_RESPONSES.value(exists="true")
+    errors = BATCH_QUERY_ERRORS.value(errorCode=400)
+    database_queries = BATCH_QUERY_STAGE_SECONDS.count(stage="database")
+
+    # WHEN a batch with a valid and an invalid allele request is sent
+    valid_query = dict(
+        referenceName="1",
+        start=235826381,
+        referenceBases="TA",
+        alternateBases="T",
+        assemblyId="GRCh37",
+    )
+    invalid_query = dict(assemblyId="GRCh37")
+    resp = mock_app.test_client().post(
+        "/apiv1.0/query/batch", json=dict(queries=[valid_query, invalid_query]), headers=HEADERS
+    )
+    assert resp.status_code == 200
+
+    # THEN the batch, its allele responses, errors and database stage should be counted
+    assert BATCH_QUERY_SECONDS.count() == batches + 1
+    assert BATCH_QUERY_RESPONSES.value(exists="true") == hits + 1
+    assert BATCH_QUERY_ERRORS.value(errorCode=400) == errors + 1
+    assert BATCH_QUERY_STAGE_SECONDS.count(stage="database") == database_queries + 1
+
+    # AND returned by the metrics endpoint
+    text = mock_app.test_client().get("/metrics").data.decode()
+    assert "cgbeacon2_batch_query_duration_seconds_count" in text
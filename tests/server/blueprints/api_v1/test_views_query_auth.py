@@ -313,6 +313,7 @@ def test_post_query_registered_dataset_no_token(
     test_snv["datasetIds"] = {
         registered_dataset["_id"]: {"samples": registered_dataset["samples"]}
     }
+    test_snv["dataset_list"] = list(test_snv["datasetIds"])
     database["variant"].insert_one(test_snv)
 
     # When a POST request is sent without auth token
@@ -360,6 +361,7 @@ def test_post_query_registered_dataset_registered_token(
     test_snv["datasetIds"] = {
         registered_dataset["_id"]: {"samples": registered_dataset["samples"]}
     }
+    test_snv["dataset_list"] = list(test_snv["datasetIds"])
     database["variant"].insert_one(test_snv)
 
     # When a POST request with a valid token is sent
@@ -392,6 +394,7 @@ def test_post_query_controlled_dataset_no_token(
     test_snv["datasetIds"] = {
         controlled_dataset["_id"]: {"samples": controlled_dataset["samples"]}
     }
+    test_snv["dataset_list"] = list(test_snv["datasetIds"])
     database["variant"].insert_one(test_snv)
 
     # When a POST request is sent without auth token
@@ -439,6 +442,7 @@ def test_post_query_controlled_dataset_bona_fide_token(
     test_snv["datasetIds"] = {
         controlled_dataset["_id"]: {"samples": controlled_dataset["samples"]}
     }
+    test_snv["dataset_list"] = list(test_snv["datasetIds"])
     database["variant"].insert_one(test_snv)
 
     # When a POST request with a valid token is sent
@@ -458,3 +462,86 @@ def test_post_query_controlled_dataset_bona_fide_token(
     data = json.loads(response.data)
     # And the beacon response would be Found=Yes
     assert data["exists"] is True
+
+
+def test_post_request_token_cached(
+    mock_app,
+    test_token,
+    pem,
+    monkeypatch,
+    basic_query,
+    mock_oauth2,
+    registered_access_passport_info,
+):
+    """Test that the access level of a validated token is reused for following requests"""
+
+    userdata_requests = []
+
+    # Monkeypatch Elixir JWT server public key
+    def mock_public_server(*args, **kwargs):
+        return pem
+
+    def mock_ga4gh_userdata(*args, **kwargs):
+        userdata_requests.append(args)
+        return registered_access_passport_info
+
+    # Elixir key is not collected from elixir server, but mocked
+    monkeypatch.setattr(auth, "elixir_key", mock_public_server)
+    # And OIDC provider is mocked
+    monkeypatch.setattr(auth, "ga4gh_userdata", mock_ga4gh_userdata)
+
+    headers = copy.deepcopy(HEADERS)
+    headers["Authorization"] = "Bearer " + test_token
+
+    mock_app.config["ELIXIR_OAUTH2"]["userinfo"] = mock_oauth2["userinfo"]
+
+    # When 2 POST requests with the same valid token are sent
+    for _ in range(2):
+        response = mock_app.test_client().post(
+            "/apiv1.0/query?", headers=headers, data=json.dumps(basic_query)
+        )
+        assert response.status_code == 200
+
+    # THEN user data should be collected from the OIDC provider only once
+    assert len(userdata_requests) == 1
+    assert mock_app.token_cache.stats()["hits"] == 1
+
+
+def test_post_query_ALL_controlled_dataset_no_token(
+    mock_app, public_dataset, controlled_dataset, test_snv, basic_query
+):
+    """Test that no counts are returned for a controlled dataset when the query has no token"""
+
+    # Having a database containing a public and a controlled access dataset
+    database = mock_app.db
+    database["dataset"].insert_many([public_dataset, controlled_dataset])
+
+    # And a variant found in both datasets
+    sample_calls = {"samples": {"ADM1059A1": {"allele_count": 2}}}
+    test_snv["datasetIds"] = {
+        public_dataset["_id"]: sample_calls,
+        controlled_dataset["_id"]: sample_calls,
+    }
+    test_snv["dataset_list"] = list(test_snv["datasetIds"])
+    database["variant"].insert_one(test_snv)
+
+    # When a POST request with includeDatasetResponses=ALL is sent without auth token
+    basic_query["includeDatasetResponses"] = "ALL"
+    for endpoint, query in [
+        ("/apiv1.0/query", basic_query),
+        ("/apiv1.0/query/batch", {"queries": [basic_query]}),
+    ]:
+        response = mock_app.test_client().post(endpoint, headers=HEADERS, data=json.dumps(query))
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        if "results" in data:
+            data = data["results"][0]
+
+        # Then the variant should be found
+        assert data["exists"] is True
+        # But only in the public dataset
+        ds_responses = {resp["datasetId"]: resp for resp in data["datasetAlleleResponses"]}
+        assert ds_responses[public_dataset["_id"]]["exists"] is True
+        assert ds_responses[public_dataset["_id"]]["sampleCount"] == 1
+        assert ds_responses[controlled_dataset["_id"]]["exists"] is False
+        assert ds_responses[controlled_dataset["_id"]]["sampleCount"] == 0
@@ -2,8 +2,10 @@
 import json
 
 from cgbeacon2.cli.commands import cli
+from cgbeacon2.constants import INVALID_DATASET_IDS
 from cgbeacon2.resources import test_bnd_vcf_path
 from cgbeacon2.resources import test_snv_vcf_path
+from cgbeacon2.utils.update import update_event
 
 HEADERS = {"Content-type": "application/json", "Accept": "application/json"}
 
@@ -269,6 +271,40 @@ def test_beacon_entrypoint(mock_app, registered_dataset):
         assert len(data["sampleAlleleRequests"]) == 2  # 2 query examples provided
 
 
+
+def test_beacon_entrypoint_conditional_get(mock_app, public_dataset, registered_dataset):
+    """Test conditional requests to the endpoint that returns the beacon info"""
+
+    # GIVEN a database containing a dataset
+    database = mock_app.db
+    database["dataset"].insert_one(public_dataset)
+    update_event(database, public_dataset["_id"], "dataset", True)
+
+    with mock_app.test_client() as client:
+        # WHEN calling the info endpoint
+        response = client.get("/apiv1.0/", headers=HEADERS)
+        # THEN response should contain ETag and Last-Modified headers
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert response.headers["Last-Modified"]
+
+        # WHEN calling the endpoint again with the same ETag
+        response = client.get("/apiv1.0/", headers={"If-None-Match": etag})
+        # THEN the server should return 304 Not Modified with no body
+        assert response.status_code == 304
+        assert response.data == b""
+
+        # WHEN a new dataset is saved
+        database["dataset"].insert_one(registered_dataset)
+        update_event(database, registered_dataset["_id"], "dataset", True)
+        mock_app.dataset_registry.invalidate()
+
+        # THEN the conditional request should return the new info document
+        response = client.get("/apiv1.0/", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert len(json.loads(response.data)["datasets"]) == 2
+
 ################## TESTS FOR HANDLING GET REQUESTS ################
 
 
@@ -695,3 +731,158 @@ def test_post_query_error(mock_app, test_snv, public_dataset):
     # that displays the error
     assert "alert alert-danger" in str(response.data)
     assert "errorCode&#39;: 400" in str(response.data)
+
+
+def test_post_batch_query(mock_app, test_snv, test_sv, public_dataset):
+    """Test the batch query endpoint with exact coordinates, range coordinates and invalid allele requests"""
+
+    # Having a database with a snv and a structural variant
+    database = mock_app.db
+    database["variant"].insert_many([test_snv, test_sv])
+
+    # And a dataset
+    database["dataset"].insert_one(public_dataset)
+
+    snv_query = dict(
+        assemblyId=test_snv["assemblyId"],
+        referenceName=test_snv["referenceName"],
+        start=test_snv["start"],
+        end=test_snv["end"],
+        referenceBases=test_snv["referenceBases"],
+        alternateBases=test_snv["alternateBases"],
+        includeDatasetResponses="HIT",
+    )
+    sv_query = dict(
+        assemblyId=test_sv["assemblyId"],
+        referenceName=test_sv["referenceName"],
+        startMin=test_sv["start"] - 5,
+        startMax=test_sv["start"] + 5,
+        referenceBases=test_sv["referenceBases"],
+        variantType=test_sv["variantType"],
+    )
+    missing_query = dict(sv_query, referenceName="6")
+    invalid_query = dict(assemblyId="GRCh37", referenceName="1", start=235826381)
+
+    # When a batch of allele requests is sent to the server
+    data = dict(queries=[snv_query, sv_query, missing_query, invalid_query])
+    response = mock_app.test_client().post("/apiv1.0/query/batch", json=data, headers=HEADERS)
+
+    # Then the response should be valid
+    assert response.status_code == 200
+    results = json.loads(response.data)["results"]
+
+    # And contain one response for each allele request, in the same order
+    assert len(results) == 4
+    assert results[0]["exists"] is True
+    assert results[0]["datasetAlleleResponses"][0]["datasetId"] == public_dataset["_id"]
+    assert results[1]["exists"] is True
+    assert results[1]["datasetAlleleResponses"] == []
+    assert results[2]["exists"] is False
+    # And the invalid request should return an error
+    assert results[3]["exists"] is None
+    assert results[3]["error"]["errorCode"] == 400
+
+
+def test_post_batch_query_invalid(mock_app):
+    """Test sending a batch query without a list of allele requests, or with invalid dataset ids"""
+
+    # When a batch request doesn't contain a list of queries
+    response = mock_app.test_client().post(
+        "/apiv1.0/query/batch", json={"queries": "foo"}, headers=HEADERS
+    )
+
+    # Then the server should return a bad request error
+    assert response.status_code == 400
+    data = json.loads(response.data)
+    assert "queries" in data["message"]["error"]["errorMessage"]
+
+    # When an allele request of a batch contains datasetIds that are not a list of dataset ids
+    query = dict(
+        referenceName="1", start=235826381, referenceBases="TA", alternateBases="T", assemblyId="GRCh37"
+    )
+    for dataset_ids in ["public_ds", [{"id": "public_ds"}], {"public_ds": 1}, [1]]:
+        response = mock_app.test_client().post(
+            "/apiv1.0/query/batch",
+            json={"queries": [query, dict(query, datasetIds=dataset_ids)]},
+            headers=HEADERS,
+        )
+        # Then the server should return the same bad request error returned for a single query
+        assert response.status_code == 400
+        data = json.loads(response.data)
+        assert data["message"]["error"] == INVALID_DATASET_IDS
+
+        response = mock_app.test_client().post(
+            "/apiv1.0/query", json=dict(query, datasetIds=dataset_ids), headers=HEADERS
+        )
+        assert response.status_code == 400
+        assert json.loads(response.data)["message"]["error"] == INVALID_DATASET_IDS
+
+
+def test_post_range_query_dataset_counts(mock_app, test_snv, public_dataset):
+    """Test that sample, call and variant counts of a dataset sum up all variants matching a range query"""
+
+    # Having a database with 2 variants in the same region, found in 3 samples of a dataset
+    database = mock_app.db
+    other_snv = dict(
+        test_snv,
+        _id="other_snv",
+        start=test_snv["start"] + 10,
+        end=test_snv["end"] + 10,
+        datasetIds={
+            public_dataset["_id"]: {
+                "samples": {"ADM1059A2": {"allele_count": 1}, "ADM1059A3": {"allele_count": 1}}
+            }
+        },
+    )
+    database["variant"].insert_many([test_snv, other_snv])
+    database["dataset"].insert_one(public_dataset)
+
+    # When a range query matching both variants is sent
+    query = dict(
+        assemblyId=test_snv["assemblyId"],
+        referenceName=test_snv["referenceName"],
+        startMin=test_snv["start"] - 5,
+        startMax=test_snv["start"] + 20,
+        referenceBases=test_snv["referenceBases"],
+        alternateBases=test_snv["alternateBases"],
+        includeDatasetResponses="HIT",
+    )
+    response = mock_app.test_client().post("/apiv1.0/query", json=query, headers=HEADERS)
+    assert response.status_code == 200
+    data = json.loads(response.data)
+
+    # Then dataset counts should include both variants
+    ds_response = data["datasetAlleleResponses"][0]
+    assert ds_response["datasetId"] == public_dataset["_id"]
+    assert ds_response["variantCount"] == 2
+    assert ds_response["sampleCount"] == 3
+    assert ds_response["callCount"] == test_snv["call_count"] + other_snv["call_count"]
+
+
+def test_get_request_cached_response(mock_app, test_snv, public_dataset):
+    """Test that responses to repeated queries are cached until a new event is saved in the database"""
+
+    # Having a public dataset with a variant:
+    database = mock_app.db
+    database["variant"].insert_one(test_snv)
+    database["dataset"].insert_one(public_dataset)
+    update_event(database, public_dataset["_id"], "variant", True)
+    mock_app.dataset_registry.ttl = 0  # check for database changes at every request
+
+    query_string = "&".join([BASE_ARGS, COORDS_ARGS, ALT_ARG, "includeDatasetResponses=HIT"])
+
+    # When the same query is sent twice
+    for _ in range(2):
+        response = mock_app.test_client().get("".join(["/apiv1.0/", query_string]), headers=HEADERS)
+        assert json.loads(response.data)["exists"] is True
+
+    # Then the second response should be returned from the cache
+    assert mock_app.query_cache.stats() == dict(hits=1, misses=1, size=1)
+
+    # When the variant is removed and a new event is saved
+    database["variant"].delete_one({"_id": test_snv["_id"]})
+    update_event(database, public_dataset["_id"], "variant", False)
+
+    # Then the query should be answered again from the database
+    response = mock_app.test_client().get("".join(["/apiv1.0/", query_string]), headers=HEADERS)
+    assert json.loads(response.data)["exists"] is False
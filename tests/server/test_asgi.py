@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+import pytest
+
+from cgbeacon2.server.asgi import BeaconASGI
+from cgbeacon2.utils import auth
+from cgbeacon2.utils.update import update_event
+
+QUERY_STRING = b"assemblyId=GRCh37&referenceName=1&referenceBases=TA&start=235826381&alternateBases=T&includeDatasetResponses=HIT"
+
+
+class AsyncCursor:
+    """Asynchronous iterator over the results of a database query"""
+
+    def __init__(self, results):
+        self.results = iter(results)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.results)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncCollection:
+    """Collection with the asynchronous methods of a motor collection used by the ASGI app"""
+
+    def __init__(self, collection, calls):
+        self.collection = collection
+        self.calls = calls
+
+    async def find_one(self, query, projection=None):
+        self.calls.append(("find_one", query))
+        return self.collection.find_one(query, projection)
+
+    def aggregate(self, pipeline):
+        self.calls.append(("aggregate", pipeline[0]["$match"]))
+        return AsyncCursor(self.collection.aggregate(pipeline))
+
+
+class AsyncDatabase:
+    """Asynchronous wrapper of a mongomock database, recording the queries sent to it"""
+
+    def __init__(self, database):
+        self.database = database
+        self.calls = []
+
+    def __getitem__(self, name):
+        return AsyncCollection(self.database[name], self.calls)
+
+
+@pytest.fixture
+def asgi_app(mock_app, mock_async_client):
+    """An ASGI app using the same database of the mock Flask app"""
+    return BeaconASGI(mock_app, db=AsyncDatabase(mock_app.db), http=mock_async_client({}))
+
+
+@pytest.fixture
+def asgi_database(mock_app, public_dataset, test_snv):
+    """Database of the mock app, with a public dataset containing a variant"""
+    database = mock_app.db
+    database["dataset"].insert_one(public_dataset)
+    database["variant"].insert_one(test_snv)
+    update_event(database, public_dataset["_id"], "variant", True)
+    return database
+
+
+def send_request(app, method, path, query_string=b"", headers=None, body=b""):
+    """Send a request to an ASGI app
+
+    Returns:
+        status(int), headers(dict), body(bytes)
+    """
+    scope = dict(
+        type="http",
+        method=method,
+        path=path,
+        query_string=query_string,
+        headers=[(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+    )
+    messages = [dict(type="http.request", body=body, more_body=False)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    resp_headers = {key.decode(): value.decode() for key, value in sent[0]["headers"]}
+    return sent[0]["status"], resp_headers, sent[1]["body"]
+
+
+def test_asgi_info(asgi_app, asgi_database):
+    """Test the info endpoint of the ASGI app, with conditional requests"""
+
+    # WHEN the info endpoint is requested
+    status, headers, body = send_request(asgi_app, "GET", "/apiv1.0/")
+
+    # THEN it should return the beacon info with an ETag
+    assert status == 200
+    assert json.loads(body)["datasets"][0]["id"] == "public_ds"
+    assert headers["ETag"]
+
+    # AND a request with the same ETag should return 304 Not Modified
+    status, _, body = send_request(
+        asgi_app, "GET", "/apiv1.0/", headers={"If-None-Match": headers["ETag"]}
+    )
+    assert status == 304
+    assert body == b""
+
+    # AND a request with the Last-Modified date in If-Modified-Since should return 304 Not Modified
+    status, _, body = send_request(
+        asgi_app, "GET", "/apiv1.0/", headers={"If-Modified-Since": headers["Last-Modified"]}
+    )
+    assert status == 304
+    assert body == b""
+
+
+def test_asgi_get_query(asgi_app, asgi_database, mock_app):
+    """Test sending a GET query to the ASGI app"""
+
+    # WHEN the same query is sent twice
+    for _ in range(2):
+        status, _, body = send_request(asgi_app, "GET", "/apiv1.0/query", QUERY_STRING)
+
+        # THEN the variant should be found in the public dataset
+        assert status == 200
+        data = json.loads(body)
+        assert data["exists"] is True
+        assert data["datasetAlleleResponses"][0]["datasetId"] == "public_ds"
+
+    # AND the second response should be returned from the query cache
+    assert mock_app.query_cache.stats()["hits"] == 1
+
+
+def test_asgi_post_query(asgi_app, asgi_database, basic_query):
+    """Test sending a POST query to the ASGI app"""
+
+    body = json.dumps(basic_query).encode()
+    status, _, body = send_request(
+        asgi_app, "POST", "/apiv1.0/query", headers={"Content-type": "application/json"}, body=body
+    )
+
+    assert status == 200
+    data = json.loads(body)
+    assert data["exists"] is True
+    assert data["datasetAlleleResponses"] == []
+
+
+def test_asgi_query_auth_filter(asgi_app, asgi_database, registered_dataset, test_snv):
+    """Test that the ASGI app queries the database only for the datasets accessible to the user"""
+
+    # GIVEN a variant found in a registered access dataset only
+    asgi_database["dataset"].insert_one(registered_dataset)
+    asgi_database["variant"].update_one(
+        {"_id": test_snv["_id"]},
+        {"$set": {"dataset_list": ["registered_ds"], "datasetIds": {"registered_ds": {}}}},
+    )
+    update_event(asgi_database, registered_dataset["_id"], "variant", True)
+
+    for response_type, method in [("NONE", "find_one"), ("ALL", "aggregate")]:
+        # WHEN a public user sends a query
+        query_string = QUERY_STRING.replace(b"HIT", response_type.encode())
+        status, _, body = send_request(asgi_app, "GET", "/apiv1.0/query", query_string)
+
+        # THEN the variant should not be found
+        assert status == 200
+        assert json.loads(body)["exists"] is False
+
+        # AND the database should be queried once, for public datasets only
+        called_method, match_query = asgi_app.db.calls.pop()
+        assert called_method == method
+        assert "registered_ds" not in str(match_query)
+        assert "public_ds" in str(match_query)
+
+
+def test_asgi_query_bad_token(asgi_app, asgi_database, mock_app, pem):
+    """Test sending a query with an invalid auth token to the ASGI app"""
+
+    asgi_app.http.contents[mock_app.config["ELIXIR_OAUTH2"]["server"]] = pem
+    auth.JWKS_CACHE.clear()
+
+    status, _, body = send_request(
+        asgi_app,
+        "GET",
+        "/apiv1.0/query",
+        QUERY_STRING,
+        headers={"Authorization": "Bearer not_a_token"},
+    )
+    auth.JWKS_CACHE.clear()
+
+    assert status == 403
+    assert json.loads(body)["errorMessage"]
+
+
+def test_asgi_query_invalid(asgi_app, asgi_database):
+    """Test sending invalid queries to the ASGI app"""
+
+    # A query missing mandatory params should return the query error
+    status, _, body = send_request(asgi_app, "GET", "/apiv1.0/query", b"assemblyId=GRCh37")
+    assert status == 400
+    assert json.loads(body)["message"]["error"]["errorCode"] == 400
+
+    # And a body that is not a JSON object should not be parsed
+    for body in [b"[]", b'"x"', b"{"]:
+        status, _, resp_body = send_request(
+            asgi_app,
+            "POST",
+            "/apiv1.0/query",
+            headers={"Content-type": "application/json"},
+            body=body,
+        )
+        assert status == 400
+        assert json.loads(resp_body)["message"] == "Request data could not be parsed"
+
+
+def test_asgi_not_found(asgi_app):
+    """Test requesting a resource not served by the ASGI app"""
+
+    status, _, body = send_request(asgi_app, "GET", "/apiv1.0/add")
+    assert status == 404
+    assert "was not found" in json.loads(body)["message"]
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
-from cgbeacon2.server import create_app
+import logging
+
+from cgbeacon2.server import check_dataset_lists, create_app
 from cgbeacon2.instance import config_file_path
 
 
@@ -8,3 +10,22 @@ def test_create_app_from_envar(monkeypatch):
 
     monkeypatch.setenv("CGBEACON2_CONFIG", config_file_path, prepend=False)
     assert create_app()
+
+
+def test_check_dataset_lists(database, test_snv, caplog):
+    """Test the startup check warning about variants saved without dataset list"""
+
+    # GIVEN a database with a variant saved without dataset list
+    test_snv.pop("dataset_list", None)
+    database["variant"].insert_one(test_snv)
+
+    # THEN the check should log a warning
+    with caplog.at_level(logging.WARNING):
+        check_dataset_lists(database)
+    assert "cgbeacon2 update dataset-list" in caplog.text
+
+    # AND no warning should be logged once the dataset list is saved
+    caplog.clear()
+    database["variant"].update_one({}, {"$set": {"dataset_list": list(test_snv["datasetIds"])}})
+    check_dataset_lists(database)
+    assert caplog.text == ""
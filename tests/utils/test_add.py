@@ -1,4 +1,12 @@
-from cgbeacon2.utils.add import add_dataset
+import shutil
+
+import pysam
+from cyvcf2 import VCF
+from pymongo.errors import BulkWriteError
+
+from cgbeacon2.models.variant import Variant
+from cgbeacon2.resources import test_snv_vcf_path
+from cgbeacon2.utils.add import add_dataset, add_variants, add_variants_bulk
 
 
 def test_add_dataset_twice(public_dataset, database):
@@ -15,3 +23,232 @@ def test_add_dataset_twice(public_dataset, database):
 
     # THEN it should exit and return None
     assert result is None
+
+
+def test_add_variants_bulk(database):
+    """Test saving a batch of variants with a bulk write"""
+
+    # GIVEN a variant called in 2 samples of a dataset
+    parsed_variant = dict(
+        chromosome="1",
+        start=235826381,
+        end=235826383,
+        reference_bases="TA",
+        alternate_bases=["T"],
+        variant_type="INDEL",
+    )
+    samples = {"sample1": {"allele_count": 1}, "sample2": {"allele_count": 2}}
+    variant = Variant(parsed_variant, {"test_ds": {"samples": samples}})
+
+    # WHEN the variant is saved using a bulk write
+    result = add_variants_bulk(database, [variant], "test_ds")
+
+    # THEN one variant should be saved
+    assert result == 1
+    saved_variant = database["variant"].find_one()
+    assert saved_variant["_id"] == variant._id
+    assert saved_variant["referenceName"] == "1"
+    assert saved_variant["datasetIds"]["test_ds"]["samples"] == samples
+    assert saved_variant["call_count"] == 3
+
+    # WHEN the same variant is saved again for the same samples
+    result = add_variants_bulk(database, [variant], "test_ds")
+
+    # THEN no variant should be updated
+    assert result == 0
+    assert database["variant"].find_one()["call_count"] == 3
+
+    # WHEN the same variant is saved for a new sample
+    new_variant = Variant(
+        parsed_variant, {"test_ds": {"samples": {"sample3": {"allele_count": 1}}}}
+    )
+    result = add_variants_bulk(database, [new_variant], "test_ds")
+
+    # THEN the existing variant should be updated with the new sample
+    assert result == 1
+    saved_variant = database["variant"].find_one()
+    assert len(saved_variant["datasetIds"]["test_ds"]["samples"]) == 3
+    assert saved_variant["call_count"] == 4
+
+    # WHEN the same variant is saved for another dataset
+    other_variant = Variant(
+        parsed_variant, {"other_ds": {"samples": {"sample4": {"allele_count": 1}}}}
+    )
+    add_variants_bulk(database, [other_variant], "other_ds")
+
+    # THEN both datasets should be in the variant dataset list
+    assert database["variant"].find_one()["dataset_list"] == ["test_ds", "other_ds"]
+
+
+class FailingSampleWrites:
+    """Variant collection whose sample writes fail with a write error other than duplicate key"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def bulk_write(self, requests, ordered=True):
+        if any(request._upsert for request in requests):
+            raise BulkWriteError(
+                dict(
+                    nUpserted=0,
+                    writeErrors=[
+                        dict(index=index, code=2, errmsg="write failed")
+                        for index in range(len(requests))
+                    ],
+                )
+            )
+        return self.collection.bulk_write(requests, ordered=ordered)
+
+
+def test_add_variants_bulk_failed_writes(database, public_dataset):
+    """Test that variants are not added to the dataset list when their sample calls can't be saved"""
+
+    # GIVEN a dataset and a variant already saved for another dataset
+    database["dataset"].insert_one(public_dataset)
+    ds_id = public_dataset["_id"]
+    parsed_variant = dict(
+        chromosome="1",
+        start=235826381,
+        end=235826383,
+        reference_bases="TA",
+        alternate_bases=["T"],
+        variant_type="INDEL",
+    )
+    other_variant = Variant(parsed_variant, {"other_ds": {"samples": {"sample1": {"allele_count": 1}}}})
+    add_variants_bulk(database, [other_variant], "other_ds")
+
+    # WHEN saving the sample calls of the variant for the dataset fails
+    failing_db = {"variant": FailingSampleWrites(database["variant"]), "dataset": database["dataset"]}
+    variant = Variant(parsed_variant, {ds_id: {"samples": {"sample2": {"allele_count": 1}}}})
+    assert add_variants_bulk(failing_db, [variant], ds_id) == 0
+
+    # THEN the variant should not be listed in the dataset
+    assert database["variant"].find_one()["dataset_list"] == ["other_ds"]
+    # And dataset counts should not change
+    dataset = database["dataset"].find_one({"_id": ds_id})
+    assert dataset.get("variant_count", 0) == 0
+
+
+def test_add_variants_region(database, tmp_path):
+    """Test saving the variants of a single contig from an indexed VCF file"""
+
+    # GIVEN an indexed VCF file
+    vcf_path = str(tmp_path / "test_trio.vcf.gz")
+    shutil.copy(test_snv_vcf_path, vcf_path)
+    pysam.tabix_index(vcf_path, preset="vcf")
+    contig = next(iter(VCF(vcf_path))).CHROM
+
+    # WHEN variants of one contig are saved
+    inserted, parsed = add_variants(
+        database=database,
+        vcf_obj=VCF(vcf_path, samples=["ADM1059A1"]),
+        samples={"ADM1059A1"},
+        assembly="GRCh37",
+        dataset_id="test_ds",
+        region=contig,
+        show_progress=False,
+    )
+
+    # THEN only the variants of that contig should be parsed and saved
+    assert parsed == sum(1 for record in VCF(vcf_path) if record.CHROM == contig)
+    assert inserted > 0
+    assert set(database["variant"].distinct("referenceName")) == {contig.replace("chr", "")}
+
+
+def test_add_variants_multiallelic(database, tmp_path):
+    """Test saving the variants of a multi-allelic VCF record, one for each alternate allele"""
+
+    # GIVEN a VCF file with a multi-allelic record (2 alternate alleles plus a spanning deletion)
+    vcf_path = tmp_path / "multiallelic.vcf"
+    vcf_path.write_text(
+        "\n".join(
+            [
+                "##fileformat=VCFv4.2",
+                "##contig=<ID=1,length=249250621>",
+                '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+                "\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT", "s1", "s2", "s3"]),
+                "\t".join(["1", "100", ".", "A", "C,TG,*", "50", "PASS", ".", "GT", "0/1", "1/2", "2/2"]),
+            ]
+        )
+        + "\n"
+    )
+
+    # WHEN variants are saved for samples s1 and s2
+    inserted, parsed = add_variants(
+        database=database,
+        vcf_obj=VCF(str(vcf_path), samples=["s1", "s2"]),
+        samples={"s1", "s2"},
+        assembly="GRCh37",
+        dataset_id="test_ds",
+        show_progress=False,
+    )
+
+    # THEN one record should be parsed and one variant saved for each called allele
+    assert parsed == 1
+    assert inserted == 2
+    variants = {var["alternateBases"]: var for var in database["variant"].find()}
+    assert set(variants) == {"C", "TG"}
+
+    # With its own id, type and allele counts
+    snv = Variant(
+        dict(chromosome="1", start=99, end=100, reference_bases="A", alternate_bases="C"),
+        {},
+    )
+    assert variants["C"]["_id"] == snv._id
+    assert variants["C"]["variantType"] == "SNP"
+    assert variants["C"]["datasetIds"]["test_ds"]["samples"] == {
+        "s1": {"allele_count": 1},
+        "s2": {"allele_count": 1},
+    }
+    assert variants["TG"]["variantType"] == "INDEL"
+    assert variants["TG"]["datasetIds"]["test_ds"]["samples"] == {"s2": {"allele_count": 1}}
+
+
+
+def test_add_variants_multiallelic_indels(database, tmp_path):
+    """Test that the alleles of a multi-allelic indel record are saved with their minimal representation"""
+
+    # GIVEN a VCF file with a multi-allelic record containing 2 deletions and a substitution
+    vcf_path = tmp_path / "multiallelic_indels.vcf"
+    vcf_path.write_text(
+        "\n".join(
+            [
+                "##fileformat=VCFv4.2",
+                "##contig=<ID=1,length=249250621>",
+                '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+                "\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT", "s1", "s2"]),
+                "\t".join(["1", "100", ".", "ATT", "AT,A,AGT", "50", "PASS", ".", "GT", "1/2", "0/3"]),
+            ]
+        )
+        + "\n"
+    )
+
+    # WHEN the variants of the record are saved
+    add_variants(
+        database=database,
+        vcf_obj=VCF(str(vcf_path), samples=["s1", "s2"]),
+        samples={"s1", "s2"},
+        assembly="GRCh37",
+        dataset_id="test_ds",
+        show_progress=False,
+    )
+
+    # THEN bases shared with the reference should be trimmed from the end and then from the start of the alleles
+    variants = {
+        (var["referenceBases"], var["alternateBases"]): var for var in database["variant"].find()
+    }
+    assert set(variants) == {("AT", "A"), ("ATT", "A"), ("T", "G")}
+
+    # And each deletion should be saved as if found in a bi-allelic record
+    short_deletion = Variant(
+        dict(chromosome="1", start=99, end=101, reference_bases="AT", alternate_bases="A"),
+        {},
+    )
+    assert variants[("AT", "A")]["_id"] == short_deletion._id
+    assert (variants[("AT", "A")]["start"], variants[("AT", "A")]["end"]) == (99, 101)
+    assert variants[("AT", "A")]["variantType"] == "INDEL"
+    assert (variants[("ATT", "A")]["start"], variants[("ATT", "A")]["end"]) == (99, 102)
+
+    # And the substitution with its own coordinates and type
+    assert (variants[("T", "G")]["start"], variants[("T", "G")]["end"]) == (100, 101)
+    assert variants[("T", "G")]["variantType"] == "SNP"
@@ -1,5 +1,12 @@
+import asyncio
+import time
 from cgbeacon2.constants import MISSING_PUBLIC_KEY
-from cgbeacon2.utils.auth import elixir_key, claims, decode_passport
+from cgbeacon2.utils import auth
+from cgbeacon2.utils.auth import elixir_key, claims, decode_passport, KeySetCache
+from cgbeacon2.utils.cache import TokenCache
+
+KEY_SET = {"keys": [{"kid": "key1", "kty": "oct"}]}
+ROTATED_KEY_SET = {"keys": [{"kid": "key2", "kty": "oct"}]}
 
 
 def test_elixir_key_wrong_key():
@@ -67,3 +74,174 @@ def test_claims_with_aud_and_issuers():
     assert claims_options["aud"]["values"] == ",".join(mock_oauth2_settings["audience"])
     assert claims_options["aud"]["essential"] == True
     assert claims_options["exp"]["essential"] == True
+
+
+def test_key_set_cache(monkeypatch):
+    """Test that public key sets are downloaded once and then read from cache"""
+
+    downloads = []
+
+    def mock_download_key(server):
+        downloads.append(server)
+        return KEY_SET
+
+    monkeypatch.setattr(auth, "download_key", mock_download_key)
+    cache = KeySetCache()
+
+    # WHEN the key set of a server is requested twice
+    assert cache.get("jwk_server", "key1") == KEY_SET
+    assert cache.get("jwk_server", "key1") == KEY_SET
+
+    # THEN it should be downloaded only once
+    assert downloads == ["jwk_server"]
+
+
+def test_key_set_cache_download_error(monkeypatch):
+    """Test that key set download errors are not cached"""
+
+    monkeypatch.setattr(auth, "download_key", lambda server: MISSING_PUBLIC_KEY)
+    cache = KeySetCache()
+
+    # WHEN the key set can't be downloaded
+    assert cache.get("jwk_server") == MISSING_PUBLIC_KEY
+
+    # THEN it should be downloaded at next request
+    monkeypatch.setattr(auth, "download_key", lambda server: KEY_SET)
+    assert cache.get("jwk_server") == KEY_SET
+
+
+def test_key_set_cache_kid_miss(monkeypatch):
+    """Test that a cached key set is downloaded again if it doesn't contain the requested key id"""
+
+    key_sets = [KEY_SET, ROTATED_KEY_SET]
+    monkeypatch.setattr(auth, "download_key", lambda server: key_sets.pop(0))
+    cache = KeySetCache(kid_refresh_interval=0)
+
+    # GIVEN a cached key set
+    assert cache.get("jwk_server", "key1") == KEY_SET
+
+    # WHEN a key id not contained in the key set is requested
+    # THEN the key set should be downloaded again
+    assert cache.get("jwk_server", "key2") == ROTATED_KEY_SET
+
+
+def test_key_set_cache_stale(monkeypatch):
+    """Test that an expired key set is returned while a new one is downloaded in background"""
+
+    key_sets = [KEY_SET, ROTATED_KEY_SET]
+    monkeypatch.setattr(
+        auth, "download_key", lambda server: key_sets.pop(0) if len(key_sets) > 1 else key_sets[0]
+    )
+    cache = KeySetCache(ttl=0)
+
+    # GIVEN an expired key set
+    assert cache.get("jwk_server") == KEY_SET
+
+    # THEN the stale key set should be returned
+    assert cache.get("jwk_server") == KEY_SET
+
+    # AND replaced by the downloaded one
+    for _ in range(100):
+        if cache.get("jwk_server") == ROTATED_KEY_SET:
+            break
+        time.sleep(0.01)
+    assert cache.get("jwk_server") == ROTATED_KEY_SET
+
+
+def test_key_set_cache_fresh():
+    """Test the function that checks if a cached key set can be used without downloading it"""
+
+    cache = KeySetCache(ttl=60, stale_ttl=0)
+
+    # GIVEN an empty cache
+    assert cache.fresh("jwk_server") is False
+    assert cache.cached("jwk_server") is None
+
+    # WHEN a key set is saved
+    cache.store("jwk_server", KEY_SET)
+
+    # THEN it should be fresh and returned without downloading it
+    assert cache.fresh("jwk_server", "key1") is True
+    assert cache.cached("jwk_server") == KEY_SET
+
+
+def test_authlevel_async_no_token():
+    """Test the asynchronous auth level function with a request without Authorization header"""
+
+    # GIVEN a request without auth token
+    auth_level = asyncio.run(auth.authlevel_async({}, {"server": "FOO"}))
+
+    # THEN public access should be granted
+    assert auth_level == ([], False)
+
+
+def test_authlevel_async(mock_app, monkeypatch, test_token, pem, mock_oauth2, mock_async_client):
+    """Test the asynchronous auth level function with a valid token"""
+
+    oauth2_settings = dict(mock_app.config["ELIXIR_OAUTH2"], userinfo=mock_oauth2["userinfo"])
+
+    # GIVEN a mock server providing the public key and user passports
+    http = mock_async_client(
+        {oauth2_settings["server"]: pem, oauth2_settings["userinfo"]: {"ga4gh_passport_v1": []}}
+    )
+    monkeypatch.setattr(auth, "check_passports", lambda passports, requirements: (["dataset"], True))
+    auth.JWKS_CACHE.clear()
+
+    headers = {"Authorization": "Bearer " + test_token}
+    token_cache = TokenCache()
+
+    # WHEN the auth level is requested twice for the same token
+    for _ in range(2):
+        auth_level = asyncio.run(auth.authlevel_async(headers, oauth2_settings, token_cache, http))
+        assert auth_level == (["dataset"], True)
+
+    # THEN public key and user data should be downloaded only once
+    assert http.requests == [oauth2_settings["server"], oauth2_settings["userinfo"]]
+    assert token_cache.stats()["hits"] == 1
+    auth.JWKS_CACHE.clear()
+
+
+def test_check_passports(monkeypatch, pem, registered_access_passport_info, bona_fide_passport_info):
+    """Test that passports are validated concurrently, downloading each public key set once"""
+
+    key_requests = []
+
+    def mock_elixir_key(server, kid=None):
+        key_requests.append(server)
+        return pem
+
+    monkeypatch.setattr(auth, "elixir_key", mock_elixir_key)
+
+    # GIVEN a list of passports containing duplicates, signed with the same key
+    passports = registered_access_passport_info * 3 + bona_fide_passport_info * 2
+    bona_fide_terms = "https://doi.org/10.1038/s41431-018-0219-y"
+
+    # THEN passports should be validated
+    assert auth.check_passports(passports, bona_fide_terms) == (["registered_ds"], True)
+
+    # AND the public key set should be requested once
+    assert key_requests == ["http://scilifelab.se/jkw"]
+
+
+def test_prefetch_keys_stale(monkeypatch, mock_async_client):
+    """Test that a stale key set is used by the asynchronous auth while it is refreshed in background"""
+
+    monkeypatch.setattr(auth, "download_key", lambda server: ROTATED_KEY_SET)
+    cache = KeySetCache(ttl=0)
+    monkeypatch.setattr(auth, "JWKS_CACHE", cache)
+
+    # GIVEN a stale key set
+    cache.store("jwk_server", KEY_SET)
+    http = mock_async_client({})
+
+    # WHEN keys are prefetched before validating a token
+    asyncio.run(auth.prefetch_keys(http, [("jwk_server", "key1")]))
+
+    # THEN the stale key set should not be downloaded inline
+    assert http.requests == []
+    # AND it should be replaced by the key set downloaded in background
+    for _ in range(100):
+        if cache.cached("jwk_server") == ROTATED_KEY_SET:
+            break
+        time.sleep(0.01)
+    assert cache.cached("jwk_server") == ROTATED_KEY_SET
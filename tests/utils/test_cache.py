@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import time
+
+from cgbeacon2.utils.cache import DatasetRegistry, InfoCache, QueryCache, TokenCache
+from cgbeacon2.utils.update import update_event
+
+
+def test_dataset_registry_reload_on_event(database, public_dataset, registered_dataset):
+    """Test that the dataset registry is reloaded when a new event is saved in database"""
+
+    # GIVEN a database with a public dataset
+    database["dataset"].insert_one(public_dataset)
+    update_event(database, public_dataset["_id"], "dataset", True)
+
+    # THEN the registry should return it
+    registry = DatasetRegistry()
+    assert list(registry.datasets(database)) == [public_dataset["_id"]]
+    assert registry.dataset_ids(database, "public") == [public_dataset["_id"]]
+    snapshot = registry.snapshot(database)
+
+    # WHEN database is not modified
+    # THEN the registry should return the same cached datasets
+    assert registry.snapshot(database) is snapshot
+
+    # WHEN the dataset is modified and a new event is saved
+    database["dataset"].update_one({"_id": public_dataset["_id"]}, {"$set": {"authlevel": "controlled"}})
+    update_event(database, public_dataset["_id"], "dataset", True)
+
+    # THEN the registry should reload the datasets
+    assert registry.dataset_ids(database, "public") == []
+    assert registry.dataset_ids(database, "controlled") == [public_dataset["_id"]]
+
+
+def test_dataset_registry_ttl(database, public_dataset, registered_dataset):
+    """Test that the dataset registry doesn't check database for changes before its TTL expires"""
+
+    # GIVEN a registry with a long TTL, loaded with one dataset
+    database["dataset"].insert_one(public_dataset)
+    registry = DatasetRegistry(ttl=3600)
+    assert len(registry.datasets(database)) == 1
+
+    # WHEN another dataset is added
+    database["dataset"].insert_one(registered_dataset)
+
+    # THEN the registry should return cached datasets
+    assert len(registry.datasets(database)) == 1
+
+    # UNLESS it is invalidated
+    registry.invalidate()
+    assert len(registry.datasets(database)) == 2
+
+
+def test_token_cache():
+    """Test saving and retrieving the access level of a token"""
+
+    # GIVEN a token cache
+    cache = TokenCache()
+
+    # WHEN a token is not in cache
+    # THEN None should be returned
+    assert cache.get("token") is None
+
+    # WHEN the access level of the token is saved
+    cache.set("token", (["registered_ds"], True), round(time.time()) + 60)
+
+    # THEN it should be returned from cache
+    assert cache.get("token") == (["registered_ds"], True)
+    assert cache.stats() == dict(hits=1, misses=1, size=1)
+
+
+def test_token_cache_expired_token():
+    """Test that the access level of an expired token is not returned"""
+
+    # GIVEN a token cache containing an expired token
+    cache = TokenCache()
+    cache.set("token", (["registered_ds"], True), round(time.time()) - 1)
+
+    # THEN its access level should not be returned
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_token_cache_maxsize():
+    """Test that the least recently used token is removed when cache is full"""
+
+    # GIVEN a token cache that can contain 2 tokens
+    cache = TokenCache(maxsize=2)
+    cache.set("token1", ([], False))
+    cache.set("token2", ([], True))
+    cache.get("token1")
+
+    # WHEN a third token is saved
+    cache.set("token3", (["registered_ds"], False))
+
+    # THEN the least recently used token should be removed
+    assert cache.get("token2") is None
+    assert cache.get("token1") == ([], False)
+    assert cache.get("token3") == (["registered_ds"], False)
+
+
+def test_info_cache(database, public_dataset):
+    """Test that the info document is rebuilt only when the dataset registry reloads the datasets"""
+
+    # GIVEN a database with a public dataset
+    database["dataset"].insert_one(public_dataset)
+    update_event(database, public_dataset["_id"], "dataset", True)
+    registry = DatasetRegistry()
+    info_cache = InfoCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return f"info {len(builds)}".encode()
+
+    # WHEN the info document is requested twice with the same registry snapshot
+    body, etag, last_modified = info_cache.get(registry.snapshot(database), build)
+    assert info_cache.get(registry.snapshot(database), build) == (body, etag, last_modified)
+
+    # THEN it should be built only once, with the date of the last event
+    assert len(builds) == 1
+    assert last_modified == database["event"].find_one()["created"]
+
+    # WHEN a new event is saved
+    update_event(database, public_dataset["_id"], "variant", True)
+
+    # THEN the document should be rebuilt with a new ETag
+    new_body, new_etag, _ = info_cache.get(registry.snapshot(database), build)
+    assert len(builds) == 2
+    assert new_etag != etag
+
+
+
+def test_query_cache(database, public_dataset):
+    """Test the LRU cache of query responses, cleared when the dataset registry reloads the datasets"""
+
+    # GIVEN a database with a public dataset
+    database["dataset"].insert_one(public_dataset)
+    update_event(database, public_dataset["_id"], "dataset", True)
+    registry = DatasetRegistry()
+    cache = QueryCache(maxsize=2)
+    snapshot = registry.snapshot(database)
+
+    # Cache keys shouldn't depend on the order of query params and datasets
+    key = QueryCache.key({"a": 1, "b": 2}, "HIT", ["ds1", "ds2"], {"public_ds"})
+    assert key == QueryCache.key({"b": 2, "a": 1}, "HIT", ["ds2", "ds1"], {"public_ds"})
+    assert key != QueryCache.key({"a": 1, "b": 2}, "HIT", ["ds1", "ds2"], {"public_ds", "ds3"})
+
+    # WHEN 3 responses are saved
+    for response_type in ["ALL", "HIT", "MISS"]:
+        cache.get(snapshot, response_type)
+        cache.set(snapshot, response_type, (True, []))
+
+    # THEN only the 2 most recent should be kept
+    assert cache.get(snapshot, "ALL") is None
+    assert cache.get(snapshot, "MISS") == (True, [])
+
+    # WHEN a new event is saved
+    update_event(database, public_dataset["_id"], "variant", True)
+
+    # THEN cached responses should be dropped
+    assert cache.get(registry.snapshot(database), "MISS") is None
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from cgbeacon2.utils.auth import KeySetCache
+from cgbeacon2.utils.cache import DatasetRegistry, QueryCache, TokenCache
+from cgbeacon2.utils.cache_backends import MemoryBackend, RedisBackend, create_backend
+from cgbeacon2.utils.update import update_event
+
+KEY_SET = {"keys": [{"kid": "key1", "kty": "oct"}]}
+
+
+@pytest.fixture
+def redis_backend():
+    """A Redis cache backend connected to an in-process fake Redis server"""
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisBackend(client=fakeredis.FakeRedis())
+
+
+def test_create_backend():
+    """Test the function creating the cache backend from the app settings"""
+
+    # No backend should be created for in-memory caches
+    assert create_backend(None) is None
+    assert create_backend(dict(type="memory")) is None
+
+    # And an unknown backend type should raise error
+    with pytest.raises(ValueError):
+        create_backend(dict(type="memcached"))
+
+
+def test_memory_backend():
+    """Test the in-memory LRU cache backend"""
+
+    backend = MemoryBackend(maxsize=2)
+
+    # WHEN 3 values are saved
+    backend.set("token:1", 1)
+    backend.set("token:2", 2)
+    backend.set("query:3", 3, ttl=0)
+
+    # THEN the least recently used should be removed and the expired one should not be returned
+    assert backend.get("token:1") is None
+    assert backend.get("token:2") == 2
+    assert backend.get("query:3") is None
+
+    # AND values should be removed by prefix
+    backend.set("query:4", 4)
+    backend.clear("token:")
+    assert backend.size() == 1
+
+
+def test_redis_backend(redis_backend):
+    """Test saving and retrieving values from a Redis cache backend"""
+
+    # WHEN values are saved
+    redis_backend.set("token:1", (["registered_ds"], True))
+    redis_backend.set("query:1", "expired", ttl=0.001)
+    time.sleep(0.01)
+
+    # THEN they should be returned after JSON serialization
+    assert redis_backend.get("token:1") == [["registered_ds"], True]
+    assert redis_backend.get("query:1") is None
+
+    # AND removed by prefix
+    redis_backend.clear("token:")
+    assert redis_backend.get("token:1") is None
+
+
+def test_redis_backend_unreachable():
+    """Test that errors connecting to the Redis server are handled as cache misses"""
+
+    pytest.importorskip("redis")
+    backend = RedisBackend(url="redis://localhost:1/0")
+
+    backend.set("token:1", 1)
+    assert backend.get("token:1") is None
+
+
+def test_shared_token_cache(redis_backend):
+    """Test that token access levels are shared by caches using the same Redis backend"""
+
+    # GIVEN a token validated by one app process
+    TokenCache(backend=redis_backend).set("token", (["registered_ds"], True))
+
+    # THEN its access level should be returned by another process
+    assert TokenCache(backend=redis_backend).get("token") == (["registered_ds"], True)
+
+
+def test_shared_key_set_cache(redis_backend):
+    """Test that public key sets are shared by caches using the same Redis backend"""
+
+    # GIVEN a key set downloaded by one app process
+    KeySetCache(backend=redis_backend).store("jwk_server", KEY_SET)
+
+    # THEN another process should use it without downloading it
+    cache = KeySetCache(backend=redis_backend)
+    assert cache.fresh("jwk_server", "key1") is True
+    assert cache.get("jwk_server", "key1") == KEY_SET
+
+
+def test_shared_registry_and_query_cache(database, public_dataset, redis_backend):
+    """Test that datasets and query responses are shared by caches using the same Redis backend"""
+
+    # GIVEN a database with a public dataset
+    database["dataset"].insert_one(public_dataset)
+    update_event(database, public_dataset["_id"], "dataset", True)
+
+    # WHEN datasets are loaded and a query response is saved by one app process
+    snapshot = DatasetRegistry(backend=redis_backend).snapshot(database)
+    query_cache = QueryCache(backend=redis_backend)
+    query_cache.get(snapshot, "query")
+    query_cache.set(snapshot, "query", (True, []))
+
+    # THEN another process should read the datasets from the backend
+    other_registry = DatasetRegistry(backend=redis_backend)
+    other_registry._load = None  # database is not used
+    other_snapshot = other_registry.snapshot(database)
+    assert other_snapshot == snapshot
+
+    # AND the cached query response
+    assert QueryCache(backend=redis_backend).get(other_snapshot, "query") == (True, [])
+
+    # WHEN a new event is saved
+    update_event(database, public_dataset["_id"], "variant", True)
+
+    # THEN the cached response should not be returned anymore
+    new_snapshot = DatasetRegistry(backend=redis_backend).snapshot(database)
+    assert QueryCache(backend=redis_backend).get(new_snapshot, "query") is None
+
+
+def test_shared_query_cache_maxsize(redis_backend):
+    """Test that a query cache using a Redis backend keeps max `maxsize` responses"""
+
+    # GIVEN a query cache of size 2 using a Redis backend
+    query_cache = QueryCache(maxsize=2, backend=redis_backend)
+    snapshot = dict(version="1")
+    query_cache.get(snapshot, "query1")
+
+    # WHEN 3 responses are saved
+    for query in ["query1", "query2", "query3"]:
+        query_cache.set(snapshot, query, (True, []))
+        time.sleep(0.01)
+
+    # THEN the oldest one should be removed
+    assert query_cache.get(snapshot, "query1") is None
+    assert query_cache.get(snapshot, "query2") == (True, [])
+    assert query_cache.get(snapshot, "query3") == (True, [])
+
+    # AND all responses should be removed when the cache is cleared
+    query_cache.clear()
+    assert redis_backend.client.keys("*") == []
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from cgbeacon2.models.variant import Variant
+from cgbeacon2.utils.add import add_variants_bulk, add_variant
+from cgbeacon2.utils.delete import delete_variants
+from cgbeacon2.utils.update import dataset_stats
+
+PARSED_VARIANT = dict(
+    chromosome="1",
+    start=235826381,
+    end=235826383,
+    reference_bases="TA",
+    alternate_bases=["T"],
+    variant_type="INDEL",
+)
+
+
+def test_incremental_dataset_counts(database, public_dataset):
+    """Test that dataset counts updated while adding and removing variants match a full recount"""
+
+    # GIVEN a dataset
+    database["dataset"].insert_one(public_dataset)
+    ds_id = public_dataset["_id"]
+    other_variant = dict(PARSED_VARIANT, start=235826391, end=235826393)
+
+    # WHEN variants are saved for 2 samples, with bulk and single variant writes
+    add_variants_bulk(
+        database,
+        [
+            Variant(PARSED_VARIANT, {ds_id: {"samples": {"sample1": {"allele_count": 1}}}}),
+            Variant(other_variant, {ds_id: {"samples": {"sample1": {"allele_count": 2}}}}),
+        ],
+        ds_id,
+    )
+    add_variant(
+        database,
+        Variant(PARSED_VARIANT, {ds_id: {"samples": {"sample2": {"allele_count": 2}}}}),
+        ds_id,
+    )
+    # And the same variants are saved again
+    add_variants_bulk(
+        database, [Variant(PARSED_VARIANT, {ds_id: {"samples": {"sample1": {"allele_count": 1}}}})], ds_id
+    )
+
+    # THEN dataset counts should match the counts computed from the variant collection
+    dataset = database["dataset"].find_one()
+    assert dataset_stats(database)[ds_id] == dict(variant_count=2, allele_count=5)
+    assert (dataset["variant_count"], dataset["allele_count"]) == (2, 5)
+
+    # WHEN the variants of a sample are removed
+    delete_variants(database, ds_id, ["sample1"])
+
+    # THEN dataset counts should be updated
+    dataset = database["dataset"].find_one()
+    assert dataset_stats(database)[ds_id] == dict(variant_count=1, allele_count=2)
+    assert (dataset["variant_count"], dataset["allele_count"]) == (1, 2)
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from cgbeacon2.utils.delete import delete_dataset
+from cgbeacon2.utils.delete import delete_dataset, delete_dataset_variants, delete_variants
 
 
 def test_delete_dataset_none_id():
@@ -8,3 +8,133 @@ def test_delete_dataset_none_id():
 
     result = delete_dataset(None, "dataset_id")
     assert result is None
+
+
+def test_delete_variants_shared_variant(database, test_snv):
+    """Test removing the samples of a dataset from a variant found in more than one dataset"""
+
+    # GIVEN a variant found in 2 datasets
+    test_snv["datasetIds"]["other_ds"] = {"samples": {"ADM1059A2": {"allele_count": 1}}}
+    test_snv["dataset_list"] = ["public_ds", "other_ds"]
+    test_snv["call_count"] = 3
+    database["variant"].insert_one(test_snv)
+
+    # WHEN the only sample of one dataset is removed
+    updated, removed = delete_variants(database, "public_ds", ["ADM1059A1"])
+
+    # THEN the variant should be updated and not removed
+    assert (updated, removed) == (1, 0)
+    variant = database["variant"].find_one()
+    assert list(variant["datasetIds"]) == ["other_ds"]
+    assert variant["dataset_list"] == ["other_ds"]
+    assert variant["call_count"] == 1
+
+    # WHEN the sample of the other dataset is removed
+    updated, removed = delete_variants(database, "other_ds", ["ADM1059A2"])
+
+    # THEN the variant should be removed
+    assert (updated, removed) == (0, 1)
+    assert database["variant"].find_one() is None
+
+
+def test_delete_variants_multiple_samples(database, test_snv, test_sv):
+    """Test removing the variants of some samples of a dataset, with different allele counts"""
+
+    # GIVEN a dataset with 2 samples
+    database["dataset"].insert_one(
+        {"_id": "public_ds", "samples": ["s1", "s2"], "variant_count": 2, "allele_count": 5}
+    )
+    # And a variant called in both samples
+    test_snv["datasetIds"] = {
+        "public_ds": {"samples": {"s1": {"allele_count": 2}, "s2": {"allele_count": 1}}}
+    }
+    test_snv["dataset_list"] = ["public_ds"]
+    test_snv["call_count"] = 3
+    # And a variant called in the first sample only
+    test_sv["datasetIds"] = {"public_ds": {"samples": {"s1": {"allele_count": 2}}}}
+    test_sv["dataset_list"] = ["public_ds"]
+    test_sv["call_count"] = 2
+    database["variant"].insert_many([test_snv, test_sv])
+
+    # WHEN the first sample is removed
+    updated, removed = delete_variants(database, "public_ds", ["s1"])
+
+    # THEN the variant found in both samples should be updated, the other removed
+    assert (updated, removed) == (1, 1)
+    variant = database["variant"].find_one()
+    assert variant["_id"] == test_snv["_id"]
+    assert variant["datasetIds"]["public_ds"]["samples"] == {"s2": {"allele_count": 1}}
+    assert variant["call_count"] == 1
+
+    # AND the dataset counts should be decremented
+    dataset = database["dataset"].find_one()
+    assert dataset["variant_count"] == 1
+    assert dataset["allele_count"] == 1
+
+    # WHEN removing a sample with no variants in the dataset
+    # THEN no variant should be updated or removed
+    assert delete_variants(database, "public_ds", ["s1"]) == (0, 0)
+
+
+def test_delete_dataset_variants_chunks(database, test_snv, test_sv, test_bnd_sv):
+    """Test removing all variants of a dataset in chunks"""
+
+    # GIVEN a variant found only in a dataset and a variant of another dataset
+    database["variant"].insert_many([test_sv, test_bnd_sv])
+    # And a variant found in the same dataset and another one
+    test_snv["datasetIds"]["other_ds"] = {"samples": {"ADM1059A2": {"allele_count": 2}}}
+    test_snv["dataset_list"] = ["public_ds", "other_ds"]
+    test_snv["call_count"] = 4
+    database["variant"].insert_one(test_snv)
+
+    # WHEN the variants of the dataset are removed one at a time
+    chunks = []
+    updated, removed = delete_dataset_variants(
+        database,
+        "public_ds",
+        batch_size=1,
+        progress=lambda processed, modified: chunks.append(processed),
+    )
+
+    # THEN progress should be reported after each chunk
+    assert chunks == [1, 2]
+    # AND the variant found only in the dataset should be removed
+    assert (updated, removed) == (1, 1)
+    assert database["variant"].find_one({"_id": test_sv["_id"]}) is None
+    # AND the variant of the other dataset should not be modified
+    assert database["variant"].find_one({"_id": test_bnd_sv["_id"]}) == test_bnd_sv
+    # AND the shared variant should no longer contain the dataset
+    variant = database["variant"].find_one({"_id": test_snv["_id"]})
+    assert variant["_id"] == test_snv["_id"]
+    assert list(variant["datasetIds"]) == ["other_ds"]
+    assert variant["dataset_list"] == ["other_ds"]
+    assert variant["call_count"] == 2
+
+    # WHEN the deletion is run again
+    # THEN no variant should be updated or removed
+    assert delete_dataset_variants(database, "public_ds", batch_size=0) == (0, 0)
+
+
+
+def test_delete_dataset_cascade(database, public_dataset, test_snv, test_sv):
+    """Test that deleting a dataset removes its variants too"""
+
+    # GIVEN a dataset with a variant found only in this dataset
+    database["dataset"].insert_one(public_dataset)
+    database["variant"].insert_one(test_sv)
+    # And a variant shared with another dataset
+    test_snv["datasetIds"]["other_ds"] = {"samples": {"ADM1059A2": {"allele_count": 2}}}
+    test_snv["dataset_list"] = [public_dataset["_id"], "other_ds"]
+    test_snv["call_count"] = 4
+    database["variant"].insert_one(test_snv)
+
+    # WHEN the dataset is deleted
+    assert delete_dataset(database, public_dataset["_id"], batch_size=1) == 1
+
+    # THEN the dataset and its own variant should be removed
+    assert database["dataset"].find_one() is None
+    assert database["variant"].find_one({"_id": test_sv["_id"]}) is None
+    # AND the shared variant should no longer contain the dataset
+    variant = database["variant"].find_one({"_id": test_snv["_id"]})
+    assert variant["dataset_list"] == ["other_ds"]
+    assert list(variant["datasetIds"]) == ["other_ds"]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import responses
+
+from cgbeacon2.utils import http_client
+
+
+def test_configure():
+    """Test creating the shared HTTP session with custom settings"""
+
+    # WHEN the HTTP client is configured with custom settings
+    http_client.configure(dict(retries=5, pool_maxsize=20))
+
+    # THEN the session adapters should use them
+    adapter = http_client.session().get_adapter("https://login.elixir-czech.org")
+    assert adapter.max_retries.total == 5
+    assert adapter._pool_maxsize == 20
+
+    # AND default values should be used for missing settings
+    assert adapter._pool_connections == http_client.DEFAULT_SETTINGS["pool_connections"]
+
+    http_client.configure()
+
+
+def test_get_default_timeout(monkeypatch):
+    """Test that requests are sent with the configured timeout"""
+
+    sent_kwargs = {}
+
+    def mock_get(url, **kwargs):
+        sent_kwargs.update(kwargs)
+
+    monkeypatch.setattr(http_client.session(), "get", mock_get)
+
+    # WHEN a request is sent without specifying a timeout
+    http_client.get("https://login.elixir-czech.org/oidc/jwk")
+
+    # THEN the default timeout should be used
+    assert sent_kwargs["timeout"] == http_client.DEFAULT_SETTINGS["timeout"]
+
+
+@responses.activate
+def test_get():
+    """Test sending a GET request using the shared session"""
+
+    # GIVEN a mocked server response
+    url = "https://login.elixir-czech.org/oidc/jwk"
+    responses.add(responses.GET, url, json={"keys": []}, status=200)
+
+    # WHEN a request is sent twice
+    for _ in range(2):
+        resp = http_client.get(url)
+        # THEN the response should be returned
+        assert resp.json() == {"keys": []}
+
+    assert len(responses.calls) == 2
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import datetime
+import socket
+import subprocess
+import sys
+import threading
+
+from cgbeacon2.utils.jobs import JobQueue, fail_lost_jobs, job_status
+
+
+def running_job(job_id, owner, updated):
+    """Return a job document saved by a running job"""
+    return dict(
+        _id=job_id,
+        type="add",
+        status="running",
+        params={},
+        owner=owner,
+        created=updated,
+        started=updated,
+        updated=updated,
+        progress=dict(processed=0, modified=0, total=None),
+    )
+
+
+def dead_pid():
+    """Return the id of a process that has already exited"""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_job_status_lost_jobs(database):
+    """Test that job status reports jobs lost by stopped server processes as failed"""
+
+    now = datetime.datetime.now()
+    hour_ago = now - datetime.timedelta(hours=1)
+    host = socket.gethostname()
+
+    # GIVEN a job created by a process of this host that doesn't exist anymore
+    database["job"].insert_one(running_job("dead_owner", dict(host=host, pid=dead_pid()), now))
+    # AND a job of another host not updated for one hour
+    database["job"].insert_one(running_job("stale", dict(host="other_host", pid=1), hour_ago))
+    # AND a job of another host recently updated
+    database["job"].insert_one(running_job("alive", dict(host="other_host", pid=1), now))
+
+    # THEN the lost jobs should be returned as failed
+    for job_id in ["dead_owner", "stale"]:
+        job = job_status(database, job_id, stale_after=300)
+        assert job["status"] == "failed"
+        assert "interrupted" in job["error"]
+        assert job["finished"]
+
+    # AND the job still updated by its process should be running
+    assert job_status(database, "alive", stale_after=300)["status"] == "running"
+
+    # AND no more lost jobs should be found
+    assert fail_lost_jobs(database) == 0
+
+
+def test_job_queue_heartbeat(mock_app):
+    """Test that jobs save their process and last update time while running"""
+
+    queue = JobQueue(workers=1, heartbeat=0.01)
+    started = threading.Event()
+    finish = threading.Event()
+
+    def slow_job(progress):
+        started.set()
+        finish.wait(5)
+        return "done"
+
+    # WHEN a job is running
+    job_id = queue.submit(mock_app, "add", {}, slow_job)
+    started.wait(5)
+    created = mock_app.db["job"].find_one({"_id": job_id})
+
+    # THEN it should save the process running it
+    assert created["owner"]["host"] == socket.gethostname()
+
+    # AND its update time should be refreshed while running
+    finish.wait(0.1)
+    job = job_status(mock_app.db, job_id, stale_after=300)
+    assert job["status"] == "running"
+    assert job["updated"] > created["created"]
+
+    finish.set()
+    queue.shutdown()
+    assert mock_app.db["job"].find_one({"_id": job_id})["status"] == "completed"
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from cgbeacon2.utils.cache import TokenCache
+from cgbeacon2.utils.cache_backends import RedisBackend
+from cgbeacon2.utils.metrics import Registry
+
+
+def test_counter():
+    """Test rendering counters with labels in Prometheus text format"""
+
+    registry = Registry()
+    errors = registry.counter("errors_total", "Number of errors", ["errorCode"])
+
+    # WHEN counters are increased
+    errors.inc(errorCode=400)
+    errors.inc(errorCode=400)
+    errors.inc(errorCode=401)
+
+    # THEN their values should be rendered with their labels
+    text = registry.render()
+    assert "# TYPE errors_total counter" in text
+    assert 'errors_total{errorCode="400"} 2' in text
+    assert 'errors_total{errorCode="401"} 1' in text
+
+
+def test_histogram():
+    """Test rendering histograms in Prometheus text format"""
+
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", ["stage"], buckets=[0.1, 1])
+
+    # WHEN values are observed
+    for value in [0.05, 0.5, 5]:
+        latency.observe(value, stage="auth")
+
+    # THEN buckets should contain cumulative counts
+    text = registry.render()
+    assert 'latency_seconds_bucket{stage="auth",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="auth",le="1"} 2' in text
+    assert 'latency_seconds_bucket{stage="auth",le="+Inf"} 3' in text
+    assert 'latency_seconds_sum{stage="auth"} 5.55' in text
+    assert 'latency_seconds_count{stage="auth"} 3' in text
+
+    # AND the time spent in a code block should be observed
+    with latency.time(stage="database"):
+        pass
+    assert latency.count(stage="database") == 1
+
+
+def test_cache_metrics(mock_app):
+    """Test rendering cache usage stats"""
+
+    # GIVEN a cached token
+    mock_app.token_cache.set("token", ([], False))
+    mock_app.token_cache.get("token")
+
+    text = Registry().render(dict(token=mock_app.token_cache))
+    assert 'cgbeacon2_cache_hits_total{cache="token"} 1' in text
+    assert 'cgbeacon2_cache_size{cache="token"} 1' in text
+
+
+def test_shared_metrics():
+    """Test that metrics of different app processes are aggregated in a shared cache backend"""
+
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+
+    # GIVEN 2 app processes (workers) saving their metrics in the same Redis backend
+    workers = []
+    for _ in range(2):
+        registry = Registry()
+        errors = registry.counter("errors_total", "Number of errors", ["errorCode"])
+        latency = registry.histogram("latency_seconds", "Latency", buckets=[1])
+        token_cache = TokenCache()
+        backend = RedisBackend(client=fakeredis.FakeRedis(server=server))
+        registry.configure(backend, dict(token=token_cache), interval=3600)
+        workers.append((registry, errors, latency, token_cache))
+
+    # WHEN each worker collects values
+    for registry, errors, latency, token_cache in workers:
+        errors.inc(errorCode=400)
+        latency.observe(0.5)
+        token_cache.get("token")
+
+    # THEN metrics returned by any worker should include the values of all workers,
+    # once they are saved to the backend
+    workers[1][0].sync()
+    text = workers[0][0].render()
+    assert 'errors_total{errorCode="400"} 2' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert "latency_seconds_sum 1" in text
+    assert 'cgbeacon2_cache_misses_total{cache="token"} 2' in text
+
+    # AND values shouldn't be added twice
+    workers[1][0].sync()
+    assert 'errors_total{errorCode="400"} 2' in workers[1][0].render()
+    workers[0][0].configure()
+    workers[1][0].configure()
@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
+import numpy
+import shutil
 import pybedtools
-from cgbeacon2.resources import panel1_path, panel2_path
+import pysam
+from cgbeacon2.resources import panel1_path, panel2_path, test_snv_vcf_path
 from cgbeacon2.utils.parse import (
+    count_variants,
     merge_intervals,
     extract_variants,
     bnd_mate_name,
     sv_end,
-    genes_to_bedtool
+    genes_to_bedtool,
+    variant_called,
+    alleles_called,
 )
 
 ALT = "G]17:198982]"
@@ -48,6 +54,42 @@ def test_genes_to_bedtool_ensembl_ids(database, gene_objects_build37):
     # With 3 gene intervals
     assert len(bt) == 3
 
+def test_variant_called():
+    """Test the function that collects the samples carrying a variant from cyvcf2 genotypes"""
+    # GIVEN a VCF with 4 samples: HOM_REF, HET, UNKNOWN and HOM_ALT
+    vcf_samples = ["s0", "s1", "s2", "s3"]
+    g_types = numpy.array([0, 1, 2, 3], dtype=numpy.int8)
+
+    # WHEN checking the calls for all samples
+    calls = variant_called(vcf_samples, numpy.array([0, 1, 2, 3]), g_types)
+    # THEN only samples with HET and HOM_ALT calls should be returned with their allele count
+    assert calls == {"s1": {"allele_count": 1}, "s3": {"allele_count": 2}}
+
+    # WHEN checking the calls of the samples without an alternate allele only
+    # THEN no sample should be returned
+    assert variant_called(vcf_samples, [0, 2], g_types) == {}
+
+    # WHEN checking the calls of the HOM_ALT sample only
+    # THEN only this sample should be returned
+    assert variant_called(vcf_samples, [3], g_types) == {"s3": {"allele_count": 2}}
+
+
+def test_alleles_called():
+    """Test the function that collects the samples carrying each allele of a multi-allelic record"""
+    # GIVEN the genotypes of 4 samples for a record with 2 alternate alleles: 0/1, 1/2, 2/2 (phased) and ./.
+    vcf_samples = ["s0", "s1", "s2", "s3"]
+    genotypes = numpy.array([[0, 1, 0], [1, 2, 0], [2, 2, 1], [-1, -1, 0]], dtype=numpy.int16)
+
+    # WHEN collecting the calls for all samples
+    calls = alleles_called(vcf_samples, [0, 1, 2, 3], genotypes, 2)
+
+    # THEN samples should be collected for each allele with their allele count
+    assert calls == [
+        {"s0": {"allele_count": 1}, "s1": {"allele_count": 1}},
+        {"s1": {"allele_count": 1}, "s2": {"allele_count": 2}},
+    ]
+
+
 def test_bnd_mate_name():
     """Test the function that extract mate name from a variant ALT field"""
 
@@ -120,3 +162,24 @@ def test_extract_variants_no_vcf_file():
 
     results = extract_variants("wrong_VCF_path")
     assert results is None
+
+
+def test_count_variants_no_index():
+    """Test the function that reads the number of variants from a VCF index when VCF is not indexed"""
+
+    # GIVEN a VCF file with no index
+    # THEN the number of variants should not be available
+    assert count_variants(test_snv_vcf_path) is None
+
+
+def test_count_variants_tabix_index(tmp_path):
+    """Test the function that reads the number of variants from the tabix index of a VCF file"""
+
+    # GIVEN an indexed VCF file
+    vcf_path = str(tmp_path / "test_trio.vcf.gz")
+    shutil.copy(test_snv_vcf_path, vcf_path)
+    pysam.tabix_index(vcf_path, preset="vcf")
+
+    # THEN the number of variants should be read from the index
+    nr_variants = count_variants(vcf_path)
+    assert nr_variants == len(list(extract_variants(vcf_path, samples=["ADM1059A1"])))